@@ -1,32 +1,88 @@
-from inspect import iscoroutinefunction as is_coroutine
+from inspect import iscoroutinefunction as is_coroutine, isawaitable
+from collections import deque
+from contextlib import nullcontext
+from threading import Lock
 from typing import Optional
+from urllib.parse import quote
+from weakref import WeakKeyDictionary
 from abc import ABC
+import asyncio
 import logging
+import os
+import time
 
 from aleph_core.utils.local_storage import LocalStorage
-from aleph_core.utils.wait_one_step import WaitOneStep
+from aleph_core.utils.wait_one_step import WaitOneStep, spread_offset
 from aleph_core.utils.report_by_exception import ReportByException
+from aleph_core.utils.retention import Retention
+from aleph_core.utils.segment_log import SegmentLogBuffer
 from aleph_core.utils.store_and_forward import StoreAndForward
 from aleph_core.utils.async_helper import AsyncHelper
+from aleph_core.utils.circuit_breaker import CircuitBreaker
+from aleph_core.utils.scheduler import Scheduler
+from aleph_core.utils.write_queue import WriteQueue
 from aleph_core.utils.exceptions import Exceptions, Error
 from aleph_core.utils.data import RecordSet
 
 logger = logging.getLogger(__name__)
 
+DELAY_STEP = 0.1  # seconds between the checks of subscription_delay while waiting
+
 
 class Connection(ABC):
     time_step = 10
     local_storage = LocalStorage()
     async_helper = AsyncHelper()
     store_and_forward = False
+    store_and_forward_max_records: Optional[int] = None  # records per write when flushing
+    store_and_forward_max_bytes_per_second: Optional[float] = None  # flush rate limit
+    store_and_forward_max_concurrent_flushes = 1  # keys flushed at once
+    store_and_forward_retention: Optional[Retention] = None  # limits of the buffered data
+    store_and_forward_encoding = None  # encodes the buffered data, like CompactEncoding()
+    store_and_forward_directory: Optional[str] = None  # keeps the buffer in segment files
     report_by_exception = False
     multi_thread = False
+    circuit_breaker = False  # stops opening, reading and writing for a while after failures
+    trusted = False
+    trusted_keys: set[str] = set()
+    max_batch_records: Optional[int] = None  # coalesces write_async calls if set
+    max_latency_ms = 100
+    scheduler: Optional[Scheduler] = None  # runs the subscriptions if set
+    group_subscriptions = False  # reads the keys with the same time_step with read_many
+    max_concurrent_reads: Optional[int] = None  # limit of async reads running at once
+    aligned_subscriptions = False  # reads on the multiples of time_step of the clock
+    spread_subscriptions = False  # shifts each aligned key by a fixed part of time_step
 
     def __init__(self, client_id=""):
         self.client_id = client_id
         self.__subscribed_keys__ = set()
+        self.__scheduled_jobs__ = {}
+        self.__subscription_groups__ = {}  # map time_step: set of keys
+        self.__read_semaphores__ = WeakKeyDictionary()  # map event loop: semaphore
         self.__report_by_exception__ = ReportByException(self.local_storage)
-        self.__store_and_forward__ = StoreAndForward(self.write, self.local_storage)
+        self.__store_and_forward__ = StoreAndForward(
+            client_id,
+            self.write,
+            self.local_storage,
+            buffer=self.__store_and_forward_buffer(),
+            max_records_per_write=self.store_and_forward_max_records,
+            max_bytes_per_second=self.store_and_forward_max_bytes_per_second,
+            max_concurrent_flushes=self.store_and_forward_max_concurrent_flushes,
+            retention=self.store_and_forward_retention,
+            encoding=self.store_and_forward_encoding,
+        )
+        self.__write_queue__ = WriteQueue(self.max_batch_records or 1)
+        self.__write_batches__ = {}  # map key: batches of write_async waiting to be written
+        self.__write_lock__ = Lock()
+        self.__circuit_breaker__ = CircuitBreaker()
+
+    def __store_and_forward_buffer(self) -> Optional[SegmentLogBuffer]:
+        """Returns a segment log in a directory of the client if a directory is set"""
+        if self.store_and_forward_directory is None:
+            return None
+        name = quote(self.client_id or "default", safe="")
+        directory = os.path.join(self.store_and_forward_directory, name)
+        return SegmentLogBuffer(directory, encoding=self.store_and_forward_encoding)
 
     # ----------------------------------------------------------------------------------
     # Main methods
@@ -48,18 +104,81 @@ class Connection(ABC):
         """Write on the connection with the given key"""
         return
 
+    def read_many(self, keys: list[str], **kwargs) -> dict[str, Optional[RecordSet]]:
+        """
+        Read several keys at once. Can be overridden when the connection can read them
+        in a single request, by default it reads them one by one. The exception of a
+        key that fails is returned as its value, so the other keys are still read
+        """
+        results = {}
+        for key in keys:
+            try:
+                results[key] = self.read(key, **kwargs)
+            except Exception as e:
+                results[key] = e
+        return results
+
     def is_open(self) -> bool:
         """Returns True if the connection is open, False otherwise"""
         return True
 
+    def is_trusted(self, key: str) -> bool:
+        """
+        Returns True if the data read from the key comes from a known-good source, so
+        the records are adopted as they are, without validating or copying them
+        """
+        return self.trusted or key in self.trusted_keys
+
+    @property
+    def circuit_state(self) -> dict:
+        """Returns the state of the circuit breaker and its transition counters"""
+        return self.__circuit_breaker__.stats()
+
+    def __check_circuit(self):
+        """Raises CircuitOpen if the circuit breaker does not allow a new attempt"""
+        if self.circuit_breaker and not self.__circuit_breaker__.allow():
+            retry_in = self.__circuit_breaker__.retry_in()
+            raise Exceptions.CircuitOpen(f"Next attempt in {retry_in:.1f} seconds")
+
+    def __circuit_success(self):
+        if self.circuit_breaker:
+            self.__circuit_breaker__.record_success()
+
+    def __circuit_failure(self, e: Exception):
+        """
+        Counts the exception as a failure. Errors that do not come from the connection,
+        like an invalid key, leave the state of the circuit as it is
+        """
+        if not self.circuit_breaker or isinstance(e, Exceptions.CircuitOpen):
+            return
+        if isinstance(e, (Exceptions.InvalidKey, Exceptions.InvalidArgs)):
+            self.__circuit_breaker__.release()
+        else:
+            self.__circuit_breaker__.record_failure()
+
     def on_new_data(self, key: str, data: RecordSet):
-        """Callback function for when a new message arrives"""
+        """
+        Callback function for when a new message arrives. Subscriptions that run on an
+        event loop wait for its result if it is awaitable
+        """
+        return
+
+    def on_write_done(self, key: str, data: RecordSet):
+        """Callback function for when a write of write_async ends, written or not"""
         return
 
     def on_error(self, error: Error):
         """Callback function for when a safe function fails"""
         return
 
+    def subscription_delay(self, key: str) -> float:
+        """
+        Returns the seconds a subscription waits on top of its time step before the next
+        read, so the reads can be slowed down when their data cannot be handled in time.
+        It is checked again every DELAY_STEP seconds, so the wait ends once it is 0
+        """
+        return 0
+
     def on_connect(self):
         """Callback function for when the connection is open"""
         return
@@ -93,24 +212,26 @@ class Connection(ABC):
 
             if not current_state:
                 try:
+                    self.__check_circuit()
                     if is_coroutine(self.open):
                         await self.open()
                     else:
                         self.open()
                     current_state = True
+                    self.__circuit_success()
+
+                except Exceptions.CircuitOpen:
+                    current_state = False
 
                 except Exception as e:
                     current_state = False
+                    self.__circuit_failure(e)
                     self.on_error(Error(e, client_id=self.client_id))
 
             if current_state and not previous_state:
                 self.on_connect()
                 if self.store_and_forward:
-                    if is_coroutine(self.write):
-                        errors = await self.__store_and_forward__.flush_all_async()
-                    else:
-                        errors = self.__store_and_forward__.flush_all()
-
+                    errors = await self._flush_store_and_forward()
                     for error in errors:
                         error.args["client_id"] = self.client_id
                         self.on_error(error)
@@ -120,6 +241,16 @@ class Connection(ABC):
 
             previous_state = current_state
 
+    async def _flush_store_and_forward(self) -> list[Error]:
+        """
+        Flushes the store and forward buffer without blocking the loop while it waits for
+        the rate limit. A sync write of a multi_thread connection is flushed on a worker.
+        """
+        if self.multi_thread and not is_coroutine(self.write):
+            future = self.async_helper.run_on_thread(self.__store_and_forward__.flush_all)
+            return await asyncio.wrap_future(future)
+        return await self.__store_and_forward__.flush_all_async()
+
     def open_async(self, time_step=None):
         """
         Executes the open function without blocking the main thread
@@ -132,10 +263,48 @@ class Connection(ABC):
     # Read
     # ----------------------------------------------------------------------------------
 
+    def __wait_one_step(self, time_step, name: str) -> WaitOneStep:
+        spread_key = f"{self.client_id}/{name}" if self.spread_subscriptions else None
+        return WaitOneStep(time_step, self.aligned_subscriptions, spread_key)
+
+    def __schedule_offset(self, time_step, name: str) -> Optional[float]:
+        if not self.aligned_subscriptions or isinstance(time_step, str):
+            return None
+        if not self.spread_subscriptions:
+            return 0
+        return spread_offset(f"{self.client_id}/{name}", time_step)
+
+    @staticmethod
+    def __wait_delay(delay):
+        """Sleeps while the time waited is less than delay(), checking it every step"""
+        waited = 0
+        remaining = delay()
+        while remaining > 0:
+            step = min(remaining, DELAY_STEP)
+            time.sleep(step)
+            waited += step
+            remaining = delay() - waited
+
+    @staticmethod
+    async def _wait_delay_async(delay):
+        waited = 0
+        remaining = delay()
+        while remaining > 0:
+            step = min(remaining, DELAY_STEP)
+            await asyncio.sleep(step)
+            waited += step
+            remaining = delay() - waited
+
+    async def _on_new_data_async(self, key: str, data: RecordSet):
+        result = self.on_new_data(key, data)
+        if isawaitable(result):
+            await result
+
     def __subscribe_async(self, key, time_step):
-        wait_one_step = WaitOneStep(time_step)
+        wait_one_step = self.__wait_one_step(time_step, key)
         while True:
             wait_one_step.wait()
+            self.__wait_delay(lambda: self.subscription_delay(key))
             if key not in self.__subscribed_keys__:
                 break
             data = self.safe_read(key)
@@ -144,27 +313,102 @@ class Connection(ABC):
             self.on_new_data(key, data)
 
     async def _subscribe_async(self, key, time_step):
-        wait_one_step = WaitOneStep(time_step)
+        wait_one_step = self.__wait_one_step(time_step, key)
         while True:
             await wait_one_step.async_wait()
+            await self._wait_delay_async(lambda: self.subscription_delay(key))
             if key not in self.__subscribed_keys__:
                 break
 
-            data = await self._safe_read(key)
-            if data is None or len(data) == 0:
-                continue
-            self.on_new_data(key, data)
+            await self._read_key_async(key)
+
+    async def _read_key_async(self, key):
+        data = await self._safe_read(key)
+        if data is not None and len(data) > 0:
+            await self._on_new_data_async(key, data)
+
+    def __subscribe_group_async(self, time_step, group):
+        wait_one_step = self.__wait_one_step(time_step, str(time_step))
+        while True:
+            wait_one_step.wait()
+            self.__wait_delay(lambda: self.__group_delay(group))
+            if self.__subscription_groups__.get(time_step) is not group:
+                break
+            self.__on_new_data_many(self.safe_read_many(list(group)))
+
+    async def _subscribe_group_async(self, time_step, group):
+        wait_one_step = self.__wait_one_step(time_step, str(time_step))
+        while True:
+            await wait_one_step.async_wait()
+            await self._wait_delay_async(lambda: self.__group_delay(group))
+            if self.__subscription_groups__.get(time_step) is not group:
+                break
+
+            await self._read_group_async(group)
+
+    async def _read_group_async(self, group):
+        results = await self._safe_read_many(list(group))
+        for key, data in results.items():
+            if data is not None and len(data) > 0:
+                await self._on_new_data_async(key, data)
+
+    def __scheduled_read_group(self, group) -> float:
+        """
+        Reads a group subscribed on the scheduler, returns the subscription delay.
+        Coroutines run on the main loop, where the async clients and the read limit are.
+        """
+        if is_coroutine(self.safe_read_many):
+            self.async_helper.run_coroutine_threadsafe(self._read_group_async(group)).result()
+        else:
+            self.__on_new_data_many(self.safe_read_many(list(group)))
+        return self.__group_delay(group)
+
+    def __group_delay(self, group) -> float:
+        return max((self.subscription_delay(key) for key in list(group)), default=0)
+
+    def __on_new_data_many(self, results: dict[str, Optional[RecordSet]]):
+        for key, data in results.items():
+            if data is not None and len(data) > 0:
+                self.on_new_data(key, data)
+
+    def __subscribe_group(self, key, time_step):
+        """Adds the key to the group of its time_step, starting the group if it is new"""
+        group = self.__subscription_groups__.get(time_step)
+        if group is not None:
+            group.add(key)
+            return
+
+        group = self.__subscription_groups__[time_step] = {key}
+        if self.scheduler is not None:
+            offset = self.__schedule_offset(time_step, str(time_step))
+            job = self.scheduler.add(time_step, self.__scheduled_read_group, group, offset=offset)
+            self.__scheduled_jobs__[("group", time_step)] = job
+        elif self.multi_thread and not is_coroutine(self.safe_read_many):
+            self.async_helper.start_thread(self.__subscribe_group_async, time_step, group)
+        else:
+            coroutine = self._subscribe_group_async(time_step, group)
+            self.async_helper.run_coroutine_threadsafe(coroutine)
 
     def subscribe_async(self, key: str = "", time_step: int = None):
-        """Executes the safe_read function without blocking the main thread"""
+        """
+        Executes the safe_read function without blocking the main thread.
+        If group_subscriptions is True, the keys with the same time_step are read together
+        with safe_read_many.
+        """
         if key in self.__subscribed_keys__:
             return
 
         time_step = time_step or self.time_step
         self.__subscribed_keys__.add(key)
 
-        if self.multi_thread and not is_coroutine(self.safe_read):
-            self.async_helper.run_on_thread(self.__subscribe_async, key, time_step)
+        if self.group_subscriptions:
+            self.__subscribe_group(key, time_step)
+        elif self.scheduler is not None:
+            offset = self.__schedule_offset(time_step, key)
+            job = self.scheduler.add(time_step, self.__scheduled_read, key, offset=offset)
+            self.__scheduled_jobs__[key] = job
+        elif self.multi_thread and not is_coroutine(self.safe_read):
+            self.async_helper.start_thread(self.__subscribe_async, key, time_step)
         else:
             coroutine = self._subscribe_async(key, time_step)
             self.async_helper.run_coroutine_threadsafe(coroutine)
@@ -172,9 +416,31 @@ class Connection(ABC):
     def unsubscribe(self, key: str = ""):
         """Reverse the effect of subscribe_async"""
         self.__subscribed_keys__.discard(key)
+        job = self.__scheduled_jobs__.pop(key, None)
+        if job is not None:
+            self.scheduler.remove(job)
+
+        for time_step, group in list(self.__subscription_groups__.items()):
+            group.discard(key)
+            if len(group) == 0:
+                del self.__subscription_groups__[time_step]
+                job = self.__scheduled_jobs__.pop(("group", time_step), None)
+                if job is not None:
+                    self.scheduler.remove(job)
+
+    def __scheduled_read(self, key) -> float:
+        """Reads a key subscribed on the scheduler, like __scheduled_read_group"""
+        if is_coroutine(self.safe_read):
+            self.async_helper.run_coroutine_threadsafe(self._read_key_async(key)).result()
+        else:
+            data = self.safe_read(key)
+            if data is not None and len(data) > 0:
+                self.on_new_data(key, data)
+        return self.subscription_delay(key)
 
     async def _safe_read(self, key: str = "", **kwargs) -> Optional[RecordSet]:
         try:
+            self.__check_circuit()
             if not self.is_open():
                 if is_coroutine(self.open):
                     await self.open()
@@ -182,19 +448,22 @@ class Connection(ABC):
                     self.open()
 
             if is_coroutine(self.read):
-                data = await self.read(key, **kwargs)
+                async with self._read_limit():
+                    data = await self.read(key, **kwargs)
             else:
                 data = self.read(key, **kwargs)
+            self.__circuit_success()
 
             if data is None:
                 raise Exceptions.InvalidKey("Reading function returned None")
 
             if not isinstance(data, RecordSet):
-                data = RecordSet(data)
+                data = RecordSet.adopt(data) if self.is_trusted(key) else RecordSet(data)
 
             return data
 
         except Exception as e:
+            self.__circuit_failure(e)
             self.on_error(Error(e, client_id=self.client_id, key=key, args=kwargs))
             return None
 
@@ -205,16 +474,93 @@ class Connection(ABC):
         s called.
         """
         try:
+            self.__check_circuit()
             if not self.is_open():
                 self.open()
 
             data = self.read(key, **kwargs)
+            self.__circuit_success()
 
             if data is None:
                 raise Exceptions.InvalidKey("Reading function returned None")
 
             if not isinstance(data, RecordSet):
-                data = RecordSet(data)
+                data = RecordSet.adopt(data) if self.is_trusted(key) else RecordSet(data)
+
+            return data
+
+        except Exception as e:
+            self.__circuit_failure(e)
+            self.on_error(Error(e, client_id=self.client_id, key=key, args=kwargs))
+            return None
+
+    def _read_limit(self):
+        """
+        Returns the semaphore that limits the async reads to max_concurrent_reads, one
+        per event loop, or a context that does nothing if there is no limit
+        """
+        if not self.max_concurrent_reads:
+            return nullcontext()
+
+        loop = asyncio.get_running_loop()
+        semaphore = self.__read_semaphores__.get(loop)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.max_concurrent_reads)
+            self.__read_semaphores__[loop] = semaphore
+        return semaphore
+
+    async def _safe_read_many(self, keys: list[str], **kwargs) -> dict[str, Optional[RecordSet]]:
+        try:
+            self.__check_circuit()
+            if not self.is_open():
+                if is_coroutine(self.open):
+                    await self.open()
+                else:
+                    self.open()
+
+            if is_coroutine(self.read_many):
+                results = await self.read_many(keys, **kwargs)
+            else:
+                results = self.read_many(keys, **kwargs)
+            self.__circuit_success()
+
+        except Exception as e:
+            self.__circuit_failure(e)
+            self.on_error(Error(e, client_id=self.client_id, keys=keys, args=kwargs))
+            return {}
+
+        return {key: self.__to_record_set(key, results.get(key), kwargs) for key in keys}
+
+    def safe_read_many(self, keys: list[str], **kwargs) -> dict[str, Optional[RecordSet]]:
+        """
+        Tries to open the connection and read several keys with read_many.
+        Returns the data of each key, None for the keys that failed.
+        If an exception is raised, the on_error function is called.
+        """
+        try:
+            self.__check_circuit()
+            if not self.is_open():
+                self.open()
+
+            results = self.read_many(keys, **kwargs)
+            self.__circuit_success()
+
+        except Exception as e:
+            self.__circuit_failure(e)
+            self.on_error(Error(e, client_id=self.client_id, keys=keys, args=kwargs))
+            return {}
+
+        return {key: self.__to_record_set(key, results.get(key), kwargs) for key in keys}
+
+    def __to_record_set(self, key, data, kwargs) -> Optional[RecordSet]:
+        try:
+            if isinstance(data, Exception):
+                raise data
+            if data is None:
+                raise Exceptions.InvalidKey("Reading function returned None")
+
+            if not isinstance(data, RecordSet):
+                data = RecordSet.adopt(data) if self.is_trusted(key) else RecordSet(data)
 
             return data
 
@@ -226,20 +572,35 @@ class Connection(ABC):
     # Write
     # ----------------------------------------------------------------------------------
 
-    async def _safe_write(self, key: str = "", data: RecordSet = None):
+    def __prepare_write(self, key: str, data) -> Optional[RecordSet]:
+        """
+        Returns the data that safe_write should write, after report by exception, or
+        None if there is nothing to write
+        """
         try:
             if data is None:
-                return
+                return None
             if not isinstance(data, RecordSet):
                 data = RecordSet(data)
             if self.report_by_exception:
                 data = self.__report_by_exception__.next(key, data)
             if len(data) == 0:
-                return
+                return None
         except Exception as e:
             self.on_error(Error(e, client_id=self.client_id, key=key, data=data))
+        return data
+
+    def __write_failed(self, key: str, data, e: Exception):
+        self.__circuit_failure(e)
+        self.on_error(Error(e, client_id=self.client_id, key=key, data=data))
+
+    async def _safe_write(self, key: str = "", data: RecordSet = None):
+        data = self.__prepare_write(key, data)
+        if data is None:
+            return
 
         try:
+            self.__check_write_circuit(key, data)
             if not self.is_open():
                 if is_coroutine(self.open):
                     await self.open()
@@ -247,22 +608,133 @@ class Connection(ABC):
                     self.open()
 
             if self.store_and_forward:
-                if is_coroutine(self.write):
-                    await self.__store_and_forward__.add_and_flush_async(key, data)
-                else:
-                    self.__store_and_forward__.add_and_flush(key, data)
-
+                await self.__store_and_forward__.add_and_flush_async(key, data)
+            elif is_coroutine(self.write):
+                await self.write(key, data)
             else:
                 self.write(key, data)
+            self.__circuit_success()
         except Exception as e:
-            self.on_error(Error(e, client_id=self.client_id, key=key, data=data))
+            self.__write_failed(key, data, e)
+
+    def __check_write_circuit(self, key: str, data: RecordSet):
+        """
+        Like __check_circuit, but the data is kept in the store and forward buffer (if
+        enabled) when the circuit is open, to be written when it closes
+        """
+        try:
+            self.__check_circuit()
+        except Exceptions.CircuitOpen:
+            if self.store_and_forward:
+                self.__store_and_forward__.add(key, data)
+            raise
+
+    def __write_async(self, key: str, data: Optional[RecordSet]):
+        """
+        Queues the data to be written after the previous batches of the key, so the
+        batches of a key are written in order even if several threads write
+        """
+        if data is None:
+            return
+        with self.__write_lock__:
+            batches = self.__write_batches__.get(key)
+            if batches is not None:
+                batches.append(data)
+                return
+            self.__write_batches__[key] = deque([data])
 
-    def write_async(self, key: str = "", data: Optional[RecordSet] = None):
-        """Executes the safe_write function without blocking the main thread"""
         if self.multi_thread and not is_coroutine(self.safe_write):
-            self.async_helper.run_on_thread(self.safe_write, key, data)
+            try:
+                future = self.async_helper.run_on_thread(self.__drain_writes, key)
+            except Exception:
+                self.__drop_writes(key)
+                raise
+            future.add_done_callback(lambda f: f.cancelled() and self.__drop_writes(key))
         else:
-            self.async_helper.run_coroutine_threadsafe(self._safe_write(key, data))
+            self.async_helper.run_coroutine_threadsafe(self._drain_writes(key))
+
+    def __next_write(self, key: str, done: bool = False) -> Optional[RecordSet]:
+        """Returns the next batch of the key, after removing the one written if done"""
+        with self.__write_lock__:
+            batches = self.__write_batches__[key]
+            if done:
+                batches.popleft()
+            if batches:
+                return batches[0]
+            del self.__write_batches__[key]
+            return None
+
+    def __drop_writes(self, key: str):
+        with self.__write_lock__:
+            batches = self.__write_batches__.pop(key, ())
+        for data in batches:
+            self.on_write_done(key, data)
+
+    def __drain_writes(self, key: str):
+        data = self.__next_write(key)
+        while data is not None:
+            try:
+                self.safe_write(key, data)
+            except Exception as e:
+                self.on_error(Error(e, client_id=self.client_id, key=key, data=data))
+            self.on_write_done(key, data)
+            data = self.__next_write(key, done=True)
+
+    async def _drain_writes(self, key: str):
+        data = self.__next_write(key)
+        while data is not None:
+            try:
+                await self._safe_write(key, data)
+            except Exception as e:
+                self.on_error(Error(e, client_id=self.client_id, key=key, data=data))
+            self.on_write_done(key, data)
+            data = self.__next_write(key, done=True)
+
+    def __batch(self, key: str, records: list) -> RecordSet:
+        return RecordSet(records, model=self.__write_queue__.model(key))
+
+    async def _flush_write_queue_later(self, key: str, batch_id: int):
+        await asyncio.sleep(self.max_latency_ms / 1000)
+        records = self.__write_queue__.take(key, batch_id)
+        if records:
+            self.__write_async(key, self.__batch(key, records))
+
+    def write_async(self, key: str = "", data: Optional[RecordSet] = None):
+        """
+        Executes the safe_write function without blocking the main thread.
+        If max_batch_records is set, the records of each key are queued and written
+        together once there are max_batch_records of them or max_latency_ms have passed.
+        The writes of each key are made one at a time, in the order of the calls.
+        """
+        if not self.max_batch_records or data is None:
+            self.__write_async(key, data)
+            return
+
+        records = [data] if isinstance(data, dict) else list(data)
+        model = getattr(data, "model", None)
+        batches, batch_id = self.__write_queue__.add(key, records, model)
+        for batch in batches:
+            self.__write_async(key, self.__batch(key, batch))
+        if batch_id is not None:
+            coroutine = self._flush_write_queue_later(key, batch_id)
+            self.async_helper.run_coroutine_threadsafe(coroutine)
+
+    def store(self, key: str = "", data: Optional[RecordSet] = None):
+        """
+        Keeps the data in the store and forward buffer without writing it, so it is
+        written the next time the buffer is flushed
+        """
+        if not self.store_and_forward:
+            raise Exceptions.InvalidArgs("store needs store_and_forward to be enabled")
+        if data is not None and len(data) > 0:
+            self.__store_and_forward__.add(key, data)
+
+    def flush_write_queue(self):
+        """Writes the records queued by write_async without waiting for max_latency_ms"""
+        for key in self.__write_queue__.keys():
+            records = self.__write_queue__.take(key)
+            if records:
+                self.__write_async(key, self.__batch(key, records))
 
     def safe_write(self, key: str = "", data: Optional[RecordSet] = None):
         """
@@ -271,7 +743,26 @@ class Connection(ABC):
         If store_and_forward is enabled, the buffer will be flushed on success.
         If an exception is raised, the on_error function is called.
         """
-        self.async_helper.run(self._safe_write(key, data))
+        if is_coroutine(self.open) or is_coroutine(self.write):
+            self.async_helper.run(self._safe_write(key, data))
+            return
+
+        data = self.__prepare_write(key, data)
+        if data is None:
+            return
+
+        try:
+            self.__check_write_circuit(key, data)
+            if not self.is_open():
+                self.open()
+
+            if self.store_and_forward:
+                self.__store_and_forward__.add_and_flush(key, data)
+            else:
+                self.write(key, data)
+            self.__circuit_success()
+        except Exception as e:
+            self.__write_failed(key, data, e)
 
 
 class AsyncConnection(Connection):
@@ -286,11 +777,24 @@ class AsyncConnection(Connection):
     async def read(self, key: str = "", **kwargs) -> Optional[RecordSet]:
         return super().read(key, **kwargs)
 
+    async def read_many(self, keys: list[str], **kwargs) -> dict[str, Optional[RecordSet]]:
+        """Reads the keys concurrently, up to max_concurrent_reads at once"""
+
+        async def read(key):
+            async with self._read_limit():
+                return await self.read(key, **kwargs)
+
+        results = await asyncio.gather(*[read(key) for key in keys], return_exceptions=True)
+        return dict(zip(keys, results))
+
     async def write(self, key: str = "", data: Optional[RecordSet] = None):
         return super().write(key, data)
 
     async def safe_read(self, key: str = "", **kwargs) -> Optional[RecordSet]:
         return await self._safe_read(key, **kwargs)
 
+    async def safe_read_many(self, keys: list[str], **kwargs) -> dict[str, Optional[RecordSet]]:
+        return await self._safe_read_many(keys, **kwargs)
+
     async def safe_write(self, key: str = "", data: Optional[RecordSet] = None):
         return await self._safe_write(key, data)
@@ -6,6 +6,7 @@ from sqlalchemy.orm import sessionmaker, scoped_session, query
 from typing import Optional
 
 from aleph_core.connections.connection import Connection
+from aleph_core.models.registry import model_info
 from aleph_core.utils.exceptions import Exceptions
 from aleph_core.utils.data import TableModel
 from aleph_core.utils.data import Model
@@ -14,6 +15,7 @@ from aleph_core.utils.data import Model
 class RDSConnection(Connection):
     url: str
     models: dict[str, Model]
+    trusted = True  # records are read from tables built from the models
 
     def __init__(self, client_id=""):
         super().__init__(client_id)
@@ -88,11 +90,9 @@ class RDSConnection(Connection):
             if limit:
                 statement = statement.limit(limit)
 
-            records = statement.all()
-            for record in records:
-                record = record.dict()
-                record.pop("deleted_", None)
-                result.append(record)
+            fields = model_info(self.models[key]).fields
+            for record in statement.all():
+                result.append({field: getattr(record, field) for field in fields})
 
         return result
 
@@ -0,0 +1,172 @@
+import numpy as np
+
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from aleph.models.storage import PRESENT
+from aleph.utils.exceptions import Exceptions
+from aleph.utils.typing import Record, Value
+
+AGGREGATIONS = ("mean", "sum", "min", "max", "count", "first", "last")
+
+
+def to_float_array(field: str, values: Sequence[Value], mask: Sequence[int]) -> np.ndarray:
+    """
+    Returns the values of a field as a float64 array, with NaN where the value is missing
+    """
+    present = np.frombuffer(mask, dtype=np.uint8) == PRESENT
+    try:
+        if isinstance(values, memoryview):
+            array = np.asarray(values, dtype=np.float64)
+        else:
+            array = np.array([v if p else np.nan for v, p in zip(values, present)], np.float64)
+    except (TypeError, ValueError):
+        raise Exceptions.InvalidArgs(f"Field '{field}' is not numeric")
+    return np.where(present, array, np.nan)
+
+
+def group_codes(storage, by: Optional[str]) -> Tuple[np.ndarray, List[Value]]:
+    """
+    Returns the group of every record as an integer code, and the value of every code
+    """
+    if by is None:
+        return np.zeros(len(storage), dtype=np.int64), [None]
+    if by == "id_":
+        codes, values = storage.encoded_ids()
+        return np.asarray(codes, dtype=np.int64), values
+
+    codes, values = {}, []
+    column, _ = storage.column(by)
+    for value in column:
+        if value not in codes:
+            codes[value] = len(values)
+            values.append(value)
+    return np.array([codes[v] for v in column], dtype=np.int64), values
+
+
+def check_aggregations(aggregations: Dict[str, str], by: Optional[str]):
+    for field, aggregation in aggregations.items():
+        if field in ("t", "id_", by):
+            raise Exceptions.InvalidArgs(f"Cannot aggregate field '{field}'")
+        if aggregation not in AGGREGATIONS:
+            raise Exceptions.InvalidArgs(f"Unknown aggregation '{aggregation}'")
+
+
+def reduce(values: np.ndarray, starts: np.ndarray, stops: np.ndarray, aggregation: str):
+    """
+    Aggregates values[starts[i]:stops[i]] for every i, ignoring NaN values. Windows are
+    never empty, windows without values give NaN (0 for count).
+    """
+    # Interleaving starts and stops makes every even reduceat segment one of the windows
+    indices = np.empty(2 * len(starts), dtype=np.int64)
+    indices[0::2] = starts
+    indices[1::2] = stops
+
+    def reduceat(ufunc, array):
+        return ufunc.reduceat(np.append(array, array[:1]), indices)[0::2]
+
+    present = ~np.isnan(values)
+    count = reduceat(np.add, present.astype(np.int64))
+    if aggregation == "count":
+        return count
+
+    if aggregation in ("sum", "mean"):
+        result = reduceat(np.add, np.where(present, values, 0.0))
+        if aggregation == "mean":
+            result = result / np.maximum(count, 1)
+    elif aggregation == "min":
+        result = reduceat(np.minimum, np.where(present, values, np.inf))
+    elif aggregation == "max":
+        result = reduceat(np.maximum, np.where(present, values, -np.inf))
+    else:
+        positions = np.arange(len(values))
+        if aggregation == "first":
+            index = reduceat(np.minimum, np.where(present, positions, len(values)))
+        else:
+            index = reduceat(np.maximum, np.where(present, positions, -1))
+        result = values[np.clip(index, 0, len(values) - 1)]
+
+    return np.where(count > 0, result, np.nan)
+
+
+def to_value(value) -> Value:
+    if isinstance(value, np.integer):
+        return int(value)
+    return None if np.isnan(value) else float(value)
+
+
+def resample(
+    storage, bucket_ms: int, aggregations: Dict[str, str], by: Optional[str]
+) -> List[Record]:
+    """
+    Aggregates the records of every group in buckets of bucket_ms milliseconds
+    """
+    check_aggregations(aggregations, by)
+    if len(storage) == 0:
+        return []
+
+    t = np.asarray(storage.column("t")[0], dtype=np.int64)
+    buckets = t // bucket_ms * bucket_ms
+    codes, groups = group_codes(storage, by)
+
+    order = np.lexsort((buckets, codes))
+    codes, buckets = codes[order], buckets[order]
+    changes = (codes[1:] != codes[:-1]) | (buckets[1:] != buckets[:-1])
+    starts = np.flatnonzero(np.concatenate(([True], changes)))
+    stops = np.append(starts[1:], len(t))
+
+    results = {}
+    for field, aggregation in aggregations.items():
+        values = to_float_array(field, *storage.column(field))[order]
+        results[field] = reduce(values, starts, stops, aggregation)
+
+    records = []
+    for i, start in enumerate(starts):
+        group = groups[codes[start]]
+        record = {"id_": group, "t": int(buckets[start])}
+        if by is not None:
+            record[by] = group
+        for field in aggregations:
+            record[field] = to_value(results[field][i])
+        records.append(record)
+    return records
+
+
+def rolling(
+    storage, window_ms: int, aggregations: Dict[str, str], by: Optional[str]
+) -> List[Record]:
+    """
+    Aggregates, for every record, the records of its group within the last window_ms
+    milliseconds (t - window_ms < t' <= t)
+    """
+    check_aggregations(aggregations, by)
+    if len(storage) == 0:
+        return []
+
+    t = np.asarray(storage.column("t")[0], dtype=np.int64)
+    codes, groups = group_codes(storage, by)
+    order = np.argsort(codes, kind="stable")
+    codes, t = codes[order], t[order]
+
+    starts = np.empty(len(t), dtype=np.int64)
+    group_starts = np.flatnonzero(np.concatenate(([True], codes[1:] != codes[:-1])))
+    for group_start, group_stop in zip(group_starts, np.append(group_starts[1:], len(t))):
+        group_t = t[group_start:group_stop]
+        window_starts = np.searchsorted(group_t, group_t - window_ms, side="right")
+        starts[group_start:group_stop] = group_start + window_starts
+    stops = np.arange(1, len(t) + 1)
+
+    results = {}
+    for field, aggregation in aggregations.items():
+        values = to_float_array(field, *storage.column(field))[order]
+        results[field] = reduce(values, starts, stops, aggregation)
+
+    ids, _ = storage.column("id_")
+    records = []
+    for i, index in enumerate(order):
+        record = {"id_": ids[index], "t": int(t[i])}
+        if by is not None and by != "id_":
+            record[by] = groups[codes[i]]
+        for field in aggregations:
+            record[field] = to_value(results[field][i])
+        records.append(record)
+    return records
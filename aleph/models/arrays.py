@@ -0,0 +1,153 @@
+import numpy as np
+
+from typing import Dict, List, Optional, Sequence, Type
+
+from aleph.models.model import Model
+from aleph.models.registry import model_info
+from aleph.models.storage import Column, ColumnarStorage, NULL, PLACEHOLDERS, PRESENT
+from aleph.utils.typing import Value
+
+NUMPY_DTYPES = {"b": np.bool_, "q": np.int64, "d": np.float64}
+
+
+def field_typecode(
+    model: Optional[Type[Model]], field: str, values: Sequence[Value], mask: Sequence[int]
+) -> Optional[str]:
+    """
+    Returns the typecode of a field: from the model if it has the field, from the typed
+    column if there is one, or from the present values
+    """
+    typecodes = model_info(model).typecodes if model is not None else {}
+    if field in typecodes:
+        return typecodes[field]
+    if isinstance(values, memoryview):
+        return values.format
+
+    types = {type(v) for v, m in zip(values, mask) if m == PRESENT}
+    if types == {bool}:
+        return "b"
+    if types == {int}:
+        return "q"
+    if types and types <= {int, float}:
+        return "d"
+    return None
+
+
+def to_array(values: Sequence[Value], mask: Sequence[int], typecode: Optional[str]) -> np.ndarray:
+    """
+    Returns the values as a numpy array. Typed columns of the same type are not copied.
+    """
+    if isinstance(values, memoryview) and values.format == typecode:
+        return np.asarray(values).view(NUMPY_DTYPES[typecode])
+
+    if typecode is None:
+        array = np.empty(len(values), dtype=object)
+        array[:] = list(values)
+        return array
+
+    placeholder = PLACEHOLDERS[typecode]
+    values = [v if m == PRESENT else placeholder for v, m in zip(values, mask)]
+    return np.array(values, dtype=NUMPY_DTYPES[typecode])
+
+
+def to_numpy(storage, model: Optional[Type[Model]]) -> Dict[str, np.ndarray]:
+    """
+    Returns t and id_ as arrays and every other field as a masked array, where missing
+    and None values are masked
+    """
+    codes, id_values = storage.encoded_ids()
+    ids = np.empty(len(id_values), dtype=object)
+    ids[:] = id_values
+
+    arrays = {
+        "t": np.asarray(storage.column("t")[0], dtype=np.int64),
+        "id_": ids[np.asarray(codes, dtype=np.int64)],
+    }
+    for field in storage.fields():
+        values, mask = storage.column(field)
+        data = to_array(values, mask, field_typecode(model, field, values, mask))
+        present = np.frombuffer(mask, dtype=np.uint8) == PRESENT
+        arrays[field] = np.ma.MaskedArray(data, mask=~present)
+    return arrays
+
+
+def to_arrow(storage, model: Optional[Type[Model]]):
+    """
+    Returns the records as a pyarrow Table. id_ is a dictionary array and the int and
+    float columns share their buffers with the storage. Missing values become nulls.
+    """
+    import pyarrow as pa
+
+    codes, id_values = storage.encoded_ids()
+    columns = {
+        "t": pa.array(np.asarray(storage.column("t")[0], dtype=np.int64)),
+        "id_": pa.DictionaryArray.from_arrays(
+            pa.array(np.asarray(codes, dtype=np.int64)), pa.array(id_values)
+        ),
+    }
+
+    for field in storage.fields():
+        values, mask = storage.column(field)
+        typecode = field_typecode(model, field, values, mask)
+        present = np.frombuffer(mask, dtype=np.uint8) == PRESENT
+        data = to_array(values, mask, typecode)
+
+        if typecode in ("q", "d"):
+            validity = pa.py_buffer(np.packbits(present, bitorder="little"))
+            arrow_type = pa.int64() if typecode == "q" else pa.float64()
+            columns[field] = pa.Array.from_buffers(
+                arrow_type, len(data), [validity, pa.py_buffer(data)]
+            )
+        else:
+            columns[field] = pa.array(data, mask=~present)
+
+    return pa.table(columns)
+
+
+def from_arrow(table, model: Optional[Type[Model]]) -> ColumnarStorage:
+    """
+    Creates a columnar storage from a pyarrow Table, copying each column buffer once and
+    without building records
+    """
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    t = np.ascontiguousarray(table.column("t").combine_chunks().to_numpy(), dtype=np.int64)
+    if np.any(t[1:] < t[:-1]):
+        order = np.argsort(t, kind="stable")
+        table, t = table.take(order), t[order]
+    id_ = pc.dictionary_encode(table.column("id_")).combine_chunks()
+    ids = id_.indices.to_numpy(zero_copy_only=False).astype(np.int64)
+    id_values: List[Value] = id_.dictionary.to_pylist()
+    if id_.null_count:
+        ids[~np.asarray(id_.is_valid())] = len(id_values)
+        id_values.append(None)
+
+    typecodes = model_info(model).typecodes if model is not None else {}
+    columns = {}
+    for field in table.column_names:
+        if field in ("t", "id_"):
+            continue
+        column = table.column(field).combine_chunks()
+        mask = np.where(np.asarray(column.is_valid()), PRESENT, NULL).astype(np.uint8)
+
+        if field in typecodes:
+            typecode = typecodes[field]
+        elif pa.types.is_boolean(column.type):
+            typecode = "b"
+        elif pa.types.is_integer(column.type):
+            typecode = "q"
+        elif pa.types.is_floating(column.type):
+            typecode = "d"
+        else:
+            typecode = None
+
+        if typecode is None:
+            columns[field] = Column.from_buffers(None, column.to_pylist(), mask)
+        else:
+            column = column.cast(pa.from_numpy_dtype(NUMPY_DTYPES[typecode]))
+            values = column.fill_null(PLACEHOLDERS[typecode]).to_numpy(zero_copy_only=False)
+            values = np.ascontiguousarray(values, dtype=NUMPY_DTYPES[typecode])
+            columns[field] = Column.from_buffers(typecode, values, mask)
+
+    return ColumnarStorage.from_columns(t, ids, id_values, columns, model)
@@ -0,0 +1,123 @@
+from collections.abc import Mapping
+from typing import Any, Dict, Iterator, Optional, Type
+
+from pydantic import BaseModel
+
+from aleph.models.registry import model_info
+from aleph.utils.exceptions import Exceptions
+from aleph.utils.typing import Record, Value
+
+MISSING = object()
+
+
+class CompactRecord(Mapping):
+    """
+    Base class of the compact records of a model. The fields of the model are stored in
+    slots, so a record takes a fraction of the memory of a dict or a model instance. It
+    can be read as a dict (record["field"]) or as an object (record.field), and missing
+    fields are not set, like missing keys of a dict.
+    """
+
+    __slots__ = ("__extra__",)
+    __model__: Type[BaseModel]
+    __names__: tuple[str, ...] = ()
+
+    def __init__(self, record: Optional[Record] = None, **fields: Value):
+        self.__extra__: Optional[Dict[str, Value]] = None
+        for source in (record or {}, fields):
+            for key, value in source.items():
+                self[key] = value
+
+    def __getitem__(self, key: str) -> Value:
+        if key in self.__names__:
+            value = getattr(self, key, MISSING)
+            if value is not MISSING:
+                return value
+        elif self.__extra__ is not None and key in self.__extra__:
+            return self.__extra__[key]
+        raise KeyError(key)
+
+    def __setitem__(self, key: str, value: Value):
+        if key in self.__names__:
+            setattr(self, key, value)
+        elif self.__extra__ is None:
+            self.__extra__ = {key: value}
+        else:
+            self.__extra__[key] = value
+
+    def __delitem__(self, key: str):
+        if key in self.__names__ and hasattr(self, key):
+            delattr(self, key)
+        elif self.__extra__ is not None and key in self.__extra__:
+            del self.__extra__[key]
+        else:
+            raise KeyError(key)
+
+    def __iter__(self) -> Iterator[str]:
+        for name in self.__names__:
+            if getattr(self, name, MISSING) is not MISSING:
+                yield name
+        if self.__extra__ is not None:
+            yield from self.__extra__
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def __contains__(self, key: Any) -> bool:
+        if key in self.__names__:
+            return getattr(self, key, MISSING) is not MISSING
+        return self.__extra__ is not None and key in self.__extra__
+
+    def get(self, key: str, default: Value = None) -> Value:
+        if key in self.__names__:
+            value = getattr(self, key, MISSING)
+            return default if value is MISSING else value
+        if self.__extra__ is not None:
+            return self.__extra__.get(key, default)
+        return default
+
+    def dict(self) -> Record:
+        """Returns the record as a new dict"""
+        record = {}
+        for name in self.__names__:
+            value = getattr(self, name, MISSING)
+            if value is not MISSING:
+                record[name] = value
+        if self.__extra__ is not None:
+            record.update(self.__extra__)
+        return record
+
+    def __reduce__(self):
+        return compact_record, (self.__model__, self.dict())
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({self.dict()})"
+
+
+def compact_class(model: Type[BaseModel]) -> Type[CompactRecord]:
+    """
+    Returns the compact record class of a model, creating it the first time. It is kept
+    on the model class, since it holds a reference to the model.
+    """
+    record_class = model.__dict__.get("__compact_record__")
+    if record_class is None:
+        names = model_info(model).fields
+        shadowed = [name for name in names if hasattr(CompactRecord, name)]
+        if shadowed:
+            raise Exceptions.InvalidArgs(
+                f"Fields {shadowed} of {model.__name__} cannot be stored in compact records"
+            )
+        record_class = type(
+            f"{model.__name__}Record",
+            (CompactRecord,),
+            {"__slots__": names, "__model__": model, "__names__": names},
+        )
+        setattr(model, "__compact_record__", record_class)
+    return record_class
+
+
+def compact_record(model: Type[BaseModel], record: Record) -> CompactRecord:
+    """
+    Returns the record as a compact record of the model
+    """
+    return compact_class(model)(record)
@@ -1,8 +1,17 @@
-from typing import Optional, Type
-from pydantic import BaseModel, Field
+from typing import Any, Dict, List, Optional, Type
+from pydantic import BaseModel, Extra, Field, ValidationError
+from pydantic.error_wrappers import ErrorWrapper
+from pydantic.errors import ExtraError, MissingError
+from pydantic.utils import ROOT_KEY
 from uuid import uuid4
 from time import time
 
+from aleph.models.compact import CompactRecord, compact_class
+from aleph.models.registry import forget_model, model_info
+
+SCALAR_TYPES = {int, float, str, bool, type(None)}
+MISSING = object()
+
 
 def generate_id() -> str:
     """
@@ -22,18 +31,119 @@ class Model(BaseModel):
     id_: Optional[str] = Field(default_factory=generate_id)
     t: Optional[int] = Field(default_factory=current_timestamp)
 
-    __optional__: Optional[Type[BaseModel]] = None
-
     class Config:
         use_enum_values = True
 
+    @classmethod
+    def update_forward_refs(cls, **localns: Any):
+        super().update_forward_refs(**localns)
+        forget_model(cls)
+
     @classmethod
     def to_all_optionals_model(cls) -> Type[BaseModel]:
         """
-        Creates a new model with the same fields, but all fields are optional.
+        Returns a model with the same fields, but all fields are optional.
+        """
+        return model_info(cls).optional
+
+    @classmethod
+    def compact_class(cls) -> Type[CompactRecord]:
+        """
+        Returns a class that stores the fields of the model in slots, with attribute access
+        and a cheap dict(). Used by RecordSet(model, compact=True).
+        """
+        return compact_class(cls)
+
+    @classmethod
+    def validate_many(cls, records: List[Dict[str, Any]], partial: bool = False) -> List[dict]:
         """
-        if cls.__optional__ is None:
-            cls.__optional__ = type(f"{cls.__name__}Optional", (cls,), {})
-            for field in cls.__optional__.__fields__:
-                cls.__optional__.__fields__[field].required = False
-        return cls.__optional__
+        Validates a batch of records field by field and returns them as dicts, the same
+        as cls(**record).dict() would, without creating a model instance per record.
+        If partial is True, missing fields are not required, like in
+        to_all_optionals_model(). Raises a ValidationError with the errors of every record.
+        """
+        info = model_info(cls)
+        config = cls.__config__
+        inputs = list(records)
+        values = [{} for _ in inputs]
+        errors = [[] for _ in inputs]
+        valid = [True] * len(inputs)
+
+        for validator in cls.__pre_root_validators__:
+            for i, record in enumerate(inputs):
+                if not valid[i]:
+                    continue
+                try:
+                    inputs[i] = validator(cls, record)
+                except (ValueError, TypeError, AssertionError) as e:
+                    errors[i].append(ErrorWrapper(e, loc=ROOT_KEY))
+                    valid[i] = False
+
+        for name, field, type_ in info.coercers:
+            required = field.required and not partial
+            validate_default = config.validate_all or field.validate_always
+            by_name = config.allow_population_by_field_name and field.alt_alias
+
+            for i, record in enumerate(inputs):
+                if not valid[i]:
+                    continue
+                value = record.get(field.alias, MISSING)
+                if value is MISSING and by_name:
+                    value = record.get(name, MISSING)
+
+                if value is MISSING:
+                    if required:
+                        errors[i].append(ErrorWrapper(MissingError(), loc=field.alias))
+                        continue
+                    value = field.get_default()
+                    if not validate_default:
+                        values[i][name] = value
+                        continue
+                elif type(value) is type_:
+                    values[i][name] = value
+                    continue
+
+                value, error = field.validate(value, values[i], loc=field.alias, cls=cls)
+                if isinstance(error, ErrorWrapper):
+                    errors[i].append(error)
+                elif isinstance(error, list):
+                    errors[i].extend(error)
+                else:
+                    values[i][name] = value
+
+        if config.extra is not Extra.ignore:
+            names = set(info.aliases)
+            if config.allow_population_by_field_name:
+                names.update(cls.__fields__)
+            for i, record in enumerate(inputs):
+                if not valid[i]:
+                    continue
+                for key in sorted(record.keys() - names):
+                    if config.extra is Extra.allow:
+                        values[i][key] = record[key]
+                    else:
+                        errors[i].append(ErrorWrapper(ExtraError(), loc=key))
+
+        for skip_on_failure, validator in cls.__post_root_validators__:
+            for i in range(len(inputs)):
+                if not valid[i] or (skip_on_failure and errors[i]):
+                    continue
+                try:
+                    values[i] = validator(cls, values[i])
+                except (ValueError, TypeError, AssertionError) as e:
+                    errors[i].append(ErrorWrapper(e, loc=ROOT_KEY))
+
+        row_errors = [
+            ErrorWrapper(ValidationError(e, cls), loc=i) for i, e in enumerate(errors) if e
+        ]
+        if row_errors:
+            raise ValidationError(row_errors, cls)
+
+        for record in values:
+            for name, value in record.items():
+                if type(value) not in SCALAR_TYPES:
+                    record[name] = cls._get_value(
+                        value, True, False, None, None, False, False, False
+                    )
+        return values
+
@@ -1,5 +1,9 @@
-from typing import List, Optional, Type
+from typing import Dict, Iterable, Iterator, List, Optional, Type
+from pydantic import BaseModel
+from aleph.models.compact import compact_class
 from aleph.models.model import Model
+from aleph.models.storage import ColumnarStorage, RowStorage, StorageView
+from aleph.utils.exceptions import Exceptions
 from aleph.utils.time import current_timestamp
 
 Value = str | float | int | bool | None
@@ -7,64 +11,395 @@ Record = dict[str, Value]
 
 
 class RecordSet:
-    def __init__(self, model: Optional[Type[Model]] = None):
+    def __init__(
+        self, model: Optional[Type[Model]] = None, columnar: bool = False, compact: bool = False
+    ):
+        """
+        If columnar is True, the records are stored column by column instead of as a list
+        of dicts, which takes a fraction of the memory for large sets. Records are then
+        rebuilt as new dicts on access, so modifying them does not modify the set.
+        If compact is True, the records are stored as compact records of the model, which
+        are read like dicts but take less memory.
+        """
+        if compact and (model is None or columnar):
+            raise Exceptions.InvalidArgs("Compact record sets need a model and no columnar")
         self.model = model
-        self.records: List[Record] = []
+        self.columnar = columnar
+        self.compact = compact
+        self._record_class = compact_class(model) if compact else None
+        self._storage = self._new_storage()
+        self._keys: Optional[set[tuple[int, Value]]] = set()  # None until it is needed
+        self._projection: dict[Value, Record] = {}
+        self._projection_t: dict[Value, int] = {}
+        self._stale_ids: Optional[set[Value]] = set()  # None means every id_
+
+    def _new_storage(self, records: Iterable[Record] = ()) -> RowStorage | ColumnarStorage:
+        if self.columnar:
+            return ColumnarStorage(records, self.model)
+        if self.compact:
+            return RowStorage(self._compact(record) for record in records)
+        return RowStorage(records)
+
+    def _compact(self, record: Record) -> Record:
+        if self._record_class is None or isinstance(record, self._record_class):
+            return record
+        return self._record_class(record)
+
+    @classmethod
+    def adopt(
+        cls,
+        records: Record | List[Record],
+        model: Optional[Type[Model]] = None,
+        columnar: bool = False,
+        compact: bool = False,
+    ) -> "RecordSet":
+        """
+        Creates a record set from the records of a trusted source, without validating or
+        copying them. The list is sorted and missing t and id_ are set in place, so it
+        should not be used by the caller afterwards.
+        """
+        if not isinstance(records, list):
+            records = [records] if isinstance(records, (dict, BaseModel)) else list(records)
+
+        now = current_timestamp()
+        for i, record in enumerate(records):
+            if isinstance(record, BaseModel):
+                records[i] = record = record.dict()
+            if record.get("t") is None:
+                record["t"] = now
+            if "id_" not in record:
+                record["id_"] = None
+        records.sort(key=lambda r: r["t"])
 
-    def project(self) -> List[Record]:
+        record_set = RecordSet(model, columnar, compact)
+        record_set.records = records
+        return record_set
+
+    @property
+    def records(self) -> List[Record]:
+        return self._storage.to_list()
+
+    @records.setter
+    def records(self, records: List[Record]):
+        if any(records[i]["t"] > records[i + 1]["t"] for i in range(len(records) - 1)):
+            records = sorted(records, key=lambda r: r["t"])
+        self._storage = self._new_storage(records)
+        self._keys = None
+        self._projection.clear()
+        self._projection_t.clear()
+        self._stale_ids = None
+
+    def project(self, since: Optional[int] = None) -> List[Record]:
         """
         Project all records with the same id_ to the latest state. This will combine the
         fields of all records with the same id_ into a single record.
+        If since is given, only the ids with records at or after that t are returned.
         """
-        records = sorted(self.records, key=lambda r: r.get("t"))
-        projection = {}
-        for record in records:
-            id_ = record.get("id_")
-            if id_ not in projection:
-                projection[id_] = {}
-            projection[id_].update(record)
-        return list(projection.values())
+        if self._stale_ids is None or self._stale_ids:
+            self._rebuild_projection()
+
+        return [
+            dict(record)
+            for id_, record in self._projection.items()
+            if since is None or self._projection_t[id_] >= since
+        ]
+
+    def _project(self, record: Record, replaced: bool = False):
+        """Merges a new record into the latest state of its id_"""
+        id_, t = record["id_"], record["t"]
+        if self._stale_ids is None or id_ in self._stale_ids:
+            return
+        if id_ not in self._projection:
+            self._projection[id_] = dict(record)
+            self._projection_t[id_] = t
+        elif t > self._projection_t[id_] and not replaced:
+            self._projection[id_].update(record)
+            self._projection_t[id_] = t
+        else:
+            # An older record or a replacement can change fields that were already
+            # merged, so the state of this id_ is rebuilt on the next project()
+            self._stale_ids.add(id_)
+
+    def _rebuild_projection(self):
+        if self._stale_ids is None:
+            self._projection.clear()
+            self._projection_t.clear()
+        for id_ in self._stale_ids or ():
+            self._projection.pop(id_, None)
+            self._projection_t.pop(id_, None)
+
+        for i in range(len(self._storage)):
+            id_ = self._storage.id_at(i)
+            if self._stale_ids is None or id_ in self._stale_ids:
+                self._projection.setdefault(id_, {}).update(self._storage.get(i))
+                self._projection_t[id_] = self._storage.t_at(i)
+        self._stale_ids = set()
+
+    def between(self, since: Optional[int] = None, until: Optional[int] = None) -> "RecordSet":
+        """
+        Returns the records with since <= t < until as a view of this record set
+        """
+        start = 0 if since is None else self._storage.bisect_left(since)
+        stop = len(self) if until is None else self._storage.bisect_left(until)
+        return self._view(start, stop)
+
+    def at_or_before(self, t: int) -> Optional[Record]:
+        """
+        Returns the last record with a t lower or equal than the given one
+        """
+        index = self._storage.bisect_right(t)
+        return self._storage.get(index - 1) if index > 0 else None
+
+    def latest(self, n: int = 1) -> "RecordSet":
+        """
+        Returns the last n records as a view of this record set
+        """
+        return self._view(max(len(self) - n, 0), len(self))
+
+    def resample(
+        self, bucket_ms: int, aggregations: Dict[str, str], by: Optional[str] = "id_"
+    ) -> "RecordSet":
+        """
+        Aggregates the numeric fields in buckets of bucket_ms milliseconds, for each value
+        of the field by (or all records together if by is None). Aggregations map each
+        field to one of mean, sum, min, max, count, first or last. Requires numpy.
+        """
+        from aleph.models import aggregation
+
+        records = aggregation.resample(self._storage, bucket_ms, aggregations, by)
+        return self._new_record_set(records)
+
+    def rolling(
+        self, window_ms: int, aggregations: Dict[str, str], by: Optional[str] = "id_"
+    ) -> "RecordSet":
+        """
+        Aggregates, for each record, the numeric fields of the records with the same by
+        value in the last window_ms milliseconds. Takes the same aggregations as resample.
+        Requires numpy.
+        """
+        from aleph.models import aggregation
+
+        records = aggregation.rolling(self._storage, window_ms, aggregations, by)
+        return self._new_record_set(records)
+
+    def to_numpy(self) -> dict:
+        """
+        Returns a dict with t and id_ as numpy arrays, and every other field as a masked
+        array that masks missing and None values. The dtypes come from the model fields
+        when there is a model. Typed columns of a columnar set are not copied, the set
+        copies them instead on its next change, so the arrays keep the exported values.
+        """
+        from aleph.models import arrays
+
+        self._export()
+        return arrays.to_numpy(self._storage, self.model)
+
+    def to_arrow(self):
+        """
+        Returns the records as a pyarrow Table, with id_ dictionary-encoded. The int and
+        float columns of a columnar set are not copied, like in to_numpy. Requires pyarrow.
+        """
+        from aleph.models import arrays
+
+        self._export()
+        return arrays.to_arrow(self._storage, self.model)
+
+    @classmethod
+    def from_arrow(
+        cls, table, model: Optional[Type[Model]] = None, columnar: bool = True
+    ) -> "RecordSet":
+        """
+        Creates a record set from a pyarrow Table with t and id_ columns. A columnar set is
+        filled column by column, without building a dict per record. Requires pyarrow.
+        """
+        from aleph.models import arrays
+
+        record_set = RecordSet(model, columnar)
+        if columnar:
+            record_set._storage = arrays.from_arrow(table, model)
+            record_set._keys = None
+            record_set._stale_ids = None
+        else:
+            record_set.records = table.to_pylist()
+        return record_set
+
+    def buffers(self, field: str) -> tuple[memoryview, memoryview]:
+        """
+        Returns memoryviews of the values and the mask of a typed column (or t) of a
+        columnar set, without copying them, like in to_numpy. Masked out values hold a
+        placeholder.
+        """
+        self._export()
+        values, mask = self._storage.column(field)
+        if not isinstance(values, memoryview):
+            raise Exceptions.InvalidArgs(f"Field '{field}' is not stored in a typed column")
+        return values, memoryview(mask)
+
+    def _export(self):
+        """Makes the next change copy the storage, instead of resizing exported arrays"""
+        if self.columnar:
+            storage = self._storage
+            if isinstance(storage, StorageView):
+                storage = storage.storage
+            storage.exported = True
+
+    def _new_record_set(self, records: List[Record]) -> "RecordSet":
+        record_set = RecordSet(self.model, self.columnar, self.compact)
+        record_set.records = records
+        return record_set
+
+    def _view(self, start: int, stop: int) -> "RecordSet":
+        """
+        Creates a record set that shares the storage of this one instead of copying it.
+        It does not see the records added or replaced on this set after its creation.
+        """
+        view = RecordSet(self.model, self.columnar, self.compact)
+        view._storage = StorageView(self._storage, start, stop)
+        view._keys = None
+        view._stale_ids = None
+        return view
+
+    def _detach(self):
+        """Gives a view its own storage before it is modified"""
+        if isinstance(self._storage, StorageView):
+            self.records = self._storage.to_list()
+
+    def copy(self) -> "RecordSet":
+        """Returns a record set with a copy of the records"""
+        record_set = RecordSet(self.model, self.columnar, self.compact)
+        if isinstance(self._storage, StorageView):
+            record_set._storage = record_set._new_storage(self._storage.iter_records())
+        else:
+            record_set._storage = self._storage.copy()
+        record_set._keys = None if self._keys is None else set(self._keys)
+        record_set._projection = {id_: dict(record) for id_, record in self._projection.items()}
+        record_set._projection_t = dict(self._projection_t)
+        record_set._stale_ids = None if self._stale_ids is None else set(self._stale_ids)
+        return record_set
+
+    def _hand_over(self) -> "RecordSet":
+        """
+        Returns a record set that takes over the storage and indexes of this one, which
+        keeps a view of its records instead
+        """
+        record_set = RecordSet(self.model, self.columnar, self.compact)
+        record_set._storage = self._storage
+        record_set._keys, self._keys = self._keys, None
+        record_set._projection, self._projection = self._projection, {}
+        record_set._projection_t, self._projection_t = self._projection_t, {}
+        record_set._stale_ids, self._stale_ids = self._stale_ids, None
+        self._storage = StorageView(self._storage, 0, len(self._storage))
+        return record_set
+
+    def _own_storage(self, appending: bool = False):
+        """
+        Copies the storage before changing records that views of it share, or before any
+        change once its arrays were exported
+        """
+        if self._storage.exported or self._storage.views and not appending:
+            self._storage = self._storage.copy()
 
     def update(self, records: Record | List[Record] | Model | List[Model]) -> "RecordSet":
         """
-        Returns a new record set with the records updated
+        Returns a new record set with the records updated. Use merge to update this one.
+        The storage is shared with the new set, and only copied when records they both
+        have are replaced or moved, so appending records does not copy it.
+        """
+        if isinstance(self._storage, StorageView):
+            record_set = self.copy()
+        else:
+            record_set = self._hand_over()
+        record_set.merge(records)
+        return record_set
+
+    def merge(self, records: Record | List[Record] | Model | List[Model]):
+        """
+        Updates the record set in place. Records with the same t and id_ as an existing
+        record replace it, the rest are merged keeping the set sorted by t.
         """
         now = current_timestamp()
-        model = self.model.to_all_optionals_model() if self.model else None
-        new_records = {(r["t"], r["id_"]): r for r in self.records}
 
         if not isinstance(records, list):
             records = [records]
+        if self.model:
+            records = self._validate(records)
+        else:
+            records = [dict(record) for record in records]
 
+        self._detach()
+        keys = self._index_keys()
+        batch = {}
         for record in records:
-            if model and not isinstance(record, model):
-                record = model(**record).dict()
-            if not isinstance(record, dict):
-                record = dict(record)
-
-            record = record.copy()
-            record["t"] = record.get("t", now)
+            if record.get("t") is None:
+                record["t"] = now
             record["id_"] = record.get("id_")
+            batch[(record["t"], record["id_"])] = self._compact(record)
 
-            record_id = (record["t"], record["id_"])
-            new_records[record_id] = record
+        inserts = []
+        for key, record in batch.items():
+            self._project(record, replaced=key in keys)
+            if key in keys:
+                self._own_storage()
+                self._storage.set(self._index(key), record)
+            elif len(self._storage) == 0 or key[0] >= self._storage.t_at(-1):
+                self._own_storage(appending=True)
+                self._storage.append(record)
+            else:
+                inserts.append(record)
+            keys.add(key)
 
-        record_set = RecordSet(self.model)
-        record_set.records = list(sorted(new_records.values(), key=lambda r: r.get("t")))
-        return record_set
+        if inserts:
+            inserts.sort(key=lambda r: r["t"])
+            self._own_storage()
+            self._storage.merge(inserts)
+
+    def _validate(self, records: List[Record | Model]) -> List[Record]:
+        """
+        Validates the records that are not model instances in a single batch, ignoring
+        missing fields, and returns every record as a new dict
+        """
+        validated = iter(self.model.validate_many(
+            [record for record in records if not isinstance(record, BaseModel)], partial=True
+        ))
+        return [
+            record.dict() if isinstance(record, BaseModel) else next(validated)
+            for record in records
+        ]
+
+    def _index_keys(self) -> set[tuple[int, Value]]:
+        """Returns the (t, id_) of every record, building the set if needed"""
+        if self._keys is None:
+            storage = self._storage
+            self._keys = {(storage.t_at(i), storage.id_at(i)) for i in range(len(storage))}
+        return self._keys
+
+    def _index(self, key: tuple[int, Value]) -> int:
+        """Returns the position of the record with the given (t, id_)"""
+        t, id_ = key
+        for i in range(self._storage.bisect_left(t), self._storage.bisect_right(t)):
+            if self._storage.id_at(i) == id_:
+                return i
+        raise KeyError(key)
 
     def __getitem__(self, item) -> Record:
-        return self.records[item]
+        return self._storage.get(item)
 
     def __setitem__(self, item, value):
-        self.records[item] = value
+        self._detach()
+        self._own_storage()
+        previous = self._storage.get(item)
+        keys = self._index_keys()
+        keys.discard((previous["t"], previous["id_"]))
+        keys.add((value["t"], value["id_"]))
+        if self._stale_ids is not None:
+            self._stale_ids.update([previous["id_"], value["id_"]])
+        self._storage.set(item, self._compact(value))
 
-    def __iter__(self) -> Record:
-        for i in range(len(self.records)):
-            yield self.records[i]
+    def __iter__(self) -> Iterator[Record]:
+        return self._storage.iter_records()
 
     def __len__(self) -> int:
-        return len(self.records)
+        return len(self._storage)
 
     def __repr__(self) -> str:
         model_name = self.model.__name__ if self.model else ""
@@ -0,0 +1,96 @@
+import weakref
+
+from typing import Dict, Optional, Type
+
+from pydantic import BaseModel
+from pydantic.fields import SHAPE_SINGLETON, ModelField
+
+FAST_TYPES = (int, float, str, bool)
+TYPECODES = {bool: "b", int: "q", float: "d"}
+
+
+def fast_type(field: ModelField, config) -> Optional[type]:
+    """
+    Returns the type of the field if pydantic returns the values of exactly that type
+    unchanged, so validating them can be skipped. Returns None otherwise.
+    """
+    if field.outer_type_ not in FAST_TYPES or field.shape != SHAPE_SINGLETON:
+        return None
+    if field.class_validators or field.pre_validators or field.post_validators:
+        return None
+    if field.outer_type_ is str and (
+        config.anystr_strip_whitespace
+        or config.anystr_lower
+        or config.min_anystr_length
+        or config.max_anystr_length
+    ):
+        return None
+    return field.outer_type_
+
+
+def optional_model(model: Type[BaseModel]) -> Type[BaseModel]:
+    """
+    Creates a subclass of the model where no field is required. Subclasses get a deep
+    copy of the fields, so the model itself is not modified.
+    """
+    namespace = {"__optional_of__": model, "__module__": model.__module__}
+    optional = type(f"{model.__name__}Optional", (model,), namespace)
+    for field in optional.__fields__.values():
+        field.required = False
+    return optional
+
+
+class ModelInfo:
+    """
+    Metadata of a model that is computed once, so it is not read from the pydantic
+    fields on every record. It only keeps a weak reference to the model.
+    """
+
+    def __init__(self, model: Type[BaseModel]):
+        self._model = weakref.ref(model)
+        self.fields: tuple[str, ...] = tuple(model.__fields__)
+        self.aliases: set[str] = {field.alias for field in model.__fields__.values()}
+        self.typecodes: Dict[str, Optional[str]] = {
+            name: TYPECODES.get(field.outer_type_) for name, field in model.__fields__.items()
+        }
+        self.coercers: list[tuple[str, ModelField, Optional[type]]] = [
+            (name, field, fast_type(field, model.__config__))
+            for name, field in model.__fields__.items()
+        ]
+
+    @property
+    def optional(self) -> Type[BaseModel]:
+        """
+        The model where no field is required, created the first time it is needed. It is
+        kept on the model class, since it holds a reference to the model.
+        """
+        model = self._model()
+        if "__optional_of__" in model.__dict__:
+            return model
+        optional = model.__dict__.get("__optional_model__")
+        if optional is None:
+            optional = optional_model(model)
+            setattr(model, "__optional_model__", optional)
+        return optional
+
+
+_models: Dict[Type[BaseModel], ModelInfo] = weakref.WeakKeyDictionary()
+
+
+def model_info(model: Type[BaseModel]) -> ModelInfo:
+    """
+    Returns the metadata of a model, computing it the first time it is needed, once the
+    class is fully built
+    """
+    info = _models.get(model)
+    if info is None:
+        info = _models[model] = ModelInfo(model)
+    return info
+
+
+def forget_model(model: Type[BaseModel]):
+    """Drops the metadata of a model and the classes built from it, so they are built again"""
+    _models.pop(model, None)
+    for name in ("__optional_model__", "__compact_record__"):
+        if name in model.__dict__:
+            delattr(model, name)
@@ -0,0 +1,414 @@
+import heapq
+import weakref
+
+from array import array
+from bisect import bisect_left, bisect_right
+from typing import Iterable, Iterator, List, Optional, Sequence, Tuple, Type
+
+from aleph.models.model import Model
+from aleph.models.registry import TYPECODES, model_info
+from aleph.utils.typing import Record, Value
+
+MISSING = 0
+PRESENT = 1
+NULL = 2
+
+PYTHON_TYPES = {typecode: python_type for python_type, typecode in TYPECODES.items()}
+PLACEHOLDERS = {"b": False, "q": 0, "d": float("nan")}
+
+ColumnData = Tuple[Sequence[Value], Sequence[int]]  # values and mask
+EncodedIds = Tuple[Sequence[int], List[Value]]  # codes and the id_ of each code
+Buffer = bytes | bytearray | memoryview  # or any object supporting the buffer protocol
+
+
+class RowStorage:
+    """
+    Stores every record as a dict in a list
+    """
+
+    def __init__(self, records: Iterable[Record] = ()):
+        self.records: List[Record] = records if isinstance(records, list) else list(records)
+        self.views = weakref.WeakSet()
+        self.exported = False  # rows are copied when they are exported
+
+    def copy(self) -> "RowStorage":
+        return RowStorage(list(self.records))
+
+    def get(self, index: int | slice) -> Record | List[Record]:
+        return self.records[index]
+
+    def set(self, index: int, record: Record):
+        self.records[index] = record
+
+    def append(self, record: Record):
+        self.records.append(record)
+
+    def insert(self, index: int, record: Record):
+        self.records.insert(index, record)
+
+    def merge(self, records: List[Record]):
+        """
+        Merges records sorted by t in a single pass. Only the records after the first
+        insertion point are moved, and new records go after existing ones with the same t.
+        """
+        start = self.bisect_right(records[0]["t"])
+        tail = self.records[start:]
+        del self.records[start:]
+        self.records.extend(heapq.merge(tail, records, key=lambda r: r["t"]))
+
+    def t_at(self, index: int) -> int:
+        return self.records[index]["t"]
+
+    def id_at(self, index: int) -> Value:
+        return self.records[index]["id_"]
+
+    def bisect_left(self, t: int) -> int:
+        return bisect_left(self.records, t, key=lambda r: r["t"])
+
+    def bisect_right(self, t: int) -> int:
+        return bisect_right(self.records, t, key=lambda r: r["t"])
+
+    def iter_records(self, start: int = 0, stop: Optional[int] = None) -> Iterator[Record]:
+        stop = len(self.records) if stop is None else stop
+        for i in range(start, stop):
+            yield self.records[i]
+
+    def to_list(self) -> List[Record]:
+        return self.records
+
+    def fields(self) -> List[str]:
+        """Returns the name of every field but t and id_"""
+        fields = {}
+        for record in self.records:
+            fields.update(dict.fromkeys(record))
+        return [field for field in fields if field not in ("t", "id_")]
+
+    def column(self, field: str, start: int = 0, stop: Optional[int] = None) -> ColumnData:
+        """Returns the values of a field and its mask"""
+        records = self.records[start:stop]
+        values = [record.get(field) for record in records]
+        mask = bytes(
+            MISSING if field not in record else NULL if value is None else PRESENT
+            for record, value in zip(records, values)
+        )
+        return values, mask
+
+    def encoded_ids(self, start: int = 0, stop: Optional[int] = None) -> EncodedIds:
+        """Returns the id_ of every record as a code, and the id_ of every code"""
+        codes, id_values = {}, []
+        for record in self.records[start:stop]:
+            if record["id_"] not in codes:
+                codes[record["id_"]] = len(id_values)
+                id_values.append(record["id_"])
+        return [codes[record["id_"]] for record in self.records[start:stop]], id_values
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+
+class Column:
+    """
+    Values of a single field. Numeric and boolean fields are kept in a typed array, any
+    other field is kept in a list. The mask tells apart present, missing and None values.
+    """
+
+    def __init__(self, typecode: Optional[str] = None, size: int = 0):
+        self.typecode = typecode
+        self.mask = bytearray(size)
+        if typecode is None:
+            self.values = [None] * size
+        else:
+            self.values = array(typecode, [PLACEHOLDERS[typecode]]) * size
+
+    @property
+    def python_type(self) -> Optional[type]:
+        return PYTHON_TYPES.get(self.typecode)
+
+    def fits(self, value: Value) -> bool:
+        return self.typecode is None or value is None or type(value) is self.python_type
+
+    @classmethod
+    def from_buffers(cls, typecode: Optional[str], values, mask: Buffer) -> "Column":
+        """Creates a column from a buffer of values (or a list if typecode is None)"""
+        column = Column()
+        column.typecode = typecode
+        column.mask = bytearray(mask)
+        if typecode is None:
+            column.values = list(values)
+        else:
+            column.values = array(typecode)
+            column.values.frombytes(memoryview(values).cast("B"))
+        return column
+
+    def copy(self) -> "Column":
+        column = Column()
+        column.typecode = self.typecode
+        column.mask = self.mask[:]
+        column.values = self.values[:]
+        return column
+
+    def to_objects(self):
+        """Turns the typed array into a list, so it can hold values of any type"""
+        self.values = [self.get(i) for i in range(len(self.mask))]
+        self.typecode = None
+
+    def get(self, index: int) -> Value:
+        if self.mask[index] != PRESENT:
+            return None
+        if self.typecode == "b":
+            return bool(self.values[index])
+        return self.values[index]
+
+    def set(self, index: int, value: Value, present: bool = True):
+        if not present:
+            self.mask[index] = MISSING
+            value = None
+        elif value is None:
+            self.mask[index] = NULL
+        else:
+            if not self.fits(value):
+                self.to_objects()
+            self.mask[index] = PRESENT
+
+        if value is None and self.typecode is not None:
+            value = PLACEHOLDERS[self.typecode]
+        self.values[index] = value
+
+    def append(self, value: Value, present: bool = True):
+        self.insert(len(self.mask), value, present)
+
+    def insert(self, index: int, value: Value, present: bool = True):
+        self.mask.insert(index, MISSING)
+        self.values.insert(index, PLACEHOLDERS[self.typecode] if self.typecode else None)
+        self.set(index, value, present)
+
+
+class ColumnarStorage:
+    """
+    Stores the records column by column: t as an int64 array, id_ dictionary-encoded
+    and every other field as a Column. Records are rebuilt as dicts when accessed.
+    """
+
+    def __init__(self, records: Iterable[Record] = (), model: Optional[Type[Model]] = None):
+        self.model = model
+        self.typecodes = model_info(model).typecodes if model is not None else {}
+        self.t = array("q")
+        self.ids = array("q")
+        self.id_values: List[Value] = []
+        self.id_codes: dict[Value, int] = {}
+        self.columns: dict[str, Column] = {}
+        self.views = weakref.WeakSet()
+        self.exported = False  # True once the arrays were exported without a copy
+
+        for record in records:
+            self.append(record)
+
+    def copy(self) -> "ColumnarStorage":
+        storage = ColumnarStorage(model=self.model)
+        storage.t = self.t[:]
+        storage.ids = self.ids[:]
+        storage.id_values = self.id_values[:]
+        storage.id_codes = self.id_codes.copy()
+        storage.columns = {field: column.copy() for field, column in self.columns.items()}
+        return storage
+
+    @classmethod
+    def from_columns(
+        cls,
+        t: Buffer,
+        ids: Buffer,
+        id_values: List[Value],
+        columns: dict[str, Column],
+        model: Optional[Type[Model]] = None,
+    ) -> "ColumnarStorage":
+        """
+        Creates the storage from int64 buffers of t and id_ codes, without building records.
+        The buffers are copied into the arrays.
+        """
+        storage = ColumnarStorage(model=model)
+        storage.t.frombytes(memoryview(t).cast("B"))
+        storage.ids.frombytes(memoryview(ids).cast("B"))
+        storage.id_values = list(id_values)
+        storage.id_codes = {id_: code for code, id_ in enumerate(storage.id_values)}
+        storage.columns = columns
+        return storage
+
+    def _typecode(self, field: str, value: Value) -> Optional[str]:
+        if field in self.typecodes:
+            return self.typecodes[field]
+        return TYPECODES.get(type(value))
+
+    def _encode_id(self, id_: Value) -> int:
+        code = self.id_codes.get(id_)
+        if code is None:
+            code = len(self.id_values)
+            self.id_codes[id_] = code
+            self.id_values.append(id_)
+        return code
+
+    def _column(self, field: str, value: Value) -> Column:
+        column = self.columns.get(field)
+        if column is None:
+            column = Column(self._typecode(field, value), len(self.t))
+            self.columns[field] = column
+        return column
+
+    def get(self, index: int | slice) -> Record | List[Record]:
+        if isinstance(index, slice):
+            return [self.get(i) for i in range(*index.indices(len(self.t)))]
+
+        record = {"id_": self.id_values[self.ids[index]], "t": self.t[index]}
+        for field, column in self.columns.items():
+            if column.mask[index] != MISSING:
+                record[field] = column.get(index)
+        return record
+
+    def set(self, index: int, record: Record):
+        self.t[index] = record["t"]
+        self.ids[index] = self._encode_id(record.get("id_"))
+        for field, value in record.items():
+            if field not in ("t", "id_"):
+                self._column(field, value).set(index, value)
+        for field, column in self.columns.items():
+            if field not in record:
+                column.set(index, None, present=False)
+
+    def append(self, record: Record):
+        self.insert(len(self.t), record)
+
+    def insert(self, index: int, record: Record):
+        for field, value in record.items():
+            if field not in ("t", "id_"):
+                self._column(field, value)
+
+        self.t.insert(index, record["t"])
+        self.ids.insert(index, self._encode_id(record.get("id_")))
+        for field, column in self.columns.items():
+            column.insert(index, record.get(field), field in record)
+
+    def merge(self, records: List[Record]):
+        """Like RowStorage.merge"""
+        start = self.bisect_right(records[0]["t"])
+        tail = list(self.iter_records(start))
+        del self.t[start:]
+        del self.ids[start:]
+        for column in self.columns.values():
+            del column.mask[start:]
+            del column.values[start:]
+        for record in heapq.merge(tail, records, key=lambda r: r["t"]):
+            self.append(record)
+
+    def t_at(self, index: int) -> int:
+        return self.t[index]
+
+    def id_at(self, index: int) -> Value:
+        return self.id_values[self.ids[index]]
+
+    def bisect_left(self, t: int) -> int:
+        return bisect_left(self.t, t)
+
+    def bisect_right(self, t: int) -> int:
+        return bisect_right(self.t, t)
+
+    def iter_records(self, start: int = 0, stop: Optional[int] = None) -> Iterator[Record]:
+        stop = len(self.t) if stop is None else stop
+        for i in range(start, stop):
+            yield self.get(i)
+
+    def to_list(self) -> List[Record]:
+        return list(self.iter_records())
+
+    def fields(self) -> List[str]:
+        return list(self.columns)
+
+    def column(self, field: str, start: int = 0, stop: Optional[int] = None) -> ColumnData:
+        """
+        Returns the values of a field and its mask. Typed columns are returned as memoryviews
+        of the arrays, without copying them.
+        """
+        stop = len(self.t) if stop is None else stop
+        present = bytes([PRESENT]) * (stop - start)
+        if field == "t":
+            return memoryview(self.t)[start:stop], present
+        if field == "id_":
+            return [self.id_values[code] for code in self.ids[start:stop]], present
+        if field not in self.columns:
+            return [None] * (stop - start), bytes(stop - start)
+
+        column = self.columns[field]
+        if column.typecode is None:
+            return column.values[start:stop], memoryview(column.mask)[start:stop]
+        return memoryview(column.values)[start:stop], memoryview(column.mask)[start:stop]
+
+    def encoded_ids(self, start: int = 0, stop: Optional[int] = None) -> EncodedIds:
+        """Returns the id_ of every record as a code, and the id_ of every code"""
+        return memoryview(self.ids)[start:stop], self.id_values
+
+    def __len__(self) -> int:
+        return len(self.t)
+
+
+class StorageView:
+    """
+    Read-only window [start, stop) over another storage, sharing its memory. The storage
+    that owns the records must be copied before replacing or inserting records while it
+    has views, records can be appended. It must also be copied before any change once
+    its arrays were exported, as exported arrays can not be resized.
+    """
+
+    def __init__(
+        self, storage: "RowStorage | ColumnarStorage | StorageView", start: int, stop: int
+    ):
+        if isinstance(storage, StorageView):
+            start, stop = storage.start + start, storage.start + stop
+            storage = storage.storage
+
+        self.storage = storage
+        self.start = start
+        self.stop = max(start, stop)
+        storage.views.add(self)
+
+    def _index(self, index: int) -> int:
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("record set index out of range")
+        return self.start + index
+
+    def get(self, index: int | slice) -> Record | List[Record]:
+        if isinstance(index, slice):
+            return [self.get(i) for i in range(*index.indices(len(self)))]
+        return self.storage.get(self._index(index))
+
+    def t_at(self, index: int) -> int:
+        return self.storage.t_at(self._index(index))
+
+    def id_at(self, index: int) -> Value:
+        return self.storage.id_at(self._index(index))
+
+    def bisect_left(self, t: int) -> int:
+        return min(max(self.storage.bisect_left(t), self.start), self.stop) - self.start
+
+    def bisect_right(self, t: int) -> int:
+        return min(max(self.storage.bisect_right(t), self.start), self.stop) - self.start
+
+    def iter_records(self, start: int = 0, stop: Optional[int] = None) -> Iterator[Record]:
+        stop = len(self) if stop is None else stop
+        return self.storage.iter_records(self.start + start, self.start + stop)
+
+    def to_list(self) -> List[Record]:
+        return list(self.iter_records())
+
+    def fields(self) -> List[str]:
+        return self.storage.fields()
+
+    def column(self, field: str, start: int = 0, stop: Optional[int] = None) -> ColumnData:
+        stop = len(self) if stop is None else stop
+        return self.storage.column(field, self.start + start, self.start + stop)
+
+    def encoded_ids(self, start: int = 0, stop: Optional[int] = None) -> EncodedIds:
+        stop = len(self) if stop is None else stop
+        return self.storage.encoded_ids(self.start + start, self.start + stop)
+
+    def __len__(self) -> int:
+        return self.stop - self.start
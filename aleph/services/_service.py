@@ -1,7 +1,10 @@
+import asyncio
 import logging
 import time
 
 from aleph_core import Connection, Error
+from aleph_core.utils.exceptions import Exceptions
+from aleph_core.utils.in_flight_buffer import InFlightBuffer
 
 logger = logging.getLogger(__name__)
 
@@ -12,13 +15,46 @@ class Service:
     main_connection_subscribe_keys: dict[str, int] | list[str] = {}
     link_connection_subscribe_keys: dict[str, int] | list[str] = {}
 
+    # Records read from the main connection that are not written on the link yet
+    max_in_flight_records = 10000
+    overflow_policy = "block"  # block, store_and_forward or drop
+    max_subscription_delay = 10  # seconds added to the main subscriptions when full
+
     __status__ = None
 
     def __init__(self, service_id=""):
         self.service_id = service_id
+        self.in_flight = InFlightBuffer(
+            self.max_in_flight_records, self.overflow_policy, self.max_subscription_delay
+        )
 
     def on_new_data_from_main_connection(self, key, data):
-        self.link_connection.write_async(key, data)
+        """
+        Writes the data on the link connection once it fits in the in flight buffer.
+        When called from an event loop, returns a coroutine that waits for room without
+        blocking the loop, since the link connection may need it to finish its writes.
+        """
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            self.__forward(key, data, self.in_flight.acquire(len(data)))
+            return None
+        return self.__forward_async(key, data)
+
+    async def __forward_async(self, key, data):
+        self.__forward(key, data, await self.in_flight.acquire_async(len(data)))
+
+    def __forward(self, key, data, acquired: bool):
+        try:
+            if acquired:
+                self.link_connection.write_async(key, data)
+            elif self.overflow_policy == "store_and_forward":
+                self.link_connection.store(key, data)
+        except Exception as e:
+            self.on_error(Error(e, service_id=self.service_id, key=key))
+
+    def on_write_done_on_link_connection(self, key, data):
+        self.in_flight.release(len(data))
 
     def on_new_data_from_link_connection(self, key, data):
         self.main_connection.write_async(key, data)
@@ -61,11 +97,19 @@ class Service:
         """Connect callbacks"""
         logger.info("Loading service")
 
+        link_stores = self.link_connection.store_and_forward
+        if self.overflow_policy == "store_and_forward" and not link_stores:
+            raise Exceptions.ServiceInitError(
+                "The store_and_forward overflow policy needs store_and_forward on the link"
+            )
+        self.main_connection.subscription_delay = lambda key: self.in_flight.delay()
+
         self.main_connection.on_new_data = self.on_new_data_from_main_connection
         self.main_connection.on_read_error = self.on_error
         self.main_connection.on_write_error = self.on_error
 
         self.link_connection.on_new_data = self.on_new_data_from_link_connection
+        self.link_connection.on_write_done = self.on_write_done_on_link_connection
         self.link_connection.on_read_error = self.on_error
         self.link_connection.on_write_error = self.on_error
 
@@ -1,24 +1,92 @@
 import asyncio
-from threading import Thread
+from threading import Lock, Thread, local
+from concurrent.futures import Future
 from typing import Coroutine, Callable
 
+from aleph_core.utils.worker_pool import WorkerPool
+
 
 class AsyncHelper:
-    def __init__(self):
+    def __init__(self, max_workers: int = 8, max_queue: int = 1000, policy: str = "block"):
+        """
+        Functions given to run_on_thread run on a pool of max_workers threads, with up to
+        max_queue calls waiting. The policy is the WorkerPool policy for a full queue.
+        """
         self.main_thread: Thread = None
         self.main_loop = None
+        self.__local__ = local()
+        self.__loops__ = []  # loops created by run, one per thread
+        self.__lock__ = Lock()
+        self.worker_pool = WorkerPool(max_workers, max_queue, policy)
 
     def run(self, coroutine):
-        return asyncio.run(coroutine)
+        """
+        Runs the coroutine until it completes. Each thread keeps its own loop, so the loop
+        is not created and closed again on every call like with asyncio.run
+        """
+        loop = getattr(self.__local__, "loop", None)
+        if loop is None or loop.is_closed():
+            loop = self.__local__.loop = asyncio.new_event_loop()
+            with self.__lock__:
+                self.__loops__.append(loop)
+        return loop.run_until_complete(coroutine)
+
+    def run_coroutine_threadsafe(self, coroutine: Coroutine) -> Future:
+        """Runs the coroutine on the main loop, returns a future with its result"""
+        with self.__lock__:
+            if self.main_loop is None:
+                self.main_loop = asyncio.new_event_loop()
+                self.main_thread = Thread(target=self.main_loop.run_forever, daemon=True)
+                self.main_thread.start()
 
-    def run_coroutine_threadsafe(self, coroutine: Coroutine):
-        if self.main_loop is None:
-            self.main_loop = asyncio.new_event_loop()
-            self.main_thread = Thread(target=self.main_loop.run_forever, daemon=True)
-            self.main_thread.start()
+        return asyncio.run_coroutine_threadsafe(coroutine, self.main_loop)
 
-        asyncio.run_coroutine_threadsafe(coroutine, self.main_loop)
+    def run_on_thread(self, function: Callable, *args, **kwargs) -> Future:
+        """Runs the function on the worker pool"""
+        return self.worker_pool.submit(function, *args, **kwargs)
 
-    def run_on_thread(self, function: Callable, *args, **kwargs):
+    def start_thread(self, function: Callable, *args, **kwargs):
+        """Runs a function that does not return, like a loop, on its own daemon thread"""
         thread = Thread(target=function, args=args, kwargs=kwargs, daemon=True)
         thread.start()
+
+    def close(self, timeout: float = 5):
+        """
+        Cancels the tasks left on the loops and closes them, then shuts the worker pool
+        down. A loop that is still running a call to run is left open.
+        """
+        if self.main_loop is not None:
+            future = asyncio.run_coroutine_threadsafe(_cancel_tasks(), self.main_loop)
+            try:
+                future.result(timeout)
+            except Exception:
+                pass
+            self.main_loop.call_soon_threadsafe(self.main_loop.stop)
+            self.main_thread.join(timeout)
+            if not self.main_loop.is_running():
+                self.main_loop.close()
+            self.main_loop = self.main_thread = None
+
+        with self.__lock__:
+            loops, self.__loops__ = self.__loops__, []
+        for loop in loops:
+            if loop.is_running() or loop.is_closed():
+                continue
+            loop.run_until_complete(_cancel_tasks())
+            loop.run_until_complete(loop.shutdown_asyncgens())
+            loop.close()
+
+        self.worker_pool.shutdown(wait=False)
+
+    def stats(self) -> dict:
+        """Returns the saturation metrics of the worker pool"""
+        return self.worker_pool.stats()
+
+
+async def _cancel_tasks():
+    """Cancels the other tasks of the running loop and waits for them to end"""
+    current = asyncio.current_task()
+    tasks = [task for task in asyncio.all_tasks() if task is not current]
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
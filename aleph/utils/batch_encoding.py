@@ -0,0 +1,115 @@
+import pickle
+import zlib
+
+from typing import Optional
+
+from aleph_core.utils.exceptions import Exceptions
+from aleph_core.utils.typing import Record
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+COMPACT = b"C"  # first byte of a compact batch, a pickle starts with 0x80
+COMPRESSIONS = ("none", "zlib", "zstd")
+
+
+def decode_batch(payload: bytes) -> list[Record]:
+    """Decodes a batch encoded by any of the encodings"""
+    if payload[:1] != COMPACT:
+        return pickle.loads(payload)
+
+    compression, body = COMPRESSIONS[payload[1]], payload[2:]
+    if compression == "zlib":
+        body = zlib.decompress(body)
+    elif compression == "zstd":
+        if zstandard is None:
+            raise Exceptions.InvalidArgs("zstandard is required to decode this batch")
+        body = zstandard.ZstdDecompressor().decompress(body)
+
+    size, columns = pickle.loads(body)
+    records = [{} for _ in range(size)]
+    for name, kind, data, rows in columns:
+        if kind == "delta":
+            values, value = [], 0
+            for delta in data:
+                value += delta
+                values.append(value)
+        elif kind == "dictionary":
+            dictionary, indexes = data
+            values = [dictionary[i] for i in indexes]
+        else:
+            values = data
+
+        for row, value in zip(rows if rows is not None else range(size), values):
+            records[row][name] = value
+    return records
+
+
+class PickleEncoding:
+    """Encodes a batch of records as a pickled list"""
+
+    def encode(self, records: list[Record]) -> bytes:
+        return pickle.dumps(records, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def decode(self, payload: bytes) -> list[Record]:
+        return decode_batch(payload)
+
+
+class CompactEncoding:
+    """
+    Encodes a batch of records by columns, so field names are stored once per batch.
+    Integer t values are stored as deltas and id_ values, like other text columns with
+    repeated values, as indexes in a dictionary. The result is compressed with zstd if
+    zstandard is installed or zlib otherwise, unless another compression is given.
+    """
+
+    def __init__(self, compression: Optional[str] = None, level: Optional[int] = None):
+        if compression is None:
+            compression = "zstd" if zstandard is not None else "zlib"
+        if compression not in COMPRESSIONS:
+            raise Exceptions.InvalidArgs(f"Compression must be one of {COMPRESSIONS}")
+        if compression == "zstd" and zstandard is None:
+            raise Exceptions.InvalidArgs("zstd compression requires zstandard")
+
+        self.compression = compression
+        self.level = level
+
+    def encode(self, records: list[Record]) -> bytes:
+        columns: dict[str, tuple[list, list[int]]] = {}
+        for row, record in enumerate(records):
+            for name, value in record.items():
+                column = columns.get(name)
+                if column is None:
+                    column = columns[name] = ([], [])
+                column[0].append(value)
+                column[1].append(row)
+
+        encoded = []
+        for name, (values, rows) in columns.items():
+            kind, data = self.encode_column(name, values)
+            encoded.append((name, kind, data, None if len(rows) == len(records) else rows))
+        body = pickle.dumps((len(records), encoded), protocol=pickle.HIGHEST_PROTOCOL)
+
+        if self.compression == "zlib":
+            body = zlib.compress(body, 6 if self.level is None else self.level)
+        elif self.compression == "zstd":
+            body = zstandard.ZstdCompressor(level=self.level or 3).compress(body)
+        return COMPACT + bytes([COMPRESSIONS.index(self.compression)]) + body
+
+    @staticmethod
+    def encode_column(name: str, values: list) -> tuple[str, object]:
+        if name == "t" and all(type(value) is int for value in values):
+            return "delta", [b - a for a, b in zip([0] + values, values)]
+
+        if all(type(value) is str for value in values):
+            dictionary = list(dict.fromkeys(values))
+            if name == "id_" or len(dictionary) <= len(values) // 2:
+                indexes = {value: i for i, value in enumerate(dictionary)}
+                return "dictionary", (dictionary, [indexes[value] for value in values])
+
+        return "plain", values
+
+    def decode(self, payload: bytes) -> list[Record]:
+        return decode_batch(payload)
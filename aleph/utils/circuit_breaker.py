@@ -0,0 +1,105 @@
+import random
+import time
+
+from threading import Lock
+
+
+class CircuitBreaker:
+    """
+    Stops calling a failing resource for a while. After failure_threshold failures in a
+    row the circuit opens and no attempt is allowed until the backoff passes. Then it is
+    half open: a single attempt is allowed, which closes the circuit if it succeeds or
+    opens it again, with twice the backoff, if it fails. Failures of attempts that were
+    started before the circuit opened do not change it. The backoff starts at base_delay
+    seconds, is capped at max_delay and is reduced by a random part of up to jitter.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(
+        self,
+        failure_threshold: int = 3,
+        base_delay: float = 1,
+        max_delay: float = 300,
+        jitter: float = 0.5,
+    ):
+        self.failure_threshold = failure_threshold
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.jitter = jitter
+        self.lock = Lock()
+
+        self.state = self.CLOSED
+        self.failures = 0
+        self.consecutive_opens = 0
+        self.retry_at = 0.0
+        self.probing = False
+        self.transitions = {self.OPEN: 0, self.HALF_OPEN: 0, self.CLOSED: 0}
+        self.rejected = 0
+
+    def backoff(self) -> float:
+        delay = min(self.base_delay * 2 ** max(self.consecutive_opens - 1, 0), self.max_delay)
+        return delay * (1 - random.random() * self.jitter)
+
+    def allow(self) -> bool:
+        """Returns True if an attempt can be made now"""
+        with self.lock:
+            if self.state == self.OPEN and time.time() >= self.retry_at:
+                self._set_state(self.HALF_OPEN)
+            if self.state == self.CLOSED or (self.state == self.HALF_OPEN and not self.probing):
+                self.probing = self.state == self.HALF_OPEN
+                return True
+            self.rejected += 1
+            return False
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.consecutive_opens = 0
+            self.probing = False
+            if self.state != self.CLOSED:
+                self._set_state(self.CLOSED)
+
+    def record_failure(self):
+        with self.lock:
+            if self.state == self.OPEN:
+                return
+            if self.state == self.HALF_OPEN and not self.probing:
+                return
+
+            self.failures += 1
+            self.probing = False
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.consecutive_opens += 1
+                self.retry_at = time.time() + self.backoff()
+                self._set_state(self.OPEN)
+
+    def release(self):
+        """
+        Ends an attempt whose result says nothing about the resource, like an invalid
+        key, without changing the state. A half open circuit allows a new probe.
+        """
+        with self.lock:
+            self.probing = False
+
+    def retry_in(self) -> float:
+        """Returns the seconds until the next attempt is allowed"""
+        return max(self.retry_at - time.time(), 0) if self.state == self.OPEN else 0
+
+    def _set_state(self, state: str):
+        self.state = state
+        self.transitions[state] += 1
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "state": self.state,
+                "failures": self.failures,
+                "retry_in": self.retry_in(),
+                "opened": self.transitions[self.OPEN],
+                "half_opened": self.transitions[self.HALF_OPEN],
+                "closed": self.transitions[self.CLOSED],
+                "rejected": self.rejected,
+            }
@@ -0,0 +1,52 @@
+import time
+import croniter
+
+from bisect import bisect_right
+from threading import Lock
+
+
+class CronSchedule:
+    """
+    Fire times of a cron expression, computed size at a time and shared by every
+    subscriber of the expression. Use cron_schedule() to get the shared instance.
+    """
+
+    def __init__(self, expression: str, size: int = 64):
+        self.expression = expression
+        self.size = size
+        self.lock = Lock()
+        self.cron = croniter.croniter(expression, time.time())
+        self.times: list[float] = []
+        self.computed = 0
+
+    def next_after(self, t: float) -> float:
+        """Returns the first fire time after t"""
+        with self.lock:
+            if not self.times or self.times[-1] <= t:
+                self._compute(t)
+            return self.times[bisect_right(self.times, t)]
+
+    def _compute(self, t: float):
+        if not self.times or self.times[-1] < t:
+            self.times = []
+            self.cron.set_current(t)
+
+        # Past fire times are dropped, no subscriber waits for them anymore
+        now = time.time()
+        self.times = [x for x in self.times if x > now - 1]
+        while not self.times or self.times[-1] <= t or len(self.times) < self.size:
+            self.times.append(self.cron.get_next(float))
+            self.computed += 1
+
+
+_schedules: dict[str, CronSchedule] = {}
+_schedules_lock = Lock()
+
+
+def cron_schedule(expression: str) -> CronSchedule:
+    """Returns the shared schedule of the cron expression"""
+    with _schedules_lock:
+        schedule = _schedules.get(expression)
+        if schedule is None:
+            schedule = _schedules[expression] = CronSchedule(expression)
+        return schedule
@@ -8,6 +8,7 @@ from pathlib import Path
 from typing import Optional, Type, Any
 from sqlalchemy import Column, BigInteger
 
+from aleph_core.models.registry import model_info
 from aleph_core.utils.typing import Record
 from aleph_core.utils.time import now
 
@@ -30,7 +31,6 @@ class Model(pydantic.BaseModel):
     id_: Optional[str] = pydantic.Field(default_factory=generate_id, index=True)
     t: Optional[int] = pydantic.Field(default_factory=now, index=True)
 
-    __optional__: Optional[Type[pydantic.BaseModel]] = None
     __table__: Optional[Type[TableModel]] = None
 
     class Config:
@@ -48,11 +48,7 @@ class Model(pydantic.BaseModel):
 
     @classmethod
     def to_all_optionals_model(cls) -> Type[pydantic.BaseModel]:
-        if cls.__optional__ is None:
-            cls.__optional__ = type(f"{cls.__name__}Optional", (cls,), {})
-            for field in cls.__optional__.__fields__:
-                cls.__optional__.__fields__[field].required = False
-        return cls.__optional__
+        return model_info(cls).optional
 
     @classmethod
     def validate_record(cls, record: Record) -> Record:
@@ -66,5 +62,5 @@ class Model(pydantic.BaseModel):
         """
         Checks if subrecord fits the model (ignoring fields that are not present)
         """
-        cls_ = cls.to_all_optionals_model()
+        cls_ = model_info(cls).optional
         return cls_(**subrecord).dict(exclude_defaults=True, exclude_unset=True)
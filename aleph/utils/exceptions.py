@@ -20,6 +20,9 @@ class Exceptions:
     class ConnectionWritingTimeout(Exception):
         pass
 
+    class CircuitOpen(Exception):
+        pass
+
     # Services
     class ServiceInitError(Exception):
         pass
@@ -37,6 +40,9 @@ class Exceptions:
     class InvalidArgs(Exception):
         pass
 
+    class QueueFull(Exception):
+        pass
+
     # Alias
     ModelValidationError = pydantic.error_wrappers.ValidationError
 
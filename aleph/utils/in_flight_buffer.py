@@ -0,0 +1,109 @@
+import asyncio
+
+from threading import Condition
+from typing import Optional
+
+from aleph_core.utils.exceptions import Exceptions
+
+
+class InFlightBuffer:
+    """
+    Counts the records that were read but are not written yet, up to max_records.
+    When new records do not fit, the policy decides what happens: "block" waits until
+    they fit, "store_and_forward" and "drop" reject them, so the caller can store or
+    discard them (rejected records are counted as spilled or dropped). acquire_async
+    waits without blocking the event loop, so it can be used from a coroutine.
+    """
+
+    POLICIES = ("block", "store_and_forward", "drop")
+
+    def __init__(self, max_records: int = 10000, policy: str = "block", max_delay: float = 10):
+        if policy not in self.POLICIES:
+            raise Exceptions.InvalidArgs(f"Policy must be one of {self.POLICIES}")
+
+        self.max_records = max_records
+        self.policy = policy
+        self.max_delay = max_delay
+        self.condition = Condition()
+        self.in_flight = 0
+        self.peak = 0
+        self.dropped = 0
+        self.spilled = 0
+        self.waiters: list[tuple[asyncio.AbstractEventLoop, asyncio.Future]] = []
+
+    def _try_acquire(self, records: int) -> Optional[bool]:
+        """Reserves room for the records, returns None if the caller has to wait"""
+        if self.in_flight > 0 and self.in_flight + records > self.max_records:
+            if self.policy == "drop":
+                self.dropped += records
+                return False
+            if self.policy == "store_and_forward":
+                self.spilled += records
+                return False
+            return None
+
+        self.in_flight += records
+        self.peak = max(self.peak, self.in_flight)
+        return True
+
+    def acquire(self, records: int) -> bool:
+        """
+        Reserves room for the records. Returns False if they were rejected.
+        A batch larger than max_records is let through when nothing else is in flight.
+        """
+        with self.condition:
+            while True:
+                acquired = self._try_acquire(records)
+                if acquired is not None:
+                    return acquired
+                self.condition.wait()
+
+    async def acquire_async(self, records: int) -> bool:
+        """Like acquire, but the block policy waits without blocking the event loop"""
+        loop = asyncio.get_running_loop()
+        while True:
+            with self.condition:
+                acquired = self._try_acquire(records)
+                if acquired is not None:
+                    return acquired
+                future = loop.create_future()
+                self.waiters.append((loop, future))
+            await future
+
+    def release(self, records: int):
+        """Frees the room of records that were written (or failed to be written)"""
+        with self.condition:
+            self.in_flight = max(self.in_flight - records, 0)
+            self.condition.notify_all()
+            waiters, self.waiters = self.waiters, []
+
+        for loop, future in waiters:
+            try:
+                loop.call_soon_threadsafe(_wake, future)
+            except RuntimeError:
+                pass  # the loop was closed
+
+    def delay(self) -> float:
+        """
+        Returns the seconds a reader should wait before its next read. It is 0 while the
+        buffer is less than half full, and grows up to max_delay when it is full.
+        """
+        fill = self.in_flight / self.max_records
+        if fill <= 0.5:
+            return 0
+        return self.max_delay * min((fill - 0.5) * 2, 1)
+
+    def stats(self) -> dict:
+        with self.condition:
+            return {
+                "in_flight": self.in_flight,
+                "max_records": self.max_records,
+                "peak": self.peak,
+                "dropped": self.dropped,
+                "spilled": self.spilled,
+            }
+
+
+def _wake(future: asyncio.Future):
+    if not future.done():
+        future.set_result(None)
@@ -0,0 +1,30 @@
+import time
+
+from threading import Lock
+from typing import Optional
+
+
+class RateLimiter:
+    """
+    Token bucket that allows rate units per second on average, with bursts of up to
+    burst units, which defaults to one second of rate.
+    """
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        self.rate = rate
+        self.burst = burst if burst is not None else rate
+        self.lock = Lock()
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+
+    def reserve(self, amount: float) -> float:
+        """
+        Takes amount units from the bucket and returns the seconds to wait before
+        using them. An amount larger than burst is allowed, it just waits longer.
+        """
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.tokens + (now - self.updated) * self.rate, self.burst)
+            self.updated = now
+            self.tokens -= amount
+            return max(-self.tokens / self.rate, 0)
@@ -0,0 +1,43 @@
+from typing import Optional
+
+from aleph_core.utils.exceptions import Exceptions
+
+
+class Retention:
+    """
+    Limits of the data kept by a store and forward buffer. max_records and max_bytes
+    apply to each key, max_total_records and max_total_bytes to all the keys together
+    and max_age, in seconds, to the t of every record. When a limit is exceeded, the
+    policy decides what is evicted: "drop_oldest" removes the oldest records,
+    "drop_newest" rejects the new ones and "downsample" keeps every second record, by t,
+    of the oldest half of the key. Expired records are always removed.
+    """
+
+    POLICIES = ("drop_oldest", "drop_newest", "downsample")
+
+    def __init__(
+        self,
+        max_records: Optional[int] = None,
+        max_bytes: Optional[int] = None,
+        max_age: Optional[float] = None,
+        max_total_records: Optional[int] = None,
+        max_total_bytes: Optional[int] = None,
+        policy: str = "drop_oldest",
+    ):
+        if policy not in self.POLICIES:
+            raise Exceptions.InvalidArgs(f"Policy must be one of {self.POLICIES}")
+
+        self.max_records = max_records
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.max_total_records = max_total_records
+        self.max_total_bytes = max_total_bytes
+        self.policy = policy
+
+    @property
+    def has_total_limits(self) -> bool:
+        return self.max_total_records is not None or self.max_total_bytes is not None
+
+    @property
+    def has_byte_limits(self) -> bool:
+        return self.max_bytes is not None or self.max_total_bytes is not None
@@ -0,0 +1,124 @@
+import heapq
+import itertools
+import time
+
+from threading import Condition, Thread
+from typing import Callable, Optional
+
+from aleph_core.utils.cron_schedule import cron_schedule
+from aleph_core.utils.exceptions import Exceptions
+from aleph_core.utils.wait_one_step import next_deadline
+from aleph_core.utils.worker_pool import WorkerPool
+
+
+class Job:
+    """
+    A function that runs every time_step, which is a number of seconds or a cron
+    expression, like in WaitOneStep. If offset is given, a numeric time_step runs on its
+    multiples of the clock shifted by offset, like an aligned WaitOneStep.
+    """
+
+    __slots__ = ("function", "args", "time_step", "offset", "cron", "active")
+
+    def __init__(
+        self,
+        time_step: int | float | str,
+        function: Callable,
+        args: tuple,
+        offset: Optional[float] = None,
+    ):
+        self.function = function
+        self.args = args
+        self.time_step = time_step
+        self.offset = offset
+        self.cron = None
+        if isinstance(time_step, str):
+            self.cron = cron_schedule(time_step)
+        self.active = True
+
+    def next_time(self, start: float, now: float) -> float:
+        """Returns when the job runs next, given when its last run started and ended"""
+        if self.cron is None and self.offset is not None:
+            return max(next_deadline(start, self.time_step, self.offset), now)
+        if self.cron is None:
+            return max(start + self.time_step, now)
+        return self.cron.next_after(max(start, now))
+
+
+class Scheduler:
+    """
+    Runs every periodic job from a single thread that keeps them in a heap sorted by
+    their next run, instead of one sleeping loop per job. Due jobs run on the worker
+    pool. A job does not start again until its previous run ends, and if the pool is
+    full the run is skipped until the next step.
+    """
+
+    def __init__(self, worker_pool: Optional[WorkerPool] = None):
+        self.worker_pool = worker_pool or WorkerPool(max_workers=8, policy="raise")
+        self.condition = Condition()
+        self.heap: list[tuple[float, int, Job]] = []
+        self.counter = itertools.count()
+        self.thread: Optional[Thread] = None
+        self.skipped = 0
+
+    def add(
+        self,
+        time_step: int | float | str,
+        function: Callable,
+        *args,
+        offset: Optional[float] = None,
+    ) -> Job:
+        """
+        Runs function(*args) now and then every time_step. If the function returns a
+        number, the next run is delayed by that many seconds. If offset is given, the
+        runs are aligned to the clock (see Job).
+        """
+        job = Job(time_step, function, args, offset)
+        self._push(time.time(), job)
+
+        with self.condition:
+            if self.thread is None:
+                self.thread = Thread(target=self._loop, daemon=True)
+                self.thread.start()
+        return job
+
+    def remove(self, job: Job):
+        """Stops running the job. It is removed from the heap when it is due."""
+        job.active = False
+
+    def __len__(self) -> int:
+        with self.condition:
+            return sum(1 for _, _, job in self.heap if job.active)
+
+    def _push(self, t: float, job: Job):
+        with self.condition:
+            heapq.heappush(self.heap, (t, next(self.counter), job))
+            self.condition.notify()
+
+    def _loop(self):
+        while True:
+            with self.condition:
+                while not self.heap or self.heap[0][0] > time.time():
+                    timeout = self.heap[0][0] - time.time() if self.heap else None
+                    self.condition.wait(timeout)
+                _, _, job = heapq.heappop(self.heap)
+
+            if not job.active:
+                continue
+            start = time.time()
+            try:
+                self.worker_pool.submit(self._run, job, start)
+            except Exceptions.QueueFull:
+                self.skipped += 1
+                self._push(job.next_time(start, time.time()), job)
+
+    def _run(self, job: Job, start: float):
+        delay = None
+        try:
+            delay = job.function(*job.args)
+        finally:
+            if job.active:
+                next_time = job.next_time(start, time.time())
+                if isinstance(delay, (int, float)):
+                    next_time += delay
+                self._push(next_time, job)
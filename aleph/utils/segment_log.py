@@ -0,0 +1,384 @@
+import os
+import struct
+
+from bisect import bisect_left
+from threading import RLock
+from typing import Optional
+from urllib.parse import quote, unquote
+
+from aleph_core.utils.batch_encoding import PickleEncoding
+from aleph_core.utils.typing import Record
+
+FRAME_HEADER = struct.Struct("<II")  # payload size and number of records
+
+
+class Segment:
+    """
+    A file with the records of a key from offset to offset + count. The records and the
+    bytes at the end of each frame are kept, to measure the records that are left.
+    """
+
+    __slots__ = ("path", "offset", "count", "size", "frames")
+
+    def __init__(self, path: str, offset: int, count: int = 0, size: int = 0):
+        self.path = path
+        self.offset = offset
+        self.count = count
+        self.size = size
+        self.frames: list[tuple[int, int]] = []
+
+    @property
+    def end(self) -> int:
+        return self.offset + self.count
+
+    def add_frame(self, count: int, size: int):
+        self.count += count
+        self.size += size
+        self.frames.append((self.count, self.size))
+
+    def nbytes_from(self, start: int) -> int:
+        """
+        Returns the bytes of the frames from the start-th record, counting the part of
+        the frame where start falls
+        """
+        if start <= 0:
+            return self.size
+        i = bisect_left(self.frames, start, key=lambda frame: frame[0])
+        if i == len(self.frames):
+            return 0
+        count, size = self.frames[i]
+        previous_count, previous_size = self.frames[i - 1] if i else (0, 0)
+        part = (size - previous_size) * (count - start) // (count - previous_count)
+        return self.size - size + part
+
+
+class SegmentLogBuffer:
+    """
+    Store and forward buffer that appends the records of each key to segment files,
+    so buffering costs O(new records). Every key has a directory with its segments,
+    named by the offset of their first record, and a checkpoint with the offset of
+    the first record that is not flushed yet. Segments are deleted once all their
+    records are flushed. After a crash, the buffer is rebuilt from the files and an
+    incomplete last frame is discarded.
+
+    Small appends are gathered in an open block, a file with a single frame that is
+    encoded and written again as a temporary file on every append, until it has
+    block_records records. The block is then appended to the last segment as one frame
+    and its file deleted, so single records are not encoded and compressed one by one.
+
+    replace() only writes the new records and the rest of the segment where the
+    replaced ones end, into a new segment that takes the place of the old ones. It is
+    written as a temporary file and committed by a checkpoint with the offset and end of
+    the new segment, which recovery completes, so a crash keeps either the old or the
+    new records.
+
+    Batches are pickled, unless another encoding, like CompactEncoding, is given.
+    Batches written with any encoding can be read back.
+
+    If fsync is True, appends and checkpoints are synced to the disk before they return,
+    so the buffer survives a power loss and not only a crash of the process.
+    """
+
+    CHECKPOINT = "checkpoint"
+    OPEN_BLOCK = ".open"
+
+    def __init__(
+        self,
+        directory: str,
+        segment_records: int = 10000,
+        encoding=None,
+        fsync: bool = True,
+        block_records: int = 100,
+    ):
+        self.directory = directory
+        self.segment_records = segment_records
+        self.block_records = block_records
+        self.encoding = encoding or PickleEncoding()
+        self.fsync = fsync
+        self.lock = RLock()
+        self.segments: dict[str, list[Segment]] = {}
+        self.flushed: dict[str, int] = {}
+
+        os.makedirs(directory, exist_ok=True)
+        for name in os.listdir(directory):
+            if os.path.isdir(os.path.join(directory, name)):
+                self._recover(unquote(name))
+
+    def _key_directory(self, key: str) -> str:
+        return os.path.join(self.directory, quote(key, safe=""))
+
+    def _recover(self, key: str):
+        directory = self._key_directory(key)
+        checkpoint = os.path.join(directory, self.CHECKPOINT)
+        flushed, replaced_until = 0, None
+        if os.path.isfile(checkpoint):
+            with open(checkpoint) as f:
+                values = f.read().split()
+            if values:
+                flushed = int(values[0])
+            if len(values) > 1:
+                replaced_until = int(values[1])
+
+        # A replacement is committed only if the checkpoint has its offset and end
+        for name in os.listdir(directory):
+            path = os.path.join(directory, name)
+            if name.endswith(".log.tmp"):
+                if replaced_until is not None and int(name[:-8]) == flushed:
+                    os.replace(path, path[:-4])
+                else:
+                    os.remove(path)
+            elif name.endswith(self.OPEN_BLOCK + ".tmp"):
+                os.remove(path)
+        if replaced_until is not None:
+            for name in os.listdir(directory):
+                if name.endswith(".log") and flushed != int(name[:-4]) < replaced_until:
+                    os.remove(os.path.join(directory, name))
+                elif name.endswith(self.OPEN_BLOCK) and int(name[:-5]) < replaced_until:
+                    os.remove(os.path.join(directory, name))
+
+        segments = []
+        names = [n for n in os.listdir(directory) if n.endswith((".log", self.OPEN_BLOCK))]
+        for name in sorted(names):
+            path, offset = os.path.join(directory, name), int(name.split(".")[0])
+            # An open block that was already appended to a segment is left over
+            if name.endswith(self.OPEN_BLOCK) and segments and offset < segments[-1].end:
+                os.remove(path)
+                continue
+            segment = Segment(path, offset)
+            for count, _, end in self._frames(segment.path):
+                segment.add_frame(count, end - segment.size)
+            # Drops a frame that was not written completely
+            if os.path.getsize(segment.path) != segment.size:
+                with open(segment.path, "r+b") as f:
+                    f.truncate(segment.size)
+            segments.append(segment)
+
+        # The checkpoint can be behind the deleted segments or ahead of the records that
+        # reached the disk, the records are then sent again or the lost ones skipped
+        if segments:
+            flushed = min(max(flushed, segments[0].offset), segments[-1].end)
+
+        self.segments[key] = segments
+        self.flushed[key] = flushed
+        if replaced_until is not None:
+            self._checkpoint(key, flushed)
+        else:
+            self._delete_flushed(key)
+
+    @staticmethod
+    def _frames(path: str):
+        """Yields the record count, payload and end position of every complete frame"""
+        with open(path, "rb") as f:
+            while True:
+                header = f.read(FRAME_HEADER.size)
+                if len(header) < FRAME_HEADER.size:
+                    return
+                size, count = FRAME_HEADER.unpack(header)
+                payload = f.read(size)
+                if len(payload) < size:
+                    return
+                yield count, payload, f.tell()
+
+    def encode(self, records: list[Record]) -> bytes:
+        return self.encoding.encode(records)
+
+    def decode(self, payload: bytes) -> list[Record]:
+        return self.encoding.decode(payload)
+
+    def append(self, key: str, records: list[Record]):
+        """
+        Adds the records to the open block of the key, or appends them to the last
+        segment with the block once they are at least block_records
+        """
+        if not records:
+            return
+
+        with self.lock:
+            segments = self.segments.setdefault(key, [])
+            self.flushed.setdefault(key, 0)
+            block = None
+            if segments and segments[-1].path.endswith(self.OPEN_BLOCK):
+                block = segments.pop()
+                records = self._read_segment(block, 0) + list(records)
+            offset = block.offset if block is not None else self._end(key)
+
+            if len(records) < self.block_records:
+                segments.append(self._write_block(key, offset, records))
+                return
+
+            self._append_frame(key, offset, records)
+            if block is not None:
+                os.remove(block.path)
+
+    def _append_frame(self, key: str, offset: int, records: list[Record]):
+        """Appends the records, which start at offset, to the last segment of the key"""
+        segments = self.segments[key]
+        if not segments or segments[-1].count >= self.segment_records:
+            segments.append(self._new_segment(key, offset))
+
+        segment = segments[-1]
+        payload = self.encode(records)
+        with open(segment.path, "ab") as f:
+            f.write(FRAME_HEADER.pack(len(payload), len(records)) + payload)
+            self._sync(f)
+        segment.add_frame(len(records), FRAME_HEADER.size + len(payload))
+
+    def _write_block(self, key: str, offset: int, records: list[Record]) -> Segment:
+        """Writes the records as the open block of the key, replacing the previous one"""
+        os.makedirs(self._key_directory(key), exist_ok=True)
+        path = os.path.join(self._key_directory(key), f"{offset:020d}{self.OPEN_BLOCK}")
+        block = Segment(path, offset)
+        payload = self.encode(records)
+        with open(path + ".tmp", "wb") as f:
+            f.write(FRAME_HEADER.pack(len(payload), len(records)) + payload)
+            self._sync(f)
+        os.replace(path + ".tmp", path)
+        self._sync_directory(self._key_directory(key))
+        block.add_frame(len(records), FRAME_HEADER.size + len(payload))
+        return block
+
+    def _sync(self, f):
+        if self.fsync:
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _sync_directory(self, directory: str):
+        """Syncs the renames of a directory, where the platform allows it"""
+        if not self.fsync:
+            return
+        try:
+            fd = os.open(directory, os.O_RDONLY)
+        except OSError:
+            return
+        try:
+            os.fsync(fd)
+        except OSError:
+            pass
+        finally:
+            os.close(fd)
+
+    def _end(self, key: str) -> int:
+        segments = self.segments.get(key)
+        return segments[-1].end if segments else self.flushed.get(key, 0)
+
+    def _new_segment(self, key: str, offset: int) -> Segment:
+        os.makedirs(self._key_directory(key), exist_ok=True)
+        return Segment(os.path.join(self._key_directory(key), f"{offset:020d}.log"), offset)
+
+    def keys(self) -> list[str]:
+        """Returns the keys with records that are not flushed"""
+        with self.lock:
+            return [key for key in self.segments if self.size(key) > 0]
+
+    def size(self, key: str) -> int:
+        """Returns the number of records of the key that are not flushed"""
+        with self.lock:
+            segments = self.segments.get(key)
+            if not segments:
+                return 0
+            return segments[-1].end - self.flushed[key]
+
+    def nbytes(self, key: str) -> int:
+        """
+        Returns the size of the records of the key that are not flushed. The flushed
+        records of a segment that is not deleted yet are not counted.
+        """
+        with self.lock:
+            segments = self.segments.get(key)
+            if not segments:
+                return 0
+            first = segments[0].nbytes_from(self.flushed[key] - segments[0].offset)
+            return first + sum(segment.size for segment in segments[1:])
+
+    def nbytes_of(self, records: list[Record]) -> int:
+        """Returns the size the records take once appended, in the unit of nbytes"""
+        return FRAME_HEADER.size + len(self.encode(records)) if records else 0
+
+    def read(self, key: str, limit: Optional[int] = None) -> list[Record]:
+        """Returns the first records of the key that are not flushed, up to limit"""
+        # The lock is held while the files are read, so they are not deleted meanwhile
+        with self.lock:
+            flushed = self.flushed.get(key, 0)
+            records = []
+            for segment in self.segments.get(key, []):
+                if segment.end <= flushed:
+                    continue
+                offset = segment.offset
+                for count, payload, _ in self._frames(segment.path):
+                    if offset + count > flushed:
+                        frame = self.decode(payload)
+                        records.extend(frame[max(flushed - offset, 0):])
+                        if limit is not None and len(records) >= limit:
+                            return records[:limit]
+                    offset += count
+            return records
+
+    def ack(self, key: str, count: int):
+        """Marks the first count records that were not flushed as flushed"""
+        with self.lock:
+            self._checkpoint(key, self.flushed.get(key, 0) + count)
+
+    def replace(self, key: str, count: int, records: list[Record]):
+        """
+        Replaces the first count records that are not flushed by records. The records
+        after them are only written again if they are in the same segment.
+        """
+        with self.lock:
+            segments = self.segments.get(key, [])
+            end = self.flushed.get(key, 0) + count
+            tail, replaced_until = [], end
+            for segment in segments:
+                if segment.offset < end < segment.end:
+                    tail = self._read_segment(segment, end - segment.offset)
+                    replaced_until = segment.end
+                    break
+
+            records = list(records) + tail
+            if not records:
+                self._checkpoint(key, end)
+                return
+
+            offset = replaced_until - len(records)
+            segment = self._new_segment(key, offset)
+            payload = self.encode(records)
+            with open(segment.path + ".tmp", "wb") as f:
+                f.write(FRAME_HEADER.pack(len(payload), len(records)) + payload)
+                self._sync(f)
+            segment.add_frame(len(records), FRAME_HEADER.size + len(payload))
+
+            self._checkpoint(key, offset, replaced_until)
+            os.replace(segment.path + ".tmp", segment.path)
+            self._sync_directory(self._key_directory(key))
+            for old in self.segments[key]:
+                if old.offset < replaced_until and old.path != segment.path:
+                    os.remove(old.path)
+            kept = [old for old in self.segments[key] if old.offset >= replaced_until]
+            self.segments[key] = [segment] + kept
+            self._checkpoint(key, offset)
+
+    def _read_segment(self, segment: Segment, start: int) -> list[Record]:
+        """Returns the records of the segment from its start-th record"""
+        records, offset = [], 0
+        for count, payload, _ in self._frames(segment.path):
+            if offset + count > start:
+                records.extend(self.decode(payload)[max(start - offset, 0):])
+            offset += count
+        return records
+
+    def _checkpoint(self, key: str, flushed: int, replaced_until: Optional[int] = None):
+        self.flushed[key] = flushed
+        os.makedirs(self._key_directory(key), exist_ok=True)
+        path = os.path.join(self._key_directory(key), self.CHECKPOINT)
+        with open(path + ".tmp", "w") as f:
+            f.write(str(flushed) if replaced_until is None else f"{flushed} {replaced_until}")
+            self._sync(f)
+        os.replace(path + ".tmp", path)
+        self._sync_directory(self._key_directory(key))
+        self._delete_flushed(key)
+
+    def _delete_flushed(self, key: str):
+        segments = self.segments.setdefault(key, [])
+        while segments and segments[0].end <= self.flushed[key]:
+            segment = segments.pop(0)
+            if os.path.isfile(segment.path):
+                os.remove(segment.path)
@@ -1,91 +1,559 @@
-from typing import Callable, Coroutine
+import asyncio
+import inspect
+import math
+import pickle
+import time
 
-from aleph_core.utils.local_storage import LocalStorage
-from aleph_core.utils.exceptions import Error
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock, RLock
+from typing import Callable, Coroutine, Optional
+from weakref import WeakKeyDictionary
+
+from aleph_core.utils.local_storage import JsonLocalStorage, LocalStorage
+from aleph_core.utils.exceptions import Error, Exceptions
 from aleph_core.utils.data import RecordSet
+from aleph_core.utils.rate_limiter import RateLimiter
+from aleph_core.utils.retention import Retention
+from aleph_core.utils.time import current_timestamp
+from aleph_core.utils.typing import Record
+
+LOCK_POLL = 0.01  # seconds between the attempts of a coroutine to take a key lock
+
+
+class LocalStorageBuffer:
+    """
+    Store and forward buffer that keeps a dict with a list of records per key in a
+    local storage, under local_storage_key.
+    """
+
+    def __init__(self, local_storage: LocalStorage, local_storage_key: str):
+        self.local_storage = local_storage
+        self.local_storage_key = local_storage_key
+        self.lock = RLock()  # the dict of all the keys is read, changed and set again
+
+    def append(self, key: str, records: list[Record]):
+        with self.lock:
+            buffer = self.local_storage.get(self.local_storage_key, {})
+            buffer[key] = buffer.get(key, []) + list(records)
+            self.local_storage.set(self.local_storage_key, buffer)
+
+    def keys(self) -> list[str]:
+        buffer = self.local_storage.get(self.local_storage_key, {})
+        return [key for key in buffer if buffer[key]]
+
+    def size(self, key: str) -> int:
+        return len(self.local_storage.get(self.local_storage_key, {}).get(key, []))
+
+    def read(self, key: str, limit: Optional[int] = None) -> list[Record]:
+        records = self.local_storage.get(self.local_storage_key, {}).get(key, [])
+        return list(records if limit is None else records[:limit])
+
+    def nbytes(self, key: str) -> int:
+        """Estimates the size of the records of the key from the first ones"""
+        return self.nbytes_of(self.local_storage.get(self.local_storage_key, {}).get(key, []))
+
+    def nbytes_of(self, records: list[Record]) -> int:
+        """Estimates the size the records take in the buffer, in the unit of nbytes"""
+        if not records:
+            return 0
+        sample = records[:100]
+        return len(pickle.dumps(sample)) * len(records) // len(sample)
+
+    def ack(self, key: str, count: int):
+        self.replace(key, count, [])
+
+    def replace(self, key: str, count: int, records: list[Record]):
+        with self.lock:
+            buffer = self.local_storage.get(self.local_storage_key, {})
+            buffer[key] = list(records) + buffer.get(key, [])[count:]
+            self.local_storage.set(self.local_storage_key, buffer)
+
+
+class EncodedLocalStorageBuffer(LocalStorageBuffer):
+    """
+    Like LocalStorageBuffer, but keeps the records as batches of a record count and the
+    bytes given by the encoding, so the local storage has to support bytes. Appends are
+    added to the last batch, which is encoded again, until it has block_records records,
+    so single records are not encoded one by one. The records of each key are counted
+    as they are added and removed.
+    """
+
+    def __init__(
+        self,
+        local_storage: LocalStorage,
+        local_storage_key: str,
+        encoding,
+        block_records: int = 100,
+    ):
+        if isinstance(local_storage, JsonLocalStorage):
+            raise Exceptions.InvalidArgs("An encoded buffer needs a local storage of bytes")
+        super().__init__(local_storage, local_storage_key)
+        self.encoding = encoding
+        self.block_records = block_records
+        self.sizes: dict[str, int] = {}  # map key: records, read from the batches once
+
+    def _batches(self, key: str) -> list[tuple[int, bytes]]:
+        return self.local_storage.get(self.local_storage_key, {}).get(key, [])
+
+    def append(self, key: str, records: list[Record]):
+        if not records:
+            return
+        with self.lock:
+            size = self.size(key) + len(records)
+            buffer = self.local_storage.get(self.local_storage_key, {})
+            batches = list(buffer.get(key, []))
+            if batches and batches[-1][0] < self.block_records:
+                records = self.encoding.decode(batches.pop()[1]) + list(records)
+            batches.append((len(records), self.encoding.encode(records)))
+            buffer[key] = batches
+            self.local_storage.set(self.local_storage_key, buffer)
+            self.sizes[key] = size
+
+    def size(self, key: str) -> int:
+        with self.lock:
+            size = self.sizes.get(key)
+            if size is None:
+                size = self.sizes[key] = sum(count for count, _ in self._batches(key))
+            return size
+
+    def nbytes(self, key: str) -> int:
+        return sum(len(payload) for _, payload in self._batches(key))
+
+    def nbytes_of(self, records: list[Record]) -> int:
+        return len(self.encoding.encode(records)) if records else 0
+
+    def read(self, key: str, limit: Optional[int] = None) -> list[Record]:
+        records = []
+        for _, payload in self._batches(key):
+            if limit is not None and len(records) >= limit:
+                break
+            records.extend(self.encoding.decode(payload))
+        return records if limit is None else records[:limit]
+
+    def replace(self, key: str, count: int, records: list[Record]):
+        with self.lock:
+            size = self.size(key)
+            buffer = self.local_storage.get(self.local_storage_key, {})
+            batches = list(buffer.get(key, []))
+
+            # Only the batch where count ends is decoded again
+            rest, removed = [], 0
+            while batches and removed < count:
+                batch_size, payload = batches.pop(0)
+                if removed + batch_size > count:
+                    rest = self.encoding.decode(payload)[count - removed:]
+                removed += batch_size
+
+            records = list(records) + rest
+            if records:
+                batches.insert(0, (len(records), self.encoding.encode(records)))
+            buffer[key] = batches
+            self.local_storage.set(self.local_storage_key, buffer)
+            self.sizes[key] = size - removed + len(records)
 
 
 class StoreAndForward:
     """
     Class that executes the write function and, if it fails, stores the data on a
-    local storage.
+    buffer. By default the buffer is kept in a local storage, a SegmentLogBuffer can be
+    given instead to append the data to files. If an encoding, like CompactEncoding, is
+    given, the local storage keeps the data encoded in batches.
+
+    The buffer of a key is written in chunks of up to max_records_per_write records and
+    each chunk is removed from the buffer once written, so a failure only leaves the
+    rest of the buffer to retry. If max_bytes_per_second is set, the writes are delayed
+    to keep the size of the written data, estimated from the size of the buffer, below
+    it. flush_all and flush_all_async flush up to max_concurrent_flushes keys at once and
+    the chunks of each key are written in order. flush_all_async runs a write function
+    that is not a coroutine on the default executor of the loop, so it does not block
+    the loop and the keys are written in parallel.
+
+    Only one flush of a key runs at a time, a second one waits for the first, so every
+    chunk is written and removed from the buffer once.
+
+    If a Retention is given, its limits are enforced when data is added to the buffer
+    and the evicted records are counted by key in evicted. The oldest records of a key
+    are not evicted while the key is being flushed.
     """
 
     LOCAL_STORAGE_KEY = "STORE_AND_FORWARD"
 
     def __init__(
-        self, name: str, write: Callable | Coroutine, local_storage: LocalStorage = None
+        self,
+        name: str,
+        write: Callable | Coroutine,
+        local_storage: LocalStorage = None,
+        buffer=None,
+        max_records_per_write: Optional[int] = None,
+        max_bytes_per_second: Optional[float] = None,
+        max_concurrent_flushes: int = 1,
+        retention: Optional[Retention] = None,
+        encoding=None,
     ):
         self.name = name
         self.local_storage = local_storage or LocalStorage()
         self.write = write
+        if buffer is None and encoding is not None:
+            buffer = EncodedLocalStorageBuffer(
+                self.local_storage, self.local_storage_key, encoding
+            )
+        self.buffer = buffer or LocalStorageBuffer(self.local_storage, self.local_storage_key)
+        self.max_records_per_write = max_records_per_write
+        self.max_concurrent_flushes = max_concurrent_flushes
+        self.rate_limiter = None
+        if max_bytes_per_second is not None:
+            self.rate_limiter = RateLimiter(max_bytes_per_second)
+        self.retention = retention
+        self.evicted: dict[str, int] = {}
+        self.__locks = {}  # map key: lock held while the key is flushed or evicted
+        self.__locks_lock = Lock()
+        self.__async_locks = WeakKeyDictionary()  # map event loop: {key: asyncio lock}
+        self.__oldest = {}  # map key: t of the oldest record in the buffer
+        self.__usage = None  # map key: (records, bytes) in the buffer, with a retention
+        self.__usage_lock = RLock()
+        self.__total_records = 0
+        self.__total_bytes = 0
 
     @property
     def local_storage_key(self):
         return f"{self.LOCAL_STORAGE_KEY}_{self.name}"
 
+    def _record_bytes(self, key: str, pending: int) -> float:
+        """Returns the average size of the records of the key, for the rate limit"""
+        if self.rate_limiter is None or pending <= 0:
+            return 0
+        return self.buffer.nbytes(key) / max(self.buffer.size(key), 1)
+
+    def _next_chunk(
+        self, key: str, pending: int, record_bytes: float
+    ) -> tuple[list[Record], float]:
+        """Returns the next records to write and the seconds to wait before"""
+        limit = pending
+        if self.max_records_per_write is not None:
+            limit = min(limit, self.max_records_per_write)
+        records = self.buffer.read(key, limit)
+
+        delay = 0
+        if self.rate_limiter is not None and records:
+            delay = self.rate_limiter.reserve(len(records) * record_bytes)
+        return records, delay
+
+    def _ack(self, key: str, count: int, records: list[Record] = None):
+        """Removes the first count records of the key, replacing them by records"""
+        if records:
+            self.buffer.replace(key, count, records)
+        else:
+            self.buffer.ack(key, count)
+        self.__oldest.pop(key, None)
+        if self.retention is not None:
+            self._update_usage(key)
+
+    def _lock(self, key: str) -> Lock:
+        with self.__locks_lock:
+            lock = self.__locks.get(key)
+            if lock is None:
+                lock = self.__locks[key] = Lock()
+            return lock
+
+    def _flush(self, key: str, progress: dict[str, int]):
+        # Records added while flushing are left for the next flush
+        with self._lock(key):
+            pending = self.buffer.size(key)
+            record_bytes = self._record_bytes(key, pending)
+            while pending > 0:
+                records, delay = self._next_chunk(key, pending, record_bytes)
+                if not records:
+                    break
+                if delay:
+                    time.sleep(delay)
+                self.write(key, RecordSet(records))
+                self._ack(key, len(records))
+                progress[key] = progress.get(key, 0) + len(records)
+                pending -= len(records)
+
+    async def _flush_async(self, key: str, progress: dict[str, int]):
+        # The coroutines of a loop wait in order on an asyncio lock, and only the first
+        # one polls the key lock, which can be held by a thread
+        async_locks = self.__async_locks.setdefault(asyncio.get_running_loop(), {})
+        async with async_locks.setdefault(key, asyncio.Lock()):
+            lock = self._lock(key)
+            while not lock.acquire(blocking=False):
+                await asyncio.sleep(LOCK_POLL)
+            try:
+                await self.__flush_locked_async(key, progress)
+            finally:
+                lock.release()
+
+    async def __flush_locked_async(self, key: str, progress: dict[str, int]):
+        pending = self.buffer.size(key)
+        record_bytes = self._record_bytes(key, pending)
+        while pending > 0:
+            records, delay = self._next_chunk(key, pending, record_bytes)
+            if not records:
+                break
+            if delay:
+                await asyncio.sleep(delay)
+            if inspect.iscoroutinefunction(self.write):
+                result = self.write(key, RecordSet(records))
+            else:
+                loop = asyncio.get_running_loop()
+                result = await loop.run_in_executor(None, self.write, key, RecordSet(records))
+            if inspect.isawaitable(result):
+                await result
+            self._ack(key, len(records))
+            progress[key] = progress.get(key, 0) + len(records)
+            pending -= len(records)
+
+    def _append(self, key: str, records: list[Record]):
+        retention = self.retention
+        if retention is not None and retention.policy == "drop_newest":
+            records = self._admit(key, records)
+        self.buffer.append(key, records)
+
+        if retention is not None:
+            self._update_usage(key)
+            self._evict_expired(key)
+            if retention.policy != "drop_newest":
+                self._evict(key)
+
+    def _count_evicted(self, key: str, count: int):
+        if count > 0:
+            self.evicted[key] = self.evicted.get(key, 0) + count
+
+    def _usage(self) -> dict[str, tuple[int, int]]:
+        """
+        Returns the records and bytes of each key in the buffer. They are read from the
+        buffer the first time, and then only for the keys that change.
+        """
+        with self.__usage_lock:
+            if self.__usage is None:
+                self.__usage = {}
+                for key in self.buffer.keys():
+                    self._update_usage(key)
+            return self.__usage
+
+    def _update_usage(self, key: str):
+        """Reads the size of the key from the buffer again and updates the totals"""
+        with self.__usage_lock:
+            usage = self._usage()
+            old_records, old_bytes = usage.pop(key, (0, 0))
+            records = self.buffer.size(key)
+            nbytes = 0
+            if records and self.retention.has_byte_limits:
+                nbytes = self.buffer.nbytes(key)
+            if records:
+                usage[key] = (records, nbytes)
+            self.__total_records += records - old_records
+            self.__total_bytes += nbytes - old_bytes
+
+    def _totals(self) -> tuple[int, int]:
+        """Returns the number of records and bytes in the buffer"""
+        with self.__usage_lock:
+            self._usage()
+            return self.__total_records, self.__total_bytes
+
+    def _admit(self, key: str, records: list[Record]) -> list[Record]:
+        """Returns the first new records that fit in the limits"""
+        retention = self.retention
+        if not records:
+            return records
+
+        room = len(records)
+        size, nbytes = self._usage().get(key, (0, 0))
+        free_bytes = math.inf
+        if retention.max_records is not None:
+            room = min(room, retention.max_records - size)
+        if retention.max_bytes is not None:
+            free_bytes = retention.max_bytes - nbytes
+        if retention.has_total_limits:
+            total_records, total_bytes = self._totals()
+            if retention.max_total_records is not None:
+                room = min(room, retention.max_total_records - total_records)
+            if retention.max_total_bytes is not None:
+                free_bytes = min(free_bytes, retention.max_total_bytes - total_bytes)
+
+        # The size is measured like the buffer does, a part of a batch can take more
+        # bytes per record than the whole, so the estimate is checked until it fits
+        room = max(room, 0)
+        if free_bytes != math.inf:
+            while room > 0:
+                room_bytes = self.buffer.nbytes_of(records[:room])
+                if room_bytes <= free_bytes:
+                    break
+                room = min(room - 1, int(room * max(free_bytes, 0) / room_bytes))
+
+        self._count_evicted(key, len(records) - room)
+        return records[:room]
+
+    def _excess(self, key: str) -> tuple[Optional[str], int]:
+        """
+        Returns the key to evict records from, if a limit is exceeded, and the number of
+        records over the limit (which is estimated for the limits in bytes).
+        """
+        retention = self.retention
+        usage = self._usage()
+        if not self._lock(key).locked():
+            (size, nbytes), excess = usage.get(key, (0, 0)), 0
+            if retention.max_records is not None:
+                excess = max(excess, size - retention.max_records)
+            if retention.max_bytes is not None and size:
+                excess = max(excess, math.ceil((nbytes - retention.max_bytes) * size / nbytes))
+            if excess > 0:
+                return key, excess
+
+        if not retention.has_total_limits:
+            return None, 0
+
+        total_records, total_bytes = self._totals()
+        excess = 0
+        if retention.max_total_records is not None:
+            excess = max(excess, total_records - retention.max_total_records)
+        if retention.max_total_bytes is not None and total_records:
+            over = total_bytes - retention.max_total_bytes
+            excess = max(excess, math.ceil(over * total_records / max(total_bytes, 1)))
+        if excess <= 0:
+            return None, 0
+
+        # The largest key that is not being flushed pays for the global limits
+        with self.__usage_lock:
+            keys = [k for k in usage if not self._lock(k).locked()]
+        if not keys:
+            return None, 0
+        return max(keys, key=lambda k: usage.get(k, (0, 0))[0]), excess
+
+    def _evict(self, key: str):
+        """Evicts records until the limits are met, following the retention policy"""
+        while True:
+            victim, excess = self._excess(key)
+            if victim is None:
+                return
+
+            # The victim is skipped if a flush started after it was chosen
+            lock = self._lock(victim)
+            if not lock.acquire(blocking=False):
+                return
+            try:
+                self._evict_records(victim, excess)
+            finally:
+                lock.release()
+
+    def _evict_records(self, key: str, excess: int):
+        size = self.buffer.size(key)
+        if self.retention.policy == "downsample" and size >= 4:
+            count = size // 2
+            oldest = self.buffer.read(key, count)
+            kept = sorted(oldest, key=lambda record: record.get("t") or 0)[::2]
+            self._ack(key, count, kept)
+            self._count_evicted(key, count - len(kept))
+        else:
+            count = min(excess, size)
+            self._ack(key, count)
+            self._count_evicted(key, count)
+
+    def _evict_expired(self, key: str):
+        """Removes the oldest records of the key that are older than max_age"""
+        if self.retention.max_age is None:
+            return
+        lock = self._lock(key)
+        if not lock.acquire(blocking=False):
+            return
+        try:
+            self._evict_older(key)
+        finally:
+            lock.release()
+
+    def _evict_older(self, key: str):
+        limit = current_timestamp() - self.retention.max_age * 1000
+        oldest = self.__oldest.get(key)
+        if oldest is None:
+            head = self.buffer.read(key, 1)
+            oldest = head[0].get("t") if head else None
+            if oldest is None:
+                return
+            self.__oldest[key] = oldest
+        if oldest >= limit:
+            return
+
+        while True:
+            records = self.buffer.read(key, 1000)
+            expired = 0
+            for record in records:
+                t = record.get("t")
+                if t is None or t >= limit:
+                    break
+                expired += 1
+            if expired:
+                self._ack(key, expired)
+                self._count_evicted(key, expired)
+            if expired < len(records) or not records:
+                return
+
     def flush_all(self) -> list[Error]:
         """
-        Tries to call the write function for all keys in the buffer.
+        Tries to call the write function for all keys in the buffer, up to
+        max_concurrent_flushes keys at once on threads.
         Returns a list of the errors raised for each key.
         """
         try:
-            buffer = self.local_storage.get(self.local_storage_key, {})
+            keys = self.buffer.keys()
         except Exception as e:
             return [Error(e)]
 
-        errors = []
-        for key in buffer:
-            data = RecordSet(buffer.get(key))
+        errors, progress = [], {}
+
+        def flush(key: str):
             try:
-                self.write(key, data)
-                buffer[key] = []
-                self.local_storage.set(self.local_storage_key, buffer)
+                self._flush(key, progress)
             except Exception as e:
-                errors.append(Error(e, key=key, data=data))
+                flushed, pending = progress.get(key, 0), self.buffer.size(key)
+                errors.append(Error(e, key=key, flushed=flushed, pending=pending))
 
+        workers = min(self.max_concurrent_flushes, len(keys))
+        if workers > 1:
+            with ThreadPoolExecutor(workers, thread_name_prefix="aleph-flush") as executor:
+                list(executor.map(flush, keys))
+        else:
+            for key in keys:
+                flush(key)
         return errors
 
+    def add(self, key: str, data: RecordSet):
+        """
+        Adds data to the buffer without writing it. It is written with the next flush.
+        """
+        self._append(key, list(data))
+
     def add_and_flush(self, key: str, data: RecordSet):
         """
         Add data to buffer and try to write.
         If it fails, it raises an exeception.
         """
-        buffer = self.local_storage.get(self.local_storage_key, {})
-        if key not in buffer:
-            buffer[key] = []
-        buffer[key] = buffer[key] + list(data)
-        self.local_storage.set(self.local_storage_key, buffer)
-
-        self.write(key, RecordSet(buffer.get(key)))
-        buffer[key] = []
-        self.local_storage.set(self.local_storage_key, buffer)
+        self._append(key, list(data))
+        self._flush(key, {})
 
     async def flush_all_async(self) -> list[Error]:
+        """
+        Like flush_all, but flushes up to max_concurrent_flushes keys at once.
+        """
         try:
-            buffer = self.local_storage.get(self.local_storage_key, {})
+            keys = self.buffer.keys()
         except Exception as e:
             return [Error(e)]
 
-        errors = []
-        for key in buffer:
-            data = RecordSet(buffer.get(key))
-            try:
-                await self.write(key, data)
-                buffer[key] = []
-                self.local_storage.set(self.local_storage_key, buffer)
-            except Exception as e:
-                errors.append(Error(e, key=key, data=data))
+        errors, progress = [], {}
+        semaphore = asyncio.Semaphore(max(self.max_concurrent_flushes, 1))
 
+        async def flush(key: str):
+            async with semaphore:
+                try:
+                    await self._flush_async(key, progress)
+                except Exception as e:
+                    flushed, pending = progress.get(key, 0), self.buffer.size(key)
+                    errors.append(Error(e, key=key, flushed=flushed, pending=pending))
+
+        await asyncio.gather(*(flush(key) for key in keys))
         return errors
 
     async def add_and_flush_async(self, key: str, data: RecordSet):
-        buffer = self.local_storage.get(self.local_storage_key, {})
-        if key not in buffer:
-            buffer[key] = []
-        buffer[key] = buffer[key] + list(data)
-        self.local_storage.set(self.local_storage_key, buffer)
-
-        await self.write(key, RecordSet(buffer.get(key)))
-        buffer[key] = []
-        self.local_storage.set(self.local_storage_key, buffer)
+        self._append(key, list(data))
+        await self._flush_async(key, {})
@@ -1,6 +1,23 @@
 import time
+import zlib
 import asyncio
-import croniter
+
+from typing import Optional
+
+from aleph_core.utils.cron_schedule import cron_schedule
+
+
+def spread_offset(key: str, time_step: float) -> float:
+    """
+    Returns an offset between 0 and time_step that is always the same for a key, so
+    the keys with the same time_step are spread across the period
+    """
+    return zlib.crc32(key.encode()) % 1000 / 1000 * time_step
+
+
+def next_deadline(t: float, time_step: float, offset: float = 0) -> float:
+    """Returns the first multiple of time_step (shifted by offset) after t"""
+    return ((t - offset) // time_step + 1) * time_step + offset
 
 
 class WaitOneStep:
@@ -11,25 +28,48 @@ class WaitOneStep:
 
     The time_Step can be the sleep time in seconds or a cron job expression
     that sleeps until the next event.
+
+    If aligned is True, a numeric time_step wakes up on the multiples of time_step of the
+    clock (plus the spread_offset of spread_key if given) instead of time_step after the
+    previous wait, so the time spent between waits does not shift the schedule.
     """
 
-    def __init__(self, time_step=1):
+    def __init__(self, time_step=1, aligned: bool = False, spread_key: Optional[str] = None):
         self.first_step = True
         self.time_step = time_step
         self.t = time.time()
+        self.aligned = aligned and not isinstance(time_step, str)
+        self.offset = spread_offset(spread_key, time_step) if spread_key and self.aligned else 0
 
         if isinstance(time_step, str):
-            self.cron = croniter.croniter(time_step, time.time())
+            self.cron = cron_schedule(time_step)
+
+    def _aligned_sleep_time(self) -> float:
+        """
+        Returns the seconds until the next deadline. If it already passed, returns 0 and
+        the following deadline is the next multiple of time_step.
+        """
+        now = time.time()
+        deadline = self.t + self.time_step
+        if deadline <= now:
+            self.t = next_deadline(now, self.time_step, self.offset) - self.time_step
+            return 0
+        self.t = deadline
+        return deadline - now
 
     def wait(self):
         if self.first_step:
             self.t = time.time()
             self.first_step = False
+            if self.aligned:
+                self.t = next_deadline(self.t, self.time_step, self.offset) - self.time_step
             return
 
-        if isinstance(self.time_step, str):
-            c = self.cron.get_next()
-            time.sleep(c - time.time())
+        if self.aligned:
+            time.sleep(self._aligned_sleep_time())
+        elif isinstance(self.time_step, str):
+            c = self.cron.next_after(time.time())
+            time.sleep(max(c - time.time(), 0))
         else:
             delta = time.time() - self.t
             if delta > self.time_step:
@@ -43,10 +83,14 @@ class WaitOneStep:
         if self.first_step:
             self.t = time.time()
             self.first_step = False
+            if self.aligned:
+                self.t = next_deadline(self.t, self.time_step, self.offset) - self.time_step
             return
 
-        if isinstance(self.time_step, str):
-            c = self.cron.get_next()
+        if self.aligned:
+            await asyncio.sleep(self._aligned_sleep_time())
+        elif isinstance(self.time_step, str):
+            c = self.cron.next_after(time.time())
             await asyncio.sleep(c - time.time())
 
         else:
@@ -0,0 +1,103 @@
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from threading import Condition
+from typing import Callable
+
+from aleph_core.utils.exceptions import Exceptions
+
+
+class WorkerPool:
+    """
+    Runs functions on a bounded number of threads. Calls that find every worker busy
+    wait in a queue of up to max_queue calls. When the queue is full, the policy
+    decides what happens: "block" waits for a free slot, "drop_oldest" discards the
+    oldest queued call and "raise" raises Exceptions.QueueFull.
+    """
+
+    POLICIES = ("block", "drop_oldest", "raise")
+
+    def __init__(self, max_workers: int = 8, max_queue: int = 1000, policy: str = "block"):
+        if policy not in self.POLICIES:
+            raise Exceptions.InvalidArgs(f"Policy must be one of {self.POLICIES}")
+
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.policy = policy
+        self.executor = ThreadPoolExecutor(max_workers, thread_name_prefix="aleph-worker")
+        self.condition = Condition()
+        self.queue: deque[tuple[Future, Callable, tuple, dict]] = deque()
+        self.active = 0
+
+        self.submitted = 0
+        self.completed = 0
+        self.dropped = 0
+        self.rejected = 0
+        self.peak_queue = 0
+
+    def submit(self, function: Callable, *args, **kwargs) -> Future:
+        """Runs the function on a worker, or queues it if every worker is busy"""
+        future = Future()
+        with self.condition:
+            while True:
+                if self.active < self.max_workers:
+                    self.active += 1
+                    self.submitted += 1
+                    self._start(future, function, args, kwargs)
+                    return future
+                if len(self.queue) < self.max_queue:
+                    break
+
+                if self.policy == "raise":
+                    self.rejected += 1
+                    raise Exceptions.QueueFull(f"{len(self.queue)} calls are waiting")
+                if self.policy == "drop_oldest":
+                    dropped, *_ = self.queue.popleft()
+                    dropped.cancel()
+                    self.dropped += 1
+                    break
+                self.condition.wait()
+
+            self.queue.append((future, function, args, kwargs))
+            self.submitted += 1
+            self.peak_queue = max(self.peak_queue, len(self.queue))
+            return future
+
+    def _start(self, future: Future, function: Callable, args: tuple, kwargs: dict):
+        self.executor.submit(self._run, future, function, args, kwargs)
+
+    def _run(self, future: Future, function: Callable, args: tuple, kwargs: dict):
+        while True:
+            if future.set_running_or_notify_cancel():
+                try:
+                    future.set_result(function(*args, **kwargs))
+                except BaseException as e:
+                    future.set_exception(e)
+
+            # The worker takes the next queued call, so the order of the queue is kept
+            with self.condition:
+                self.completed += 1
+                if not self.queue:
+                    self.active -= 1
+                    self.condition.notify_all()
+                    return
+                future, function, args, kwargs = self.queue.popleft()
+                self.condition.notify_all()
+
+    def stats(self) -> dict:
+        """Returns the saturation metrics of the pool"""
+        with self.condition:
+            return {
+                "max_workers": self.max_workers,
+                "active": self.active,
+                "queued": len(self.queue),
+                "max_queue": self.max_queue,
+                "peak_queue": self.peak_queue,
+                "saturated": self.active >= self.max_workers,
+                "submitted": self.submitted,
+                "completed": self.completed,
+                "dropped": self.dropped,
+                "rejected": self.rejected,
+            }
+
+    def shutdown(self, wait: bool = True):
+        self.executor.shutdown(wait=wait)
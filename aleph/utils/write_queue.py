@@ -0,0 +1,68 @@
+from threading import Lock
+from typing import Optional, Type
+
+from aleph_core.utils.typing import Record
+
+
+class WriteQueue:
+    """
+    Coalesces the records written to each key, so they are written in batches of up to
+    max_batch_records records instead of one write per call. The model of the last
+    records added to a key is kept, so the batches can be validated with it.
+    """
+
+    def __init__(self, max_batch_records: int):
+        self.max_batch_records = max_batch_records
+        self.lock = Lock()
+        self.pending: dict[str, list[Record]] = {}
+        self.batch_ids: dict[str, int] = {}
+        self.models: dict[str, Optional[Type]] = {}
+
+    def add(
+        self, key: str, records: list[Record], model: Optional[Type] = None
+    ) -> tuple[list[list[Record]], Optional[int]]:
+        """
+        Adds the records to the pending batch of the key. Returns the batches that are
+        full, and the id of the batch that was started, if any, so it can be flushed by
+        id when its latency runs out.
+        """
+        with self.lock:
+            self.models[key] = model
+            pending = self.pending.setdefault(key, [])
+            started = len(pending) == 0 and len(records) > 0
+            pending.extend(records)
+
+            full = []
+            while len(pending) >= self.max_batch_records:
+                full.append(pending[: self.max_batch_records])
+                del pending[: self.max_batch_records]
+                self.batch_ids[key] = self.batch_ids.get(key, 0) + 1
+                started = len(pending) > 0
+
+            return full, self.batch_ids.get(key, 0) if started else None
+
+    def take(self, key: str, batch_id: Optional[int] = None) -> list[Record]:
+        """
+        Removes and returns the pending records of the key. If batch_id is given, only
+        returns them if they still belong to that batch.
+        """
+        with self.lock:
+            if batch_id is not None and self.batch_ids.get(key, 0) != batch_id:
+                return []
+            records = self.pending.pop(key, [])
+            if records:
+                self.batch_ids[key] = self.batch_ids.get(key, 0) + 1
+            return records
+
+    def model(self, key: str) -> Optional[Type]:
+        """Returns the model of the records of the key"""
+        with self.lock:
+            return self.models.get(key)
+
+    def keys(self) -> list[str]:
+        with self.lock:
+            return [key for key, records in self.pending.items() if records]
+
+    def __len__(self) -> int:
+        with self.lock:
+            return sum(len(records) for records in self.pending.values())
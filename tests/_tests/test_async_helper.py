@@ -0,0 +1,50 @@
+import asyncio
+import threading
+
+from aleph_core.utils.async_helper import AsyncHelper
+
+
+def test_async_helper_run_reuses_the_loop():
+    """Test run keeps one loop per thread instead of creating one per call"""
+    async_helper = AsyncHelper()
+
+    async def running_loop():
+        return asyncio.get_running_loop()
+
+    loops = [async_helper.run(running_loop()) for _ in range(2)]
+
+    def run_on_other_thread():
+        loops.append(async_helper.run(running_loop()))
+
+    thread = threading.Thread(target=run_on_other_thread)
+    thread.start()
+    thread.join()
+    assert loops[0] is loops[1] is not loops[2]
+    async_helper.close()
+
+
+def test_async_helper_close_cancels_pending_tasks():
+    """Test close cancels the tasks left on the loops and closes them"""
+    async_helper = AsyncHelper()
+    cancelled = threading.Event()
+
+    async def forever():
+        try:
+            await asyncio.sleep(60)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    async def start_task():
+        return asyncio.ensure_future(asyncio.sleep(60))
+
+    task = async_helper.run(start_task())
+    async_helper.run_coroutine_threadsafe(forever())
+    main_loop = async_helper.main_loop
+    run_loop = task.get_loop()
+
+    async_helper.close()
+    assert cancelled.wait(1)
+    assert task.cancelled()
+    assert main_loop.is_closed() and run_loop.is_closed()
+    assert async_helper.main_loop is None
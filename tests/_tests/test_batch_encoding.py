@@ -0,0 +1,31 @@
+from aleph_core.utils.batch_encoding import CompactEncoding, PickleEncoding
+
+
+def get_records():
+    return [
+        {"t": 1000 + i * 1000, "id_": f"sensor_{i % 4}", "temperature": 20.5 + i, "ok": True}
+        for i in range(200)
+    ]
+
+
+def test_compact_encoding():
+    """Test batches are decoded as they were and are smaller than pickled ones"""
+    records = get_records()
+    records[3] = {"t": None, "extra": "x"}
+    records[4]["t"] = 1.5
+
+    for compression in ["none", "zlib"]:
+        encoding = CompactEncoding(compression)
+        payload = encoding.encode(records)
+        assert encoding.decode(payload) == records
+
+    records = get_records()
+    payload = CompactEncoding().encode(records)
+    assert len(payload) * 5 < len(PickleEncoding().encode(records))
+
+
+def test_decode_any_encoding():
+    """Test both encodings decode the batches written by the other"""
+    records = get_records()
+    assert PickleEncoding().decode(CompactEncoding().encode(records)) == records
+    assert CompactEncoding().decode(PickleEncoding().encode(records)) == records
@@ -0,0 +1,68 @@
+import time
+
+from aleph_core.utils.circuit_breaker import CircuitBreaker
+
+
+def test_circuit_breaker_opens_after_failures():
+    """Test the circuit opens after failure_threshold failures and rejects attempts"""
+    circuit_breaker = CircuitBreaker(failure_threshold=2, base_delay=0.1, jitter=0)
+
+    circuit_breaker.record_failure()
+    assert circuit_breaker.allow()
+    circuit_breaker.record_failure()
+    assert circuit_breaker.state == CircuitBreaker.OPEN
+    assert not circuit_breaker.allow()
+    assert circuit_breaker.stats()["rejected"] == 1
+
+
+def test_circuit_breaker_half_open():
+    """Test a single attempt is allowed after the backoff, which closes or reopens it"""
+    circuit_breaker = CircuitBreaker(failure_threshold=1, base_delay=0.1, jitter=0)
+    circuit_breaker.record_failure()
+
+    time.sleep(0.1)
+    assert circuit_breaker.allow()
+    assert circuit_breaker.state == CircuitBreaker.HALF_OPEN
+    assert not circuit_breaker.allow()
+
+    # Failing again doubles the backoff
+    circuit_breaker.record_failure()
+    assert 0.15 < circuit_breaker.retry_in() <= 0.2
+    time.sleep(0.2)
+    assert circuit_breaker.allow()
+    circuit_breaker.record_success()
+    assert circuit_breaker.state == CircuitBreaker.CLOSED
+
+    stats = circuit_breaker.stats()
+    assert (stats["opened"], stats["half_opened"], stats["closed"]) == (2, 2, 1)
+
+
+def test_circuit_breaker_backoff_jitter():
+    """Test the backoff is capped by max_delay and reduced by up to jitter"""
+    circuit_breaker = CircuitBreaker(base_delay=1, max_delay=8, jitter=0.5)
+    circuit_breaker.consecutive_opens = 10
+
+    delays = [circuit_breaker.backoff() for _ in range(100)]
+    assert all(4 <= delay <= 8 for delay in delays)
+    assert len(set(delays)) > 1
+
+
+def test_circuit_breaker_ignores_late_failures():
+    """Test failures while open do not reopen it, and release keeps a half open state"""
+    circuit_breaker = CircuitBreaker(failure_threshold=1, base_delay=0.1, jitter=0)
+    circuit_breaker.record_failure()
+    retry_in = circuit_breaker.retry_in()
+
+    circuit_breaker.record_failure()
+    circuit_breaker.record_failure()
+    assert circuit_breaker.retry_in() <= retry_in
+    assert circuit_breaker.stats()["opened"] == 1
+
+    time.sleep(0.1)
+    assert circuit_breaker.allow()
+    circuit_breaker.release()
+    assert circuit_breaker.state == CircuitBreaker.HALF_OPEN
+    assert circuit_breaker.allow()
+    circuit_breaker.record_failure()
+    assert circuit_breaker.stats()["opened"] == 2
+    assert 0.15 < circuit_breaker.retry_in() <= 0.2
@@ -1,4 +1,7 @@
+import asyncio
+import os
 import pytest
+import threading
 import time
 
 from aleph_core.connections.testing.random_connection import RandomConnection
@@ -6,7 +9,10 @@ from aleph_core.connections.testing.simple_connection import SimpleConnection
 from aleph_core.connections.connection import Connection
 from aleph_core.utils.exceptions import Exceptions
 from aleph_core.utils.exceptions import Error
+from aleph_core.utils.circuit_breaker import CircuitBreaker
 from aleph_core.utils.data import RecordSet
+from aleph_core.utils.segment_log import SegmentLogBuffer
+from aleph_core import Model
 
 
 class SomeConnection(Connection):
@@ -115,3 +121,163 @@ def test_subscribe_async():
 
 def test_write_async():
     pass
+
+
+def test_trusted_read_skips_validation():
+    """Test the records read from a trusted key are adopted without copying them"""
+    some_connection = SomeConnection()
+    some_connection.trusted_keys = {SomeConnection.ONLY_VALID_KEY}
+
+    result = some_connection.safe_read(SomeConnection.ONLY_VALID_KEY)
+    assert some_connection.is_trusted(SomeConnection.ONLY_VALID_KEY)
+    assert not some_connection.is_trusted("INVALID_KEY")
+    assert result[0]["r"] == 1
+
+
+def test_safe_write_runs_without_event_loop():
+    """Test a sync safe_write writes on the calling thread, without an event loop"""
+    calls = []
+
+    class LoopConnection(SimpleConnection):
+        def write(self, key, data):
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:
+                loop = None
+            calls.append((threading.get_ident(), loop))
+            super().write(key, data)
+
+    connection = LoopConnection()
+    connection.safe_write("no_loop", {"r": 1})
+    connection.safe_write("no_loop", {"r": 2})
+    assert calls == [(threading.get_ident(), None)] * 2
+    assert [record["r"] for record in connection.written["no_loop"]] == [1, 2]
+
+
+def test_write_async_keeps_the_order_and_model_of_batches():
+    """Test the batches of a key are written in order by multi_thread connections"""
+    written = []
+    done = threading.Event()
+
+    class Point(Model):
+        a: int
+
+    class SlowConnection(SimpleConnection):
+        multi_thread = True
+        max_batch_records = 2
+
+        def write(self, key, data):
+            time.sleep(0.05 if data[0]["a"] == 0 else 0)
+            written.append((data.model, [record["a"] for record in data]))
+            if len(written) == 3:
+                done.set()
+
+    connection = SlowConnection()
+    connection.open()
+    for i in range(6):
+        connection.write_async("ordered", RecordSet([{"a": i}], model=Point))
+
+    assert done.wait(2)
+    assert written == [(Point, [0, 1]), (Point, [2, 3]), (Point, [4, 5])]
+
+
+class GroupConnection(Connection):
+    multi_thread = True
+    group_subscriptions = True
+    time_step = 0.02
+
+    def __init__(self):
+        super().__init__()
+        self.reads = []
+        self.received = {}
+        self.errors = []
+
+    def read(self, key, **kwargs):
+        if key == "invalid":
+            raise Exceptions.InvalidKey(key)
+        return [{"key": key}]
+
+    def read_many(self, keys, **kwargs):
+        self.reads.append(sorted(keys))
+        return super().read_many(keys, **kwargs)
+
+    def on_new_data(self, key, data):
+        self.received[key] = self.received.get(key, 0) + 1
+
+    def on_error(self, error):
+        self.errors.append(error)
+
+
+def test_group_subscriptions_read_keys_together():
+    """Test the keys with the same time_step are read with one read_many"""
+    connection = GroupConnection()
+    connection.subscribe_async("a", 0.02)
+    connection.subscribe_async("b", 0.02)
+    time.sleep(0.2)
+    connection.unsubscribe("a")
+    connection.unsubscribe("b")
+
+    assert ["a", "b"] in connection.reads
+    assert connection.received["a"] > 0 and connection.received["b"] > 0
+
+
+def test_safe_read_many_isolates_failing_keys():
+    """Test a key that fails is reported without losing the other keys"""
+    connection = GroupConnection()
+    results = connection.safe_read_many(["a", "invalid", "b"])
+
+    assert results["invalid"] is None
+    assert results["a"][0]["key"] == "a" and results["b"][0]["key"] == "b"
+    assert len(connection.errors) == 1
+    assert connection.errors[0].args["key"] == "invalid"
+
+
+def test_group_subscriptions_use_the_delay_of_each_key():
+    """Test a group waits for the largest subscription_delay of its keys"""
+    connection = GroupConnection()
+    connection.subscription_delay = lambda key: 0.2 if key == "slow" else 0
+    connection.subscribe_async("fast", 0.02)
+    connection.subscribe_async("slow", 0.02)
+    time.sleep(0.5)
+    connection.unsubscribe("fast")
+    connection.unsubscribe("slow")
+
+    assert 1 <= len(connection.reads) <= 3
+
+
+def test_invalid_key_does_not_close_a_half_open_circuit():
+    """Test errors that do not come from the connection leave the circuit as it is"""
+
+    class FailingConnection(Connection):
+        circuit_breaker = True
+
+        def read(self, key, **kwargs):
+            if key == "invalid":
+                raise Exceptions.InvalidKey(key)
+            raise ConnectionError("down")
+
+    connection = FailingConnection()
+    connection.__circuit_breaker__ = CircuitBreaker(failure_threshold=1, base_delay=0.05, jitter=0)
+    connection.safe_read("key")
+    assert connection.circuit_state["state"] == CircuitBreaker.OPEN
+
+    time.sleep(0.05)
+    connection.safe_read("invalid")
+    assert connection.circuit_state["state"] == CircuitBreaker.HALF_OPEN
+    connection.safe_read("key")
+    assert connection.circuit_state["state"] == CircuitBreaker.OPEN
+
+
+def test_store_and_forward_directory_selects_the_segment_log(tmp_path):
+    """Test store_and_forward_directory keeps the buffer of each client in segment files"""
+
+    class LogConnection(SimpleConnection):
+        store_and_forward = True
+        store_and_forward_directory = str(tmp_path)
+
+    connection = LogConnection("client/1")
+    connection.store("key", RecordSet({"r": 1}))
+    buffer = connection.__store_and_forward__.buffer
+    assert isinstance(buffer, SegmentLogBuffer)
+    assert buffer.directory == os.path.join(str(tmp_path), "client%2F1")
+    assert buffer.size("key") == 1
@@ -1,11 +1,14 @@
+import asyncio
 import time
 
 from aleph_core.connections.testing.random_connection import RandomConnection
 from aleph_core.connections.testing.simple_connection import SimpleConnection
-from aleph_core.connections.connection import Connection
+from aleph_core.connections.connection import AsyncConnection, Connection
+from aleph_core.utils.async_helper import AsyncHelper
 from aleph_core.utils.exceptions import Exceptions
 from aleph_core.utils.exceptions import Error
 from aleph_core.utils.data import RecordSet
+from aleph_core.utils.scheduler import Scheduler
 
 
 class SomeConnection(Connection):
@@ -84,3 +87,67 @@ def test_subscribe_async():
 
 def test_write_async():
     pass
+
+
+def test_max_concurrent_reads():
+    """Test async reads of several keys run concurrently up to max_concurrent_reads"""
+
+    class SlowConnection(AsyncConnection):
+        max_concurrent_reads = 2
+
+        def __init__(self):
+            super().__init__()
+            self.running = 0
+            self.peak = 0
+
+        async def read(self, key, **kwargs):
+            self.running += 1
+            self.peak = max(self.peak, self.running)
+            await asyncio.sleep(0.01)
+            self.running -= 1
+            return [{"key": key}]
+
+    connection = SlowConnection()
+    results = asyncio.run(connection.safe_read_many(["a", "b", "c", "d"]))
+    assert [results[key][0]["key"] for key in "abcd"] == list("abcd")
+    assert connection.peak == 2
+    assert connection.running == 0
+
+
+def test_scheduled_reads_run_on_the_main_loop():
+    """Test scheduled async reads run on the main loop and share its read limit"""
+
+    class SlowConnection(AsyncConnection):
+        async_helper = AsyncHelper()
+        scheduler = Scheduler()
+        max_concurrent_reads = 1
+
+        def __init__(self):
+            super().__init__()
+            self.loops = set()
+            self.running = 0
+            self.peak = 0
+            self.received = []
+
+        async def read(self, key, **kwargs):
+            self.loops.add(asyncio.get_running_loop())
+            self.running += 1
+            self.peak = max(self.peak, self.running)
+            await asyncio.sleep(0.02)
+            self.running -= 1
+            return [{"t": 1, "key": key}]
+
+        def on_new_data(self, key, data):
+            self.received.append(key)
+
+    connection = SlowConnection()
+    for key in "abc":
+        connection.subscribe_async(key)
+    time.sleep(0.3)
+    for key in "abc":
+        connection.unsubscribe(key)
+
+    assert sorted(connection.received) == list("abc")
+    assert connection.loops == {connection.async_helper.main_loop}
+    assert connection.peak == 1
+    connection.async_helper.close()
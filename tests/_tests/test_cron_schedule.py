@@ -0,0 +1,23 @@
+from aleph_core.utils.cron_schedule import cron_schedule, CronSchedule
+
+
+def test_cron_schedule_is_shared():
+    """Test every subscriber of an expression gets the same schedule"""
+    assert cron_schedule("*/5 * * * *") is cron_schedule("*/5 * * * *")
+    assert cron_schedule("*/5 * * * *") is not cron_schedule("*/10 * * * *")
+
+
+def test_cron_schedule_next_after():
+    """Test the fire times are computed once and reused"""
+    schedule = CronSchedule("* * * * *", size=10)
+    t = 1_700_000_000
+    first = schedule.next_after(t)
+    assert first % 60 == 0 and 0 < first - t <= 60
+
+    computed = schedule.computed
+    for _ in range(1000):
+        assert schedule.next_after(t) == first
+    assert schedule.next_after(first) == first + 60
+    assert schedule.computed == computed
+
+    assert schedule.next_after(t + 3600) == first + 3600
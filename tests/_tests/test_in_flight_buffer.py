@@ -0,0 +1,58 @@
+import asyncio
+import time
+
+from threading import Timer
+from aleph_core.utils.in_flight_buffer import InFlightBuffer
+
+
+def test_in_flight_buffer_drops_when_full():
+    """Test records that do not fit are rejected and counted"""
+    in_flight = InFlightBuffer(max_records=10, policy="drop")
+
+    assert in_flight.acquire(8)
+    assert not in_flight.acquire(5)
+    in_flight.release(8)
+    assert in_flight.acquire(5)
+    assert in_flight.stats()["dropped"] == 5
+
+    in_flight = InFlightBuffer(max_records=10, policy="store_and_forward")
+    assert in_flight.acquire(20)
+    assert not in_flight.acquire(1)
+    assert in_flight.stats()["spilled"] == 1
+
+
+def test_in_flight_buffer_blocks_until_released():
+    """Test block waits until there is room for the records"""
+    in_flight = InFlightBuffer(max_records=10, policy="block")
+    in_flight.acquire(10)
+
+    start = time.time()
+    Timer(0.2, in_flight.release, args=(5,)).start()
+    assert in_flight.acquire(5)
+    assert time.time() - start >= 0.2
+
+
+def test_in_flight_buffer_delay_grows_with_fill():
+    """Test the subscription delay is 0 under half full and max_delay when full"""
+    in_flight = InFlightBuffer(max_records=100, max_delay=10)
+
+    in_flight.acquire(50)
+    assert in_flight.delay() == 0
+    in_flight.acquire(25)
+    assert in_flight.delay() == 5
+    in_flight.acquire(25)
+    assert in_flight.delay() == 10
+
+
+def test_in_flight_buffer_acquire_async_waits_on_the_loop():
+    """Test acquire_async waits for room while the event loop keeps running"""
+    in_flight = InFlightBuffer(max_records=10, policy="block")
+    in_flight.acquire(10)
+
+    async def main():
+        loop = asyncio.get_running_loop()
+        loop.call_later(0.1, in_flight.release, 5)
+        acquired = await in_flight.acquire_async(5)
+        return acquired, in_flight.stats()["in_flight"]
+
+    assert asyncio.run(main()) == (True, 10)
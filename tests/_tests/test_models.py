@@ -1,8 +1,11 @@
+import gc
 import pytest
+import weakref
 
 from typing import Optional
 from aleph_core import Model
 from aleph_core import Exceptions
+from aleph_core.models.registry import _models, model_info
 from enum import Enum
 
 
@@ -113,3 +116,73 @@ def test_model_can_validate_record():
 
     with pytest.raises(Exceptions.ModelValidationError):
         SomeModel.validate_subrecord({"float_": "unparseable"})
+
+
+def test_model_can_validate_many():
+    """Test a batch of records is validated like one model instance per record"""
+    records = [
+        {"id_": "1", "t": 1, "str_": 3, "int_": "9", "float_": 8, "bool_": 0, "enum_": "Value A"},
+        {"id_": "2", "t": 2, "str_": "x", "int_": 1, "float_": 1.5, "bool_": True},
+    ]
+    expected = [SomeModel(**record).dict() for record in records]
+    assert SomeModel.validate_many(records) == expected
+
+    with pytest.raises(Exceptions.ModelValidationError):
+        SomeModel.validate_many([records[0], {"str_": "x"}])
+
+    with pytest.raises(Exceptions.ModelValidationError):
+        SomeModel.validate_many([{"int_": "not an int"}], partial=True)
+
+    partial = SomeModel.validate_many([{"id_": "1", "t": 1, "int_": "2"}], partial=True)
+    assert partial[0]["int_"] == 2
+    assert partial[0]["str_"] is None
+
+
+def test_optional_model_is_not_inherited():
+    """Test subclasses get their own optional model and the parent fields stay required"""
+    class Parent(Model):
+        a: int
+
+    parent_optional = Parent.to_all_optionals_model()
+
+    class Child(Parent):
+        b: int
+
+    child_optional = Child.to_all_optionals_model()
+    assert child_optional is not parent_optional
+    assert "b" in child_optional.__fields__
+    assert child_optional(a=1).dict()["b"] is None
+    assert Parent.__fields__["a"].required
+    assert Parent.to_all_optionals_model() is parent_optional
+
+    with pytest.raises(Exception):
+        Parent()
+
+
+def test_model_info_is_lazy_and_weak():
+    """Test model metadata is built on first use and does not keep the model alive"""
+    class Dynamic(Model):
+        a: int
+
+    assert Dynamic not in _models
+    assert model_info(Dynamic).optional().dict()["a"] is None
+    assert Dynamic in _models
+
+    del Dynamic
+    gc.collect()
+    assert not any(model.__name__ == "Dynamic" for model in list(_models.keys()))
+
+
+def test_compact_class_does_not_keep_the_model_alive():
+    """Test the compact record class is kept on the model, not in a global registry"""
+    class Dynamic(Model):
+        a: int
+
+    record_class = Dynamic.compact_class()
+    assert Dynamic.compact_class() is record_class
+    assert record_class(a=1).dict() == {"a": 1}
+
+    model = weakref.ref(Dynamic)
+    del Dynamic, record_class
+    gc.collect()
+    assert model() is None
@@ -0,0 +1,10 @@
+from aleph_core.utils.rate_limiter import RateLimiter
+
+
+def test_rate_limiter():
+    """Test the burst is allowed at once and the rest waits for the rate"""
+    rate_limiter = RateLimiter(100, burst=50)
+
+    assert rate_limiter.reserve(50) == 0
+    assert 0.09 < rate_limiter.reserve(10) <= 0.1
+    assert 0.49 < rate_limiter.reserve(40) <= 0.5
@@ -138,3 +138,316 @@ def test_record_set_get_by_id_timestamp():
 
     assert record_set.get_by_id(r0["id_"]) != r1
     assert record_set.get_by_t(r0["t"]) != r1
+
+
+def test_columnar_record_set_keeps_records():
+    """Test a columnar record set returns the same records as a row record set"""
+    rows = RecordSet().update(Fixtures.records)
+    columns = RecordSet(columnar=True).update(Fixtures.records)
+
+    assert len(columns) == len(rows)
+    assert list(columns) == list(rows)
+    assert columns[0] == rows[0]
+    assert columns[-1] == rows[-1]
+    assert "b" not in columns[0]
+    assert columns.project() == rows.project()
+
+
+def test_columnar_record_set_with_model():
+    """Test a columnar record set stores the model fields in typed columns"""
+    record_set = RecordSet(SomeModel, columnar=True)
+    record_set = record_set.update([
+        {"id_": "1", "t": 1, "str_": "a", "int_": "2", "float_": 1.5},
+        {"id_": "2", "t": 2, "str_": "b", "int_": 3},
+    ])
+
+    assert record_set[0]["int_"] == 2
+    assert record_set[1]["float_"] is None
+    assert record_set._storage.columns["int_"].typecode == "q"
+    assert record_set._storage.columns["float_"].typecode == "d"
+
+
+def test_columnar_record_set_mixed_types():
+    """Test a column falls back to python objects when a value does not fit its type"""
+    record_set = RecordSet(columnar=True).update([
+        {"id_": "1", "t": 1, "x": 1},
+        {"id_": "1", "t": 2, "x": "one"},
+        {"id_": "1", "t": 3, "x": True},
+    ])
+
+    assert [record["x"] for record in record_set] == [1, "one", True]
+
+
+def test_record_set_merge_in_place():
+    """Test merge merges new records into the sorted set and replaces repeated (t, id_)"""
+    for columnar in [False, True]:
+        record_set = RecordSet(columnar=columnar)
+        record_set.merge([{"id_": "a", "t": 5, "x": 1}, {"id_": "a", "t": 1, "x": 2}])
+        record_set.merge({"id_": "b", "t": 3, "x": 3})
+        record_set.merge({"id_": "a", "t": 5, "x": 4})
+
+        assert [(r["t"], r["x"]) for r in record_set] == [(1, 2), (3, 3), (5, 4)]
+
+        record_set.merge([{"id_": str(i), "t": i, "x": i} for i in range(100)])
+        t = [record["t"] for record in record_set]
+        assert t == sorted(t)
+        assert len(record_set) == 103
+
+
+def test_record_set_update_returns_new_set():
+    """Test update leaves the record set as it was and returns an updated copy"""
+    record_set = RecordSet()
+    record_set.merge({"id_": "a", "t": 1, "x": 1})
+
+    updated = record_set.update([{"id_": "a", "t": 1, "x": 2}, {"id_": "a", "t": 0, "x": 0}])
+    assert [r["x"] for r in record_set] == [1]
+    assert [r["x"] for r in updated] == [0, 2]
+
+
+def test_record_set_successive_updates_share_storage():
+    """Test successive updates append to the same storage and leave earlier sets as they were"""
+    for columnar in [False, True]:
+        record_set = RecordSet(columnar=columnar)
+        storage = record_set._storage
+        for i in range(10000):
+            record_set = record_set.update({"id_": str(i % 100), "t": i, "x": i})
+        assert record_set._storage is storage
+        assert len(record_set) == 10000
+
+        # Replacing or inserting records copies the storage the earlier set still sees
+        updated = record_set.update([{"id_": "0", "t": 0, "x": -1}, {"id_": "a", "t": 5}])
+        assert updated._storage is not storage
+        assert len(updated) == 10001 and updated[0]["x"] == -1
+        assert len(record_set) == 10000 and record_set[0]["x"] == 0
+
+
+def test_record_set_merge_late_records():
+    """Test a batch of late records is merged after the existing records with the same t"""
+    for columnar in [False, True]:
+        record_set = RecordSet(columnar=columnar)
+        record_set.merge([{"id_": "a", "t": t, "x": 0} for t in range(0, 10, 2)])
+        record_set.merge([{"id_": "b", "t": t, "x": 1} for t in [8, 1, 4, 5]])
+
+        assert [(r["t"], r["id_"]) for r in record_set] == [
+            (0, "a"), (1, "b"), (2, "a"), (4, "a"), (4, "b"), (5, "b"), (6, "a"),
+            (8, "a"), (8, "b"),
+        ]
+        assert record_set.at_or_before(5)["id_"] == "b"
+
+
+def test_record_set_project():
+    """Test project merges the records of each id_ and can filter by t"""
+    record_set = RecordSet()
+    record_set.merge([
+        {"id_": "a", "t": 1, "x": 1, "y": 1},
+        {"id_": "b", "t": 2, "x": 2},
+        {"id_": "a", "t": 3, "x": 3},
+    ])
+    assert record_set.project() == [
+        {"id_": "a", "t": 3, "x": 3, "y": 1},
+        {"id_": "b", "t": 2, "x": 2},
+    ]
+
+    # An older record only fills the fields the newer records do not have
+    record_set.merge({"id_": "b", "t": 0, "x": 0, "y": 0})
+    assert record_set.project(since=2) == [
+        {"id_": "a", "t": 3, "x": 3, "y": 1},
+        {"id_": "b", "t": 2, "x": 2, "y": 0},
+    ]
+    assert record_set.project(since=3) == [{"id_": "a", "t": 3, "x": 3, "y": 1}]
+
+
+def test_record_set_projection_is_kept_by_copies(monkeypatch):
+    """Test copy and update keep the projection instead of rebuilding it"""
+    record_set = RecordSet()
+    record_set.merge([{"id_": "a", "t": 1, "x": 1}, {"id_": "b", "t": 2, "x": 2}])
+    record_set.project()
+
+    def rebuild():
+        raise AssertionError("projection rebuilt")
+
+    copy = record_set.copy()
+    updated = record_set.update({"id_": "a", "t": 3, "y": 3})
+    monkeypatch.setattr(copy, "_rebuild_projection", rebuild)
+    monkeypatch.setattr(updated, "_rebuild_projection", rebuild)
+
+    assert copy.project() == [{"id_": "a", "t": 1, "x": 1}, {"id_": "b", "t": 2, "x": 2}]
+    assert updated.project(since=3) == [{"id_": "a", "t": 3, "x": 1, "y": 3}]
+
+
+def test_record_set_time_slicing():
+    """Test between, at_or_before and latest return the right records"""
+    for columnar in [False, True]:
+        record_set = RecordSet(columnar=columnar)
+        record_set.merge([{"id_": "a", "t": t, "x": t} for t in range(0, 100, 10)])
+
+        window = record_set.between(20, 50)
+        assert [r["t"] for r in window] == [20, 30, 40]
+        assert [r["t"] for r in window.between(since=35)] == [40]
+        assert [r["t"] for r in record_set.latest(2)] == [80, 90]
+
+        assert record_set.at_or_before(25)["x"] == 20
+        assert record_set.at_or_before(20)["x"] == 20
+        assert record_set.at_or_before(-1) is None
+
+
+def test_record_set_views_share_storage():
+    """Test slices share storage with the parent set and detach when modified"""
+    record_set = RecordSet(columnar=True)
+    record_set.merge([{"id_": "a", "t": t} for t in range(10)])
+
+    window = record_set.between(2, 5)
+    assert window._storage.storage is record_set._storage
+
+    # Inserting in the parent does not change the existing view
+    record_set.merge({"id_": "b", "t": 3})
+    assert [r["t"] for r in window] == [2, 3, 4]
+    assert [r["t"] for r in record_set.between(2, 5)] == [2, 3, 3, 4]
+
+    # Updating the view does not change the parent
+    window.merge({"id_": "c", "t": 4})
+    assert len(window) == 4
+    assert len(record_set) == 11
+
+
+def test_record_set_setitem_after_rebuild():
+    """Test records can be set on updated sets, replaced records and views"""
+    record_set = RecordSet()
+    record_set.merge([{"id_": "a", "t": t, "x": t} for t in range(3)])
+
+    updated = record_set.update({"id_": "a", "t": 3, "x": 3})
+    updated[0] = {"id_": "a", "t": 0, "x": -1}
+    assert updated[0]["x"] == -1 and record_set[0]["x"] == 0
+
+    window = record_set.between(1, 3)
+    window[0] = {"id_": "a", "t": 1, "x": -1}
+    assert window[0]["x"] == -1 and record_set[1]["x"] == 1
+
+    record_set.records = [{"id_": "a", "t": 0, "x": 0}]
+    record_set[0] = {"id_": "a", "t": 0, "x": 5}
+    assert record_set.project() == [{"id_": "a", "t": 0, "x": 5}]
+
+
+def test_record_set_resample():
+    """Test resample aggregates the records of each id_ in time buckets"""
+    record_set = RecordSet(columnar=True)
+    record_set.merge([
+        {"id_": "a", "t": 0, "x": 1.0, "y": 1},
+        {"id_": "a", "t": 500, "x": 3.0, "y": 5},
+        {"id_": "b", "t": 700, "x": 10.0},
+        {"id_": "a", "t": 1200, "x": None, "y": 2},
+    ])
+
+    resampled = record_set.resample(1000, {"x": "mean", "y": "max"})
+    assert resampled.model == record_set.model
+    assert resampled.records == [
+        {"id_": "a", "t": 0, "x": 2.0, "y": 5.0},
+        {"id_": "b", "t": 0, "x": 10.0, "y": None},
+        {"id_": "a", "t": 1000, "x": None, "y": 2.0},
+    ]
+
+    with pytest.raises(Exceptions.InvalidArgs):
+        record_set.resample(1000, {"x": "median"})
+
+
+def test_record_set_rolling():
+    """Test rolling aggregates each record with the previous ones in the window"""
+    record_set = RecordSet()
+    record_set.merge([{"id_": "a", "t": t * 1000, "x": t} for t in range(5)])
+
+    rolled = record_set.rolling(2000, {"x": "sum"})
+    assert [r["x"] for r in rolled] == [0, 1, 3, 5, 7]
+
+
+def test_record_set_to_numpy():
+    """Test to_numpy returns typed arrays that share memory with a columnar set"""
+    np = pytest.importorskip("numpy")
+    record_set = RecordSet(SomeModel, columnar=True)
+    record_set.merge([
+        {"id_": "a", "t": 1, "str_": "x", "int_": 1, "float_": 1.5},
+        {"id_": "b", "t": 2, "str_": "y", "int_": 2},
+    ])
+
+    arrays = record_set.to_numpy()
+    assert arrays["t"].tolist() == [1, 2]
+    assert arrays["id_"].tolist() == ["a", "b"]
+    assert arrays["int_"].dtype == np.int64
+    assert arrays["float_"].dtype == np.float64
+    assert arrays["float_"].mask.tolist() == [False, True]
+
+    values, mask = record_set.buffers("float_")
+    assert np.shares_memory(arrays["float_"].data, np.asarray(values))
+
+    with pytest.raises(Exceptions.InvalidArgs):
+        record_set.buffers("str_")
+
+
+def test_record_set_arrow_round_trip():
+    """Test a record set can be exported to arrow and imported back"""
+    pytest.importorskip("pyarrow")
+    for columnar in [False, True]:
+        record_set = RecordSet(columnar=columnar)
+        record_set.merge([
+            {"id_": "a", "t": 1, "x": 1.5, "y": True, "z": "one"},
+            {"id_": "b", "t": 2, "x": None, "y": False, "z": "two"},
+        ])
+
+        table = record_set.to_arrow()
+        assert table.column_names == ["t", "id_", "x", "y", "z"]
+
+        imported = RecordSet.from_arrow(table, columnar=columnar)
+        assert list(imported) == list(record_set)
+
+
+def test_record_set_merge_after_export():
+    """Test a columnar set can change while its exports are alive, which keep their values"""
+    pytest.importorskip("pyarrow")
+    record_set = RecordSet(SomeModel, columnar=True)
+    record_set.merge([{"id_": "a", "t": t, "int_": t, "float_": 0.5} for t in range(1, 4)])
+
+    arrays = record_set.to_numpy()
+    table = record_set.to_arrow()
+    values, mask = record_set.buffers("int_")
+
+    record_set.merge([{"id_": "a", "t": 5, "int_": 5}, {"id_": "a", "t": 2, "int_": 9}])
+    record_set.merge({"id_": "b", "t": 0, "float_": 1.5})
+    record_set[1] = {"id_": "a", "t": 1, "int_": -1}
+
+    assert [r.get("int_") for r in record_set] == [None, -1, 9, 3, 5]
+    assert arrays["int_"].tolist() == [1, 2, 3]
+    assert table.column("int_").to_pylist() == [1, 2, 3]
+    assert values.tolist() == [1, 2, 3] and len(mask) == 3
+
+
+def test_record_set_adopt():
+    """Test adopted records are sorted and completed in place, without copying them"""
+    records = [{"t": 2, "id_": "a", "x": 1}, {"t": 1, "x": "not validated"}]
+    record_set = RecordSet.adopt(records, model=SomeModel)
+
+    assert len(record_set) == 2
+    assert record_set.records is records
+    assert records[0] == {"t": 1, "x": "not validated", "id_": None}
+    assert record_set[1] is records[1]
+
+    record_set = RecordSet.adopt({"x": 1})
+    assert record_set[0]["t"] is not None
+
+
+def test_compact_record_set():
+    """Test a compact record set stores slotted records that read like dicts"""
+    record_set = RecordSet(SomeModel, compact=True)
+    record_set.merge([{"t": 2, "id_": "a", "int_": 1}, {"t": 1, "id_": "a", "float_": 1.5}])
+
+    record = record_set[0]
+    assert isinstance(record, SomeModel.compact_class())
+    assert not hasattr(record, "__dict__")
+    assert record.float_ == 1.5 and record["t"] == 1
+    assert record.dict() == {"id_": "a", "t": 1, "str_": None, "int_": None, "float_": 1.5}
+    assert record_set.project()[0]["int_"] == 1
+
+    record = SomeModel.compact_class()({"t": 1, "int_": 2})
+    assert "str_" not in record and record.get("str_") is None
+    assert dict(record) == {"t": 1, "int_": 2}
+
+    with pytest.raises(Exceptions.InvalidArgs):
+        RecordSet(compact=True)
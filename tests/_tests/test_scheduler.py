@@ -0,0 +1,53 @@
+import pytest
+import time
+
+from aleph_core.utils.scheduler import Job, Scheduler
+
+
+def test_scheduler_runs_jobs_every_time_step():
+    """Test every job runs on its first step and then every time step"""
+    scheduler = Scheduler()
+    runs = {"a": [], "b": []}
+
+    job_a = scheduler.add(0.1, lambda: runs["a"].append(time.time()))
+    scheduler.add(0.25, lambda: runs["b"].append(time.time()))
+    time.sleep(0.55)
+
+    assert 5 <= len(runs["a"]) <= 7
+    assert len(runs["b"]) == 3
+    assert len(scheduler) == 2
+
+    scheduler.remove(job_a)
+    count = len(runs["a"])
+    time.sleep(0.2)
+    assert len(runs["a"]) <= count + 1
+    assert len(scheduler) == 1
+
+
+class FakeClock:
+    """Replaces the time module of the scheduler, so sleeping only moves the clock"""
+
+    def __init__(self, now: float):
+        self.now = now
+
+    def time(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float):
+        self.now += seconds
+
+
+def test_scheduler_delays_next_run(monkeypatch):
+    """Test the delay returned by a job is added on top of its time step"""
+    clock = FakeClock(1000.0)
+    monkeypatch.setattr("aleph_core.utils.scheduler.time", clock)
+    scheduler = Scheduler()
+    pushed = []
+    monkeypatch.setattr(scheduler, "_push", lambda t, job: pushed.append(t))
+
+    scheduler._run(Job(0.05, lambda: 0.2, ()), clock.time())
+    assert pushed == pytest.approx([1000.25])
+
+    # A run longer than the time step is delayed from its end
+    scheduler._run(Job(0.05, lambda: clock.sleep(0.1) or 0.2, ()), clock.time())
+    assert pushed[1] == pytest.approx(1000.3)
@@ -0,0 +1,139 @@
+import os
+
+from aleph_core.utils.segment_log import FRAME_HEADER, SegmentLogBuffer
+
+
+def test_segment_log_append_and_ack(tmp_path):
+    """Test records are read in order and segments are deleted once flushed"""
+    buffer = SegmentLogBuffer(str(tmp_path), segment_records=2, block_records=1)
+    for i in range(5):
+        buffer.append("key", [{"a": i}])
+
+    assert buffer.keys() == ["key"]
+    assert buffer.size("key") == 5
+    assert buffer.read("key", limit=2) == [{"a": 0}, {"a": 1}]
+    assert len(buffer.segments["key"]) == 3
+
+    buffer.ack("key", 3)
+    assert buffer.read("key") == [{"a": 3}, {"a": 4}]
+    assert len(buffer.segments["key"]) == 2
+
+    buffer.ack("key", 2)
+    assert buffer.keys() == []
+    assert buffer.read("key") == []
+
+
+def test_segment_log_replay(tmp_path):
+    """Test the pending records are recovered after reopening, without a torn frame"""
+    buffer = SegmentLogBuffer(str(tmp_path), block_records=1)
+    buffer.append("a/b", [{"a": 1}, {"a": 2}])
+    buffer.append("a/b", [{"a": 3}])
+    buffer.ack("a/b", 1)
+
+    # A crash in the middle of an append leaves an incomplete frame
+    with open(buffer.segments["a/b"][-1].path, "ab") as f:
+        f.write(b"\x10\x00\x00\x00\x01")
+
+    buffer = SegmentLogBuffer(str(tmp_path))
+    assert buffer.keys() == ["a/b"]
+    assert buffer.read("a/b") == [{"a": 2}, {"a": 3}]
+
+    buffer.append("a/b", [{"a": 4}])
+    assert buffer.read("a/b") == [{"a": 2}, {"a": 3}, {"a": 4}]
+    assert os.path.isdir(os.path.join(str(tmp_path), "a%2Fb"))
+
+
+def test_segment_log_replace(tmp_path):
+    """Test replace rewrites the pending records and survives a crash before it ends"""
+    buffer = SegmentLogBuffer(str(tmp_path), segment_records=2, block_records=1)
+    buffer.append("key", [{"a": 1}, {"a": 2}, {"a": 3}])
+    buffer.append("key", [{"a": 4}])
+
+    last = buffer.segments["key"][-1].path
+    with open(last, "rb") as f:
+        last_content = f.read()
+
+    buffer.replace("key", 3, [{"a": 0}])
+    assert buffer.read("key") == [{"a": 0}, {"a": 4}]
+    assert [segment.offset for segment in buffer.segments["key"]] == [2, 3]
+    assert buffer.nbytes("key") == sum(os.path.getsize(s.path) for s in buffer.segments["key"])
+    with open(last, "rb") as f:
+        assert f.read() == last_content
+
+    # A replacement that did not move the checkpoint is discarded
+    path = os.path.join(str(tmp_path), "key", f"{1000:020d}.log.tmp")
+    with open(path, "wb") as f:
+        f.write(b"")
+    buffer = SegmentLogBuffer(str(tmp_path))
+    assert buffer.read("key") == [{"a": 0}, {"a": 4}]
+    assert not os.path.exists(path)
+
+
+def test_segment_log_recovers_without_checkpoint(tmp_path):
+    """Test a lost checkpoint starts at the first segment that was not deleted"""
+    buffer = SegmentLogBuffer(str(tmp_path), segment_records=2, fsync=False, block_records=1)
+    for i in range(5):
+        buffer.append("key", [{"a": i}])
+    buffer.ack("key", 3)
+    os.remove(os.path.join(str(tmp_path), "key", SegmentLogBuffer.CHECKPOINT))
+
+    buffer = SegmentLogBuffer(str(tmp_path), segment_records=2, block_records=1)
+    assert buffer.flushed["key"] == 2
+    assert buffer.read("key") == [{"a": 2}, {"a": 3}, {"a": 4}]
+
+
+def test_segment_log_replace_in_a_segment(tmp_path):
+    """Test replace keeps the rest of the segment where the replaced records end"""
+    buffer = SegmentLogBuffer(str(tmp_path), segment_records=4, block_records=1)
+    buffer.append("key", [{"a": i} for i in range(4)])
+    buffer.append("key", [{"a": i} for i in range(4, 6)])
+
+    buffer.replace("key", 2, [{"a": -1}])
+    assert buffer.read("key") == [{"a": -1}, {"a": 2}, {"a": 3}, {"a": 4}, {"a": 5}]
+    assert [segment.offset for segment in buffer.segments["key"]] == [1, 4]
+    assert SegmentLogBuffer(str(tmp_path)).read("key") == buffer.read("key")
+
+
+def test_segment_log_completes_a_committed_replace(tmp_path):
+    """Test a replacement whose checkpoint was written is completed after a crash"""
+    buffer = SegmentLogBuffer(str(tmp_path), segment_records=2, block_records=1)
+    buffer.append("key", [{"a": 1}, {"a": 2}])
+    buffer.append("key", [{"a": 3}])
+
+    # A crash after the checkpoint of a replacement of the first 2 records by {"a": 0}
+    directory = os.path.join(str(tmp_path), "key")
+    with open(os.path.join(directory, f"{1:020d}.log.tmp"), "wb") as f:
+        payload = buffer.encode([{"a": 0}])
+        f.write(FRAME_HEADER.pack(len(payload), 1) + payload)
+    with open(os.path.join(directory, SegmentLogBuffer.CHECKPOINT), "w") as f:
+        f.write("1 2")
+
+    buffer = SegmentLogBuffer(str(tmp_path))
+    assert buffer.read("key") == [{"a": 0}, {"a": 3}]
+    assert sorted(os.listdir(directory)) == [f"{1:020d}.log", f"{2:020d}.log", "checkpoint"]
+
+
+def test_segment_log_gathers_small_appends(tmp_path):
+    """Test small appends are kept in an open block until it has block_records records"""
+    buffer = SegmentLogBuffer(str(tmp_path), block_records=4)
+    for i in range(3):
+        buffer.append("key", [{"a": i}])
+    block = buffer.segments["key"][-1]
+    assert block.path.endswith(SegmentLogBuffer.OPEN_BLOCK)
+    assert block.frames == [(3, block.size)]
+    with open(block.path, "rb") as f:
+        block_content = f.read()
+
+    buffer.ack("key", 1)
+    for i in range(3, 6):
+        buffer.append("key", [{"a": i}])
+    assert [len(segment.frames) for segment in buffer.segments["key"]] == [1, 1]
+    assert buffer.segments["key"][0].count == 4
+    assert buffer.read("key") == [{"a": i} for i in range(1, 6)]
+
+    # A crash after the block was appended to its segment leaves the block file
+    with open(block.path, "wb") as f:
+        f.write(block_content)
+    buffer = SegmentLogBuffer(str(tmp_path), block_records=4)
+    assert buffer.read("key") == [{"a": i} for i in range(1, 6)]
+    assert not os.path.exists(block.path)
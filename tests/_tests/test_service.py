@@ -0,0 +1,52 @@
+import asyncio
+import time
+
+from aleph_core.connections.connection import AsyncConnection, Connection
+from aleph_core.services._service import Service
+
+
+class CountingConnection(Connection):
+    multi_thread = False
+    time_step = 0.01
+
+    def __init__(self):
+        super().__init__()
+        self.count = 0
+
+    def read(self, key, **kwargs):
+        self.count += 1
+        return [{"i": self.count}]
+
+
+class SlowLinkConnection(AsyncConnection):
+    def __init__(self):
+        super().__init__()
+        self.written = []
+
+    async def write(self, key, data):
+        await asyncio.sleep(0.02)
+        self.written.extend(record["i"] for record in data)
+
+
+def test_service_blocks_main_reads_without_blocking_the_loop():
+    """Test the block policy waits for an async link that shares the event loop"""
+
+    class BlockingService(Service):
+        main_connection = CountingConnection()
+        link_connection = SlowLinkConnection()
+        main_connection_subscribe_keys = ["key"]
+        max_in_flight_records = 2
+        overflow_policy = "block"
+        max_subscription_delay = 0
+
+    service = BlockingService()
+    service.load()
+    deadline = time.time() + 5
+    while len(service.link_connection.written) < 20 and time.time() < deadline:
+        time.sleep(0.05)
+    service.main_connection.unsubscribe("key")
+
+    written = service.link_connection.written
+    assert len(written) >= 20
+    assert written == sorted(written)
+    assert service.in_flight.stats()["peak"] <= 2
@@ -1,8 +1,16 @@
+import asyncio
 import pytest
+import threading
 
+from aleph_core.utils.batch_encoding import CompactEncoding
 from aleph_core.utils.data import RecordSet
-from aleph_core.utils.store_and_forward import StoreAndForward
-from aleph_core.utils.local_storage import LocalStorage
+from aleph_core.utils.store_and_forward import LocalStorageBuffer, StoreAndForward
+from aleph_core.utils.exceptions import Exceptions
+from aleph_core.utils.local_storage import JsonLocalStorage, LocalStorage
+from aleph_core.utils.rate_limiter import RateLimiter
+from aleph_core.utils.retention import Retention
+from aleph_core.utils.segment_log import SegmentLogBuffer
+from aleph_core.utils.time import current_timestamp
 
 
 class StoreAndForwardTestHelper:
@@ -75,3 +83,264 @@ def test_store_and_forward_flush_all():
 
     errors = helper.store_and_forward.flush_all()
     assert len(errors) == 0
+
+
+def test_store_and_forward_chunks():
+    """Test the buffer is written in chunks and a failure only keeps the rest"""
+    written = []
+
+    def write(key, data):
+        if len(written) == 2:
+            written.append(None)
+            raise RuntimeError("Could not write")
+        written.append(list(data))
+
+    store_and_forward = StoreAndForward("", write, max_records_per_write=2)
+    store_and_forward.add("key", [{"a": i} for i in range(5)])
+
+    errors = store_and_forward.flush_all()
+    assert len(errors) == 1
+    assert errors[0].args["pending"] == 1
+    assert written[:2] == [[{"a": 0}, {"a": 1}], [{"a": 2}, {"a": 3}]]
+
+    assert store_and_forward.flush_all() == []
+    assert written[3] == [{"a": 4}]
+
+
+def test_store_and_forward_concurrent_flush():
+    """Test flush_all_async flushes keys at once, in order within each key"""
+    running, max_running, written = [0], [0], {}
+
+    async def write(key, data):
+        running[0] += 1
+        max_running[0] = max(max_running[0], running[0])
+        await asyncio.sleep(0.01)
+        running[0] -= 1
+        if key == "bad":
+            raise RuntimeError("Could not write")
+        written[key] = written.get(key, []) + list(data)
+
+    store_and_forward = StoreAndForward(
+        "", write, max_records_per_write=1, max_concurrent_flushes=2
+    )
+    for key in ["a", "b", "c", "bad"]:
+        store_and_forward.add(key, [{"a": 1}, {"a": 2}])
+
+    errors = asyncio.run(store_and_forward.flush_all_async())
+    assert max_running[0] == 2
+    assert written["a"] == written["b"] == written["c"] == [{"a": 1}, {"a": 2}]
+    assert len(errors) == 1
+    assert errors[0].args == {"key": "bad", "flushed": 0, "pending": 2}
+
+
+def test_store_and_forward_concurrent_sync_flush():
+    """Test sync writes of different keys run in parallel in flush_all and flush_all_async"""
+    for flush_all in ["flush_all", "flush_all_async"]:
+        barrier, written = threading.Barrier(4, timeout=2), {}
+
+        def write(key, data):
+            barrier.wait()
+            written[key] = list(data)
+
+        store_and_forward = StoreAndForward("", write, max_concurrent_flushes=4)
+        for key in "abcd":
+            store_and_forward.add(key, [{"a": 1}])
+
+        errors = getattr(store_and_forward, flush_all)()
+        if flush_all == "flush_all_async":
+            errors = asyncio.run(errors)
+        assert errors == []
+        assert sorted(written) == list("abcd")
+
+
+def test_store_and_forward_retention():
+    """Test the eviction policies keep the buffer within the limits"""
+    records = [{"t": i, "a": i} for i in range(10)]
+
+    store_and_forward = StoreAndForward("", None, retention=Retention(max_records=4))
+    store_and_forward.add("key", records)
+    assert store_and_forward.buffer.read("key") == records[6:]
+    assert store_and_forward.evicted == {"key": 6}
+
+    retention = Retention(max_records=4, policy="drop_newest")
+    store_and_forward = StoreAndForward("", None, retention=retention)
+    store_and_forward.add("key", records)
+    assert store_and_forward.buffer.read("key") == records[:4]
+
+    retention = Retention(max_records=8, policy="downsample")
+    store_and_forward = StoreAndForward("", None, retention=retention)
+    store_and_forward.add("key", records)
+    assert [r["t"] for r in store_and_forward.buffer.read("key")] == [0, 2, 4, 5, 6, 7, 8, 9]
+
+    retention = Retention(max_total_records=6)
+    store_and_forward = StoreAndForward("", None, retention=retention)
+    store_and_forward.add("a", records[:4])
+    store_and_forward.add("b", records[:3])
+    assert store_and_forward.evicted == {"a": 1}
+
+
+def test_store_and_forward_max_age():
+    """Test records older than max_age are evicted"""
+    now = current_timestamp()
+    store_and_forward = StoreAndForward("", None, retention=Retention(max_age=60))
+    store_and_forward.add("key", [{"t": now - 120000}, {"t": now - 61000}, {"t": now}])
+    assert store_and_forward.buffer.read("key") == [{"t": now}]
+    assert store_and_forward.evicted == {"key": 2}
+
+
+def test_store_and_forward_encoding():
+    """Test an encoded buffer is flushed in chunks like the default one"""
+    written = []
+
+    def write(key, data):
+        written.append(list(data))
+
+    store_and_forward = StoreAndForward(
+        "", write, max_records_per_write=3, encoding=CompactEncoding()
+    )
+    store_and_forward.add("key", [{"t": i} for i in range(2)])
+    store_and_forward.add("key", [{"t": i} for i in range(2, 5)])
+    assert store_and_forward.buffer.size("key") == 5
+
+    assert store_and_forward.flush_all() == []
+    assert written == [[{"t": 0}, {"t": 1}, {"t": 2}], [{"t": 3}, {"t": 4}]]
+    assert store_and_forward.buffer.keys() == []
+
+
+def test_store_and_forward_flushes_a_key_once_at_a_time():
+    """Test concurrent flushes of a key write every record once"""
+    written, started, release = [], threading.Event(), threading.Event()
+
+    def write(key, data):
+        started.set()
+        release.wait(1)
+        written.extend(record["a"] for record in data)
+
+    store_and_forward = StoreAndForward("", write, max_records_per_write=2)
+    store_and_forward.add("key", [{"t": i, "a": i} for i in range(5)])
+
+    threads = [threading.Thread(target=store_and_forward.flush_all) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    started.wait(1)
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert written == [0, 1, 2, 3, 4]
+
+    async def async_write(key, data):
+        await asyncio.sleep(0.01)
+        written.extend(record["a"] for record in data)
+
+    written.clear()
+    store_and_forward = StoreAndForward("", async_write, max_records_per_write=2)
+    store_and_forward.add("key", [{"t": i, "a": i} for i in range(5)])
+
+    async def flush_twice():
+        await asyncio.gather(
+            store_and_forward.flush_all_async(), store_and_forward.flush_all_async()
+        )
+
+    asyncio.run(flush_twice())
+    assert written == [0, 1, 2, 3, 4]
+
+
+def test_store_and_forward_rate_limit_does_not_block_the_loop():
+    """Test flush_all_async waits for the rate limit on the loop with a sync write"""
+    written = []
+
+    def write(key, data):
+        written.append(len(data))
+
+    store_and_forward = StoreAndForward("", write, max_records_per_write=1)
+    store_and_forward.add("key", [{"t": i, "a": i} for i in range(4)])
+    record_bytes = store_and_forward.buffer.nbytes("key") / 4
+    store_and_forward.rate_limiter = RateLimiter(record_bytes * 20, burst=record_bytes)
+
+    async def main():
+        ticks = 0
+        flush = asyncio.ensure_future(store_and_forward.flush_all_async())
+        while not flush.done():
+            await asyncio.sleep(0.01)
+            ticks += 1
+        return flush.result(), ticks
+
+    errors, ticks = asyncio.run(main())
+    assert errors == []
+    assert len(written) == 4
+    assert ticks >= 5
+
+
+def test_store_and_forward_keeps_running_totals():
+    """Test the retention only reads the size of the key that changed"""
+    sizes = []
+
+    class CountingBuffer(LocalStorageBuffer):
+        def size(self, key):
+            sizes.append(key)
+            return super().size(key)
+
+    retention = Retention(max_total_records=100, max_total_bytes=10**6)
+    buffer = CountingBuffer(LocalStorage(), "counting")
+    store_and_forward = StoreAndForward("", None, buffer=buffer, retention=retention)
+    for i in range(10):
+        store_and_forward.add(f"key{i}", [{"t": 1, "a": i}])
+
+    sizes.clear()
+    store_and_forward.add("key0", [{"t": 2, "a": 0}])
+    assert sizes == ["key0"]
+    assert store_and_forward._totals()[0] == 11
+
+
+def test_store_and_forward_encoded_byte_limits(tmp_path):
+    """Test byte limits are measured like the encoded buffer, which needs bytes storage"""
+    retention = Retention(max_bytes=400, policy="drop_newest")
+    encoding = CompactEncoding("zlib")
+    store_and_forward = StoreAndForward("", None, retention=retention, encoding=encoding)
+    for j in range(20):
+        store_and_forward.add("key", [{"t": j * 10 + i, "value": j + i / 7} for i in range(10)])
+
+    assert 0 < store_and_forward.buffer.nbytes("key") <= 400
+    assert store_and_forward.buffer.size("key") + store_and_forward.evicted["key"] == 200
+
+    json_storage = JsonLocalStorage(str(tmp_path / "storage.json"))
+    with pytest.raises(Exceptions.InvalidArgs):
+        StoreAndForward("", None, json_storage, encoding=encoding)
+
+
+def test_store_and_forward_segment_log_byte_limits(tmp_path):
+    """Test byte limits only count the records of a segment log that are not flushed"""
+    for retention in [Retention(max_bytes=1000), Retention(max_total_bytes=1000)]:
+        buffer = SegmentLogBuffer(str(tmp_path / str(id(retention))), fsync=False)
+        store_and_forward = StoreAndForward("", None, buffer=buffer, retention=retention)
+        sizes = []
+        for i in range(400):
+            store_and_forward.add("key", [{"t": i, "a": i}])
+            sizes.append(buffer.size("key"))
+            assert buffer.nbytes("key") <= 1000
+
+        # Only the records over the limit are evicted, not the whole key
+        full = sizes.index(max(sizes))
+        assert min(sizes[full:]) > max(sizes) // 2
+        assert buffer.size("key") + store_and_forward.evicted["key"] == 400
+
+
+def test_store_and_forward_compresses_single_record_appends(tmp_path):
+    """Test single records are encoded in blocks, so they compress like a batch"""
+    records = [
+        {"t": 1700000000000 + i * 1000, "id_": "plc", "value": i / 2, "status": "ok"}
+        for i in range(1000)
+    ]
+    pickled = StoreAndForward("", None).buffer.nbytes_of(records)
+
+    encoding = CompactEncoding("zlib")
+    buffers = [
+        StoreAndForward("", None, LocalStorage(), encoding=encoding).buffer,
+        SegmentLogBuffer(str(tmp_path), encoding=encoding, fsync=False),
+    ]
+    for buffer in buffers:
+        for record in records:
+            buffer.append("key", [record])
+        assert buffer.size("key") == 1000
+        assert buffer.read("key") == records
+        assert buffer.nbytes("key") * 5 < pickled
@@ -1,7 +1,7 @@
 import pytest
 import time
 
-from aleph_core.utils.wait_one_step import WaitOneStep
+from aleph_core.utils.wait_one_step import WaitOneStep, spread_offset
 
 
 def test_wait_one_step():
@@ -38,3 +38,47 @@ def test_wait_one_step_changing_time():
     # Fourth step
     wait_one_step.wait()
     assert round(time.time() - t) == 4
+
+
+class FakeClock:
+    """Replaces the time module of wait_one_step, so sleeping only moves the clock"""
+
+    def __init__(self, now: float):
+        self.now = now
+
+    def time(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float):
+        self.now += seconds
+
+
+def test_wait_one_step_aligned(monkeypatch):
+    """Test aligned waits end on the multiples of the time step, despite the work between them"""
+    clock = FakeClock(1000.03)
+    monkeypatch.setattr("aleph_core.utils.wait_one_step.time", clock)
+    wait_one_step = WaitOneStep(0.2, aligned=True)
+    wait_one_step.wait()
+
+    deadlines = []
+    for _ in range(3):
+        clock.sleep(0.05)
+        wait_one_step.wait()
+        deadlines.append(clock.now)
+    assert deadlines == pytest.approx([1000.2, 1000.4, 1000.6])
+
+
+def test_wait_one_step_spread(monkeypatch):
+    """Test the spread offset is the same for a key and within the time step"""
+    assert spread_offset("key", 10) == spread_offset("key", 10)
+    offsets = {spread_offset(f"key{i}", 10) for i in range(100)}
+    assert len(offsets) > 50
+    assert all(0 <= offset < 10 for offset in offsets)
+
+    clock = FakeClock(1000.03)
+    monkeypatch.setattr("aleph_core.utils.wait_one_step.time", clock)
+    wait_one_step = WaitOneStep(0.2, aligned=True, spread_key="key")
+    wait_one_step.wait()
+    wait_one_step.wait()
+    phase = (clock.now - spread_offset("key", 0.2)) % 0.2
+    assert min(phase, 0.2 - phase) == pytest.approx(0, abs=1e-6)
@@ -0,0 +1,51 @@
+import pytest
+import time
+
+from threading import Event, Timer
+from aleph_core.utils.worker_pool import WorkerPool
+from aleph_core.utils.exceptions import Exceptions
+
+
+def test_worker_pool_runs_functions():
+    """Test the pool runs every call and returns its result"""
+    worker_pool = WorkerPool(max_workers=2)
+    futures = [worker_pool.submit(lambda x: x * 2, i) for i in range(10)]
+
+    assert [future.result(timeout=1) for future in futures] == [i * 2 for i in range(10)]
+    assert worker_pool.stats()["completed"] == 10
+
+
+def test_worker_pool_queue_policies():
+    """Test drop_oldest and raise when the queue is full"""
+    release = Event()
+
+    worker_pool = WorkerPool(max_workers=1, max_queue=2, policy="drop_oldest")
+    worker_pool.submit(release.wait)
+    futures = [worker_pool.submit(lambda i=i: i) for i in range(3)]
+    assert futures[0].cancelled()
+    assert worker_pool.stats()["saturated"]
+    assert worker_pool.stats()["dropped"] == 1
+    release.set()
+    assert [future.result(timeout=1) for future in futures[1:]] == [1, 2]
+
+    release.clear()
+    worker_pool = WorkerPool(max_workers=1, max_queue=1, policy="raise")
+    worker_pool.submit(release.wait)
+    worker_pool.submit(time.time)
+    with pytest.raises(Exceptions.QueueFull):
+        worker_pool.submit(time.time)
+    assert worker_pool.stats()["rejected"] == 1
+    release.set()
+
+
+def test_worker_pool_blocks_when_full():
+    """Test block waits until a queued call starts"""
+    release = Event()
+    worker_pool = WorkerPool(max_workers=1, max_queue=1, policy="block")
+    worker_pool.submit(release.wait)
+    worker_pool.submit(time.time)
+
+    start = time.time()
+    Timer(0.2, release.set).start()
+    worker_pool.submit(time.time).result(timeout=1)
+    assert time.time() - start >= 0.2
@@ -0,0 +1,27 @@
+from aleph_core.utils.write_queue import WriteQueue
+
+
+def test_write_queue_returns_full_batches():
+    """Test records are coalesced into batches of max_batch_records"""
+    write_queue = WriteQueue(3)
+
+    batches, batch_id = write_queue.add("key", [{"a": 1}, {"a": 2}])
+    assert batches == [] and batch_id is not None
+    assert write_queue.add("key", [{"a": 3}]) == ([[{"a": 1}, {"a": 2}, {"a": 3}]], None)
+
+    batches, _ = write_queue.add("key", [{"a": i} for i in range(7)])
+    assert [len(batch) for batch in batches] == [3, 3]
+    assert len(write_queue) == 1
+
+
+def test_write_queue_take_by_batch_id():
+    """Test an outdated batch id does not take the records of a newer batch"""
+    write_queue = WriteQueue(2)
+
+    _, first_id = write_queue.add("key", [{"a": 1}])
+    _, second_id = write_queue.add("key", [{"a": 2}, {"a": 3}])
+    assert second_id is not None and second_id != first_id
+
+    assert write_queue.take("key", first_id) == []
+    assert write_queue.take("key", second_id) == [{"a": 3}]
+    assert write_queue.keys() == []
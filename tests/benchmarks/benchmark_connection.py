@@ -0,0 +1,45 @@
+"""
+Benchmarks for Connection. Run with:
+python -m tests.benchmarks.benchmark_connection
+"""
+import asyncio
+import time
+
+from aleph.connections.testing.simple_connection import SimpleConnection
+from aleph.utils.async_helper import AsyncHelper
+
+
+class NullConnection(SimpleConnection):
+    def write(self, key: str = "", data=None):
+        return
+
+
+def benchmark_safe_write(n: int, write) -> float:
+    """Returns the seconds per call of write(key, record)"""
+    t0 = time.perf_counter()
+    for i in range(n):
+        write("key", {"t": i, "value": float(i)})
+    return (time.perf_counter() - t0) / n
+
+
+def main():
+    connection = NullConnection()
+    connection.open()
+    async_helper = AsyncHelper()
+
+    writes = {
+        "asyncio.run per write (before)": lambda k, d: asyncio.run(connection._safe_write(k, d)),
+        "persistent loop": lambda k, d: async_helper.run(connection._safe_write(k, d)),
+        "safe_write on the calling thread": connection.safe_write,
+    }
+    print("Connection.safe_write overhead")
+    for name, write in writes.items():
+        seconds = benchmark_safe_write(5000, write)
+        print(f"  {name:<34} per write={seconds * 1e6:8.2f} us")
+
+    async_helper.close()
+    connection.close()
+
+
+if __name__ == "__main__":
+    main()
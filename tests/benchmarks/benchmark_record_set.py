@@ -0,0 +1,29 @@
+"""
+Benchmarks for RecordSet. Run with:
+python -m tests.benchmarks.benchmark_record_set
+"""
+import time
+
+from aleph.models.record_set import RecordSet
+
+
+def benchmark_successive_updates(n: int, columnar: bool = False) -> float:
+    """Returns the seconds it takes to add n records to a record set, one update at a time"""
+    record_set = RecordSet(columnar=columnar)
+    t0 = time.perf_counter()
+    for i in range(n):
+        record_set = record_set.update({"id_": str(i % 100), "t": i, "value": float(i)})
+    return time.perf_counter() - t0
+
+
+def main():
+    for columnar in [False, True]:
+        print(f"Successive single-record updates (columnar={columnar})")
+        for n in [1000, 2000, 5000, 10000]:
+            seconds = benchmark_successive_updates(n, columnar)
+            per_update = seconds / n * 1e6
+            print(f"  n={n:>6}  total={seconds * 1000:8.1f} ms  per update={per_update:6.2f} us")
+
+
+if __name__ == "__main__":
+    main()